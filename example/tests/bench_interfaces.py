@@ -0,0 +1,124 @@
+# This Source Code Form is subject to the terms of the Mozilla
+# Public License, v. 2.0. If a copy of the MPL was not distributed
+# with this file, You can obtain one at https://mozilla.org/MPL/2.0/.
+# Notice: The scope granted to MPL excludes the ASIC industry.
+#
+# Copyright (c) 2017 DUKELEC, All rights reserved.
+#
+# Author: Duke Fong <d@d-l.io>
+#
+
+# Host interface benchmark, not part of the regression (not named test_*),
+# one run per interface wrapper:
+#   for w in cdctl_spi_wrapper cdctl_qspi_wrapper cdctl_i2c_wrapper; do
+#       ./test_all.sh --sim verilator --wrapper $w bench_interfaces.py; done
+#
+# The workload is the usual one of pycdbus.cdctl, one frame at a time: send()
+# (a poll of INT_FLAG_L, then the REG_DAT burst), the frame loops back to the
+# node itself, the host waits for int_n, reads the status (INT_FLAG_L, RX_LEN,
+# INT_FLAG_H) and the frame. Measured per payload length:
+#   frames/s    frames of the workload per second
+#   occupancy   share of the time the host bus is busy (transfers and gaps)
+#   bytes       host bus bytes per frame
+#
+# Environment variables (comma separated lists):
+#   BENCH_PAYLOAD    user data length 0 ~ 253
+#   BENCH_FRAMES     frames per payload length
+#   BENCH_SCLK       sck of SPI / QSPI in Hz
+#   BENCH_I2C_MODE   standard, fast, fast_plus
+#
+# The rows are added to ../interfaces.csv (sim_out/ of the suite), the table
+# printed at the end compares every interface measured so far.
+
+import os, csv
+from pathlib import Path
+from common import *
+from cocotb.simtime import get_sim_time
+from pycdbus.cdctl import Cdctl, Spi, Qspi, I2c
+from pycdbus.sim.host import SpiHost, QspiHost, I2cHost, SimIrq
+
+CLK_FREQ = 40000000
+CLK_PERIOD = round(1000000000000 / CLK_FREQ)
+
+OUTPUT = Path('..') / 'interfaces.csv'
+KEYS = ['interface', 'clock', 'payload', 'frames', 'fps', 'occupancy', 'bytes', 'host_rate']
+
+
+def env_list(name, default, conv=int):
+    return [conv(v) for v in os.environ.get(name, default).split(',') if v]
+
+
+def hosts(dut):
+    """[(interface, clock, host, cdctl)] of the wrapper."""
+    ret = []
+    if 'i2c' in dut._name:
+        dut.addr_sel.value = 0
+        for mode in env_list('BENCH_I2C_MODE', 'fast_plus', str):
+            host = I2cHost(dut, mode, CLK_PERIOD)
+            ret.append(('i2c', mode, host, Cdctl(I2c(host))))
+    else:
+        for sclk in env_list('BENCH_SCLK', '32000000', float):
+            if 'qspi' in dut._name:
+                host = QspiHost(dut, sclk, CLK_PERIOD)
+                ret.append(('qspi', f'{sclk / 1000000:g}MHz', host, Cdctl(Qspi(host))))
+            else:
+                host = SpiHost(dut, sclk, CLK_PERIOD)
+                ret.append(('spi', f'{sclk / 1000000:g}MHz', host, Cdctl(Spi(host))))
+    return ret
+
+
+async def measure(dut, host, cdctl, irq, payload_len, count):
+    rx_buf = FrameBuf()
+    host.reset_stat()
+    t0 = get_sim_time('ps')
+    for i in range(count):
+        frame = bytes([0x01, 0x00, payload_len]) + payload(payload_len, i)
+        if not await cdctl.send(frame, tries=1000):
+            dut._log.error('bench: no free tx page')
+            await exit_err()
+        await irq.wait()
+        flag, rx_len = await cdctl.status()
+        ret = await cdctl.read_rx(rx_len, rx_buf)
+        if ret != frame:
+            dut._log.error(f'bench: frame mismatch: {ret.hex()}')
+            await exit_err()
+    elapsed = get_sim_time('ps') - t0
+    bytes_ = host.stat['tx'] + host.stat['rx'] + host.stat['dummy']
+    return {'payload': payload_len, 'frames': count, 'fps': round(count * 1000000000000 / elapsed, 1),
+            'occupancy': round(host.stat['time'] / elapsed, 4), 'bytes': round(bytes_ / count, 1),
+            'host_rate': round(host.rate())}
+
+
+@cocotb.test()
+async def bench_interfaces(dut):
+    cocotb.start_soon(Clock(dut.clk, CLK_PERIOD).start())
+    await Timer(500000) # wait reset
+    irq = SimIrq(dut.int_n)
+    count = int(os.environ.get('BENCH_FRAMES', 4))
+
+    rows = []
+    for interface, clock, host, cdctl in hosts(dut):
+        await cdctl.check_version()
+        await cdctl.setup(0x00, int_mask=BIT_FLAG_RX_PENDING)
+        await cdctl.set_div(39, 3)
+        await Timer(20, unit='us') # bus idle after the new baud rate
+        for payload_len in env_list('BENCH_PAYLOAD', '8,64,253'):
+            r = await measure(dut, host, cdctl, irq, payload_len, count)
+            rows.append(dict(r, interface=interface, clock=clock))
+
+    old = []
+    if OUTPUT.exists():
+        with open(OUTPUT) as f:
+            measured = {(r['interface'], r['clock']) for r in rows}
+            old = [r for r in csv.DictReader(f) if (r['interface'], r['clock']) not in measured]
+    with open(OUTPUT, 'w', newline='') as f:
+        w = csv.DictWriter(f, KEYS)
+        w.writeheader()
+        w.writerows(old + rows)
+
+    dut._log.info(f"{'interface':<10} {'clock':<10} {'len':>4} {'frames/s':>10} {'occupancy':>10} "
+                  f"{'bytes':>7} {'host kB/s':>10}")
+    for r in sorted(old + rows, key=lambda r: (int(r['payload']), -float(r['fps']))):
+        dut._log.info(f"{r['interface']:<10} {r['clock']:<10} {int(r['payload']):4} {float(r['fps']):10.1f} "
+                      f"{float(r['occupancy']):10.1%} {float(r['bytes']):7.1f} {float(r['host_rate']) / 1000:10.1f}")
+    await exit_ok()
@@ -0,0 +1,63 @@
+/*
+ * This Source Code Form is subject to the terms of the Mozilla
+ * Public License, v. 2.0. If a copy of the MPL was not distributed
+ * with this file, You can obtain one at https://mozilla.org/MPL/2.0/.
+ * Notice: The scope granted to MPL excludes the ASIC industry.
+ *
+ * Copyright (c) 2017 DUKELEC, All rights reserved.
+ *
+ * Author: Duke Fong <d@d-l.io>
+ */
+
+`timescale 1 ns / 1 ps
+
+module cdctl_i2c_wrapper(
+        input       clk,
+
+        input       [1:0] addr_sel,
+        input       scl,
+        input       sda_low,    // the host pulls sda low
+        output      sda,        // line level, pulled up
+
+        output      int_n,      // open drain, pulled up
+
+        output      bus_a,      // bus level, high when released
+        input       ext_tx,     // external node driven by the testbench
+        input       ext_tx_en
+    );
+
+tri1 tx; // released output is seen as recessive
+tri1 int_n_od;
+assign int_n = int_n_od;
+tri0 tx_en;
+tri0 ext_en = ext_tx_en;
+
+// open-drain sda: the host and the slave only pull it low
+tri1 sda_od;
+assign sda_od = sda_low ? 1'b0 : 1'bz;
+assign sda = sda_od;
+
+// 2-state open-drain bus, 0 is dominant when drivers disagree
+assign bus_a = (tx_en ? tx : 1'b1) & (ext_en ? ext_tx : 1'b1);
+wire rx = tx_en ? tx : bus_a;
+
+cdctl_i2c cdctl_i2c_m(
+          .clk_i(clk),
+          
+          .addr_sel(addr_sel),
+          
+          .sda(sda_od),
+          .scl(scl),
+          
+          .int_n(int_n_od),
+          
+          .rx(rx),
+          .tx(tx),
+          .tx_en(tx_en)
+      );
+
+`ifdef CD_DUMP
+cd_dump cd_dump_m(.clk(clk));
+`endif
+
+endmodule
@@ -14,19 +14,31 @@
 module cdctl_qspi_wrapper(
         input       clk,
 
-        inout [3:0] sdio,
+        output [3:0] sdio,      // line levels, z when released
+        input  [3:0] sdio_drv,  // driven by the testbench (host side)
+        input       sdio_drv_en,
         input       sck,
         input       nss,
 
-        output      int_n,
+        output      int_n,      // open drain, pulled up
 
-        inout       bus_a
+        output      bus_a,      // bus level, high when released
+        input       ext_tx,     // external node driven by the testbench
+        input       ext_tx_en
     );
 
-wire tx;
-wire tx_en;
-wire rx = tx_en ? tx : (bus_a !== 0);
-assign bus_a = tx_en ? tx : 1'bz;
+tri1 tx; // released output is seen as recessive
+tri1 int_n_od;
+assign int_n = int_n_od;
+tri0 tx_en;
+tri0 ext_en = ext_tx_en;
+
+// 2-state open-drain bus, 0 is dominant when drivers disagree
+assign bus_a = (tx_en ? tx : 1'b1) & (ext_en ? ext_tx : 1'b1);
+wire rx = tx_en ? tx : bus_a;
+
+tri0 sdio_en = sdio_drv_en;
+assign sdio = sdio_en ? sdio_drv : 4'bz;
 
 cdctl_qspi cdctl_qspi_m(
           .clk_i(clk),
@@ -35,16 +47,15 @@ cdctl_qspi cdctl_qspi_m(
           .sck(sck),
           .nss(nss),
           
-          .int_n(int_n),
+          .int_n(int_n_od),
           
           .rx(rx),
           .tx(tx),
           .tx_en(tx_en)
       );
 
-initial begin
-    $dumpfile("cdctl.vcd");
-    $dumpvars();
-end
+`ifdef CD_DUMP
+cd_dump cd_dump_m(.clk(clk));
+`endif
 
 endmodule
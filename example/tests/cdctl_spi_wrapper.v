@@ -19,15 +19,22 @@ module cdctl_spi_wrapper(
         input       sck,
         input       nss,
 
-        output      int_n,
+        output      int_n,      // open drain, pulled up
 
-        inout       bus_a
+        output      bus_a,      // bus level, high when released
+        input       ext_tx,     // external node driven by the testbench
+        input       ext_tx_en
     );
 
-wire tx;
-wire tx_en;
-wire rx = tx_en ? tx : (bus_a !== 0);
-assign bus_a = tx_en ? tx : 1'bz;
+tri1 tx; // released output is seen as recessive
+tri1 int_n_od;
+assign int_n = int_n_od;
+tri0 tx_en;
+tri0 ext_en = ext_tx_en;
+
+// 2-state open-drain bus, 0 is dominant when drivers disagree
+assign bus_a = (tx_en ? tx : 1'b1) & (ext_en ? ext_tx : 1'b1);
+wire rx = tx_en ? tx : bus_a;
 
 cdctl_spi cdctl_spi_m(
           .clk_i(clk),
@@ -37,16 +44,15 @@ cdctl_spi cdctl_spi_m(
           .sck(sck),
           .nss(nss),
           
-          .int_n(int_n),
+          .int_n(int_n_od),
           
           .rx(rx),
           .tx(tx),
           .tx_en(tx_en)
       );
 
-initial begin
-    $dumpfile("cdctl.vcd");
-    $dumpvars();
-end
+`ifdef CD_DUMP
+cd_dump cd_dump_m(.clk(clk));
+`endif
 
 endmodule
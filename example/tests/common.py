@@ -12,87 +12,157 @@ import cocotb
 from cocotb.types import Logic, LogicArray
 from cocotb.triggers import RisingEdge, ReadOnly, Timer
 from cocotb.clock import Clock
-
-# pip3 install pythoncrc
-from PyCRC.CRC16 import CRC16
-
-def modbus_crc(data):
-    return CRC16(modbus_flag=True).calculate(data).to_bytes(2, byteorder='little')
-
-
-DFT_VERSION         = 0x0f
-
-REG_VERSION         = 0x00
-REG_SETTING         = 0x02
-REG_IDLE_WAIT_LEN   = 0x04
-REG_TX_PERMIT_LEN_L = 0x05
-REG_TX_PERMIT_LEN_H = 0x06
-REG_MAX_IDLE_LEN_L  = 0x07
-REG_MAX_IDLE_LEN_H  = 0x08
-REG_TX_PRE_LEN      = 0x09
-REG_FILTER          = 0x0b
-REG_DIV_LS_L        = 0x0c
-REG_DIV_LS_H        = 0x0d
-REG_DIV_HS_L        = 0x0e
-REG_DIV_HS_H        = 0x0f
-REG_INT_MASK_L      = 0x10
-REG_INT_MASK_H      = 0x11
-REG_INT_FLAG_L      = 0x12
-REG_INT_FLAG_H      = 0x13
-REG_RX_LEN          = 0x14
-REG_DAT             = 0x15
-REG_CTRL            = 0x16
-REG_FILTER_M0       = 0x1a
-REG_FILTER_M1       = 0x1b
-REG_FILTER_MSK0     = 0x1c
-REG_FILTER_MSK1     = 0x1d
-
-BIT_SETTING_RX_INVERT       = 1 << 6
-BIT_SETTING_NO_DROP         = 1 << 3
-BIT_SETTING_USER_CRC        = 1 << 2
-BIT_SETTING_TX_INVERT       = 1 << 1
-BIT_SETTING_TX_PUSH_PULL    = 1 << 0
-
-BIT_FLAG_TX_ERROR           = 1 << 7
-BIT_FLAG_TX_CD              = 1 << 6
-BIT_FLAG_TX_BUF_CLEAN       = 1 << 5
-BIT_FLAG_TX_BUF_FREE        = 1 << 4
-BIT_FLAG_RX_ERROR           = 1 << 3
-BIT_FLAG_RX_LOST            = 1 << 2
-BIT_FLAG_RX_BREAK           = 1 << 1
-BIT_FLAG_RX_PENDING         = 1 << 0
-
-BIT_RX_RST                  = 1 << 7
-BIT_RX_CLR_PENDING          = 1 << 4
-BIT_TX_ABORT                = 1 << 3
-BIT_TX_DROP                 = 1 << 2
-BIT_TX_SEND_BREAK           = 1 << 1
-BIT_TX_START                = 1 << 0
-
-
-async def _send_bytes(dut, bytes_, sys_clk, factor, is_z=True):
-    clk_period = 1000000000000 / sys_clk
-    await Timer(1000)
-    factor += 1
-    for byte in bytes_:
-        dut.bus_a.value = 0
-        await Timer(factor * clk_period)
-        for i in range(0, 8):
-            if byte & 0x01 == 0:
-                dut.bus_a.value = 0
-            else:
-                dut.bus_a.value = Logic('z') if is_z else 1
-            await Timer(factor * clk_period)
-            byte = byte >> 1
-        dut.bus_a.value = Logic('z') if is_z else 1
-        await Timer(factor * clk_period)
-        dut.bus_a.value = Logic('z')
-
-# Pass in a frame of data from the outside of the dut.
-async def send_frame(dut, bytes_, sys_clk, factor_l, factor_h):
-    await _send_bytes(dut, bytes_[0:1], sys_clk, factor_l)
-    await _send_bytes(dut, bytes_[1:], sys_clk, factor_h, False)
-    await _send_bytes(dut, modbus_crc(bytes_), sys_clk, factor_h, False)
+from pycdbus.sim.bus import send_frame, send_frames
+from pycdbus.regs import *
+from pycdbus.crc import modbus_crc
+from pycdbus.framebuf import FrameBuf, payload
+
+
+# Frames through pycdbus.cdctl on a wrapper, cdctl: the driver over the host
+# of the wrapper interface. Frames to itself (src 0x01, dst: its filter 0x00)
+# and from the external node, one by one and many pending. The tx frames are
+# also given as a FrameBuf and a memoryview, the rx frames are read into one
+# FrameBuf.
+async def cdctl_driver_test(dut, cdctl, clk_freq):
+    rx_buf = FrameBuf()
+
+    async def recv(tries=2000):
+        for _ in range(tries):
+            frame = await cdctl.recv(rx_buf)
+            if frame is not None:
+                return frame
+        dut._log.error('cdctl: no rx frame')
+        await exit_err()
+
+    async def read_16(reg_l, reg_h):
+        return await cdctl.read_reg(reg_h) << 8 | await cdctl.read_reg(reg_l)
+
+    await cdctl.check_version()
+    await cdctl.setup(0x00) # 115200 bps, the divs have a high byte
+    value = round(cdctl.sys_clk / 115200) - 1
+    for reg_l, reg_h in ((REG_DIV_LS_L, REG_DIV_LS_H), (REG_DIV_HS_L, REG_DIV_HS_H)):
+        ret = await read_16(reg_l, reg_h)
+        if ret != value:
+            dut._log.error(f'cdctl: div 0x{ret:04x}, expected 0x{value:04x}')
+            await exit_err()
+    await cdctl.set_tx_permit_len(300)
+    await cdctl.set_max_idle_len(0x2c5)
+    if await read_16(REG_TX_PERMIT_LEN_L, REG_TX_PERMIT_LEN_H) != 300 or \
+            await read_16(REG_MAX_IDLE_LEN_L, REG_MAX_IDLE_LEN_H) != 0x2c5:
+        dut._log.error('cdctl: 10 bits lengths not written')
+        await exit_err()
+    await cdctl.set_tx_permit_len(0x14)
+    await cdctl.set_div(39, 3)
+
+    if await cdctl.recv() is not None:
+        dut._log.error('cdctl: rx frame before any tx')
+        await exit_err()
+
+    # the zero-copy buffers go out as they are
+    tx_buf = FrameBuf()
+    for frame in (tx_buf.set(bytes([0x01, 0x00, 3, 0xa5, 0xff, 0x5a])), memoryview(b'\x01\x00\x01\x3c')):
+        if not await cdctl.send(frame, tries=100):
+            dut._log.error('cdctl: no free tx page')
+            await exit_err()
+        ret = await recv()
+        if ret != bytes(frame):
+            dut._log.error(f'cdctl: {type(frame).__name__} loopback mismatch: {ret.hex()}')
+            await exit_err()
+
+    for len_ in (0, 1, 16, 253):
+        frame = bytes([0x01, 0x00, len_]) + bytes((i * 7) & 0xff for i in range(len_))
+        if not await cdctl.send(frame, tries=100):
+            dut._log.error('cdctl: no free tx page')
+            await exit_err()
+        ret = await recv()
+        dut._log.info(f'cdctl: loopback {len_:3} bytes: {ret[:8].hex()}')
+        if ret != frame:
+            dut._log.error(f'cdctl: loopback mismatch: {ret.hex()}')
+            await exit_err()
+
+    frames = [bytes([0x05, 0x00, 2, i, 0xcd]) for i in range(3)]
+    await send_frames(dut, frames, clk_freq, 39, 3)
+    await Timer(20, unit='us') # the last frame ends after some idle bits
+    flag, rx_len = await cdctl.status()
+    dut._log.info(f'cdctl: int_flag: {flag:04x}, rx_len: {rx_len}')
+    if (flag >> 8) & 0x3f != 3 or not flag & BIT_FLAG_RX_PENDING or rx_len != 2:
+        dut._log.error('cdctl: expected 3 rx pages pending')
+        await exit_err()
+    for frame in frames:
+        ret = await cdctl.recv(rx_buf)
+        if ret != frame:
+            dut._log.error(f"cdctl: ext frame mismatch: {ret.hex() if ret else None}")
+            await exit_err()
+    flag, _ = await cdctl.status()
+    if flag & 0x3fff != BIT_FLAG_TX_BUF_CLEAN | BIT_FLAG_TX_BUF_FREE:
+        dut._log.error(f'cdctl: wrong int_flag: {flag:04x}')
+        await exit_err()
+
+
+# Host side bytes/s of the REG_DAT bursts through pycdbus.cdctl, host: the
+# SpiHost / QspiHost under cdctl. Each frame is one burst written (the TX page
+# is submitted at its end), the RX page found by the status read of INT_FLAG_L,
+# RX_LEN and INT_FLAG_H, and one burst read (the page is released at its end).
+async def cdctl_throughput_test(dut, cdctl, host, count=4):
+    await cdctl.check_version()
+    await cdctl.setup(0x00)
+    await cdctl.set_div(39, 3)
+    rx_buf = FrameBuf()
+    stat = {'tx': [0, 0], 'rx': [0, 0], 'all': [0, 0]} # bytes, ps
+
+    def take(key):
+        stat[key][0] += host.stat['tx'] + host.stat['rx']
+        stat[key][1] += host.stat['time']
+        host.reset_stat()
+
+    for i in range(count):
+        frame = bytes([0x01, 0x00, 253]) + payload(253, i)
+        host.reset_stat()
+        await cdctl.write_tx(frame)
+        take('tx')
+        for _ in range(2000):
+            flag, rx_len = await cdctl.status()
+            if flag & BIT_FLAG_RX_PENDING:
+                break
+        take('all')
+        ret = await cdctl.read_rx(rx_len, rx_buf)
+        take('rx')
+        if ret != frame:
+            dut._log.error(f'cdctl: frame {i} mismatch: {ret.hex()}')
+            await exit_err()
+
+    ideal = host.ideal_rate()
+    for key in ('tx', 'rx'):
+        stat['all'][0] += stat[key][0]
+        stat['all'][1] += stat[key][1]
+    rates = {key: bytes_ * 1000000000000 / time for key, (bytes_, time) in stat.items()}
+    dut._log.info(f'sck {host.freq / 1000000:g} MHz, ideal {ideal / 1000000:.3f} MB/s')
+    for key, name in (('tx', 'REG_DAT write'), ('rx', 'REG_DAT read'), ('all', 'with status polls')):
+        dut._log.info(f'{name:18} {rates[key] / 1000000:.3f} MB/s ({rates[key] / ideal:.1%})')
+    if rates['tx'] < ideal * 0.9 or rates['rx'] < ideal * 0.9:
+        dut._log.error('cdctl: bursts slower than 90% of the sck')
+        await exit_err()
+
+
+# The sck rising edges of one transfer of host (SpiHost / QspiHost) must be
+# SCK_PER_BYTE per byte of the tx, dummy and rx bytes, no more: an extra edge
+# is one more csr_read of the slave.
+async def check_sck_edges(dut, host, tx, rx_len=0, dummy=0):
+    edges = 0
+
+    async def count():
+        nonlocal edges
+        while True:
+            await RisingEdge(dut.sck)
+            edges += 1
+
+    task = cocotb.start_soon(count())
+    await host.transfer(tx, rx_len, dummy)
+    task.cancel()
+    expected = host.SCK_PER_BYTE * (len(tx) + dummy + rx_len)
+    if edges != expected:
+        dut._log.error(f'sck: {edges} rising edges, expected {expected}')
+        await exit_err()
 
 
 async def exit_err():
@@ -0,0 +1,82 @@
+# This Source Code Form is subject to the terms of the Mozilla
+# Public License, v. 2.0. If a copy of the MPL was not distributed
+# with this file, You can obtain one at https://mozilla.org/MPL/2.0/.
+# Notice: The scope granted to MPL excludes the ASIC industry.
+#
+# Copyright (c) 2017 DUKELEC, All rights reserved.
+#
+# Author: Duke Fong <d@d-l.io>
+#
+
+# Register access of cdctl_i2c in each mode of the I2C BFM: the device
+# address of addr_sel, a loopback frame through REG_DAT, no ack from an other
+# address.
+
+import errno
+from common import *
+from pycdbus.cdctl import I2c
+from pycdbus.sim.host import I2cHost, I2C_MODES
+
+CLK_FREQ = 40000000
+CLK_PERIOD = round(1000000000000 / CLK_FREQ)
+
+ADDR_SEL = 0b10
+
+
+async def loopback(dut, i2c, data):
+    await i2c.write(REG_DAT, bytes([0x01, 0x00, len(data)]) + data)
+    for _ in range(100):
+        int_flag, rx_len = await i2c.read(REG_INT_FLAG_L, 2)
+        if int_flag & BIT_FLAG_RX_PENDING:
+            break
+    ret = await i2c.read(REG_DAT, rx_len + 3)
+    dut._log.info(f'int_flag: {int_flag:02x}, rx_len: {rx_len}, rx: {ret.hex()}')
+    if ret != bytes([0x01, 0x00, len(data)]) + data:
+        dut._log.error('i2c: loopback mismatch')
+        await exit_err()
+    int_flag = (await i2c.read(REG_INT_FLAG_L))[0]
+    if int_flag != BIT_FLAG_TX_BUF_CLEAN | BIT_FLAG_TX_BUF_FREE:
+        dut._log.error(f'i2c: wrong int_flag: {int_flag:02x}')
+        await exit_err()
+
+
+@cocotb.test(timeout_time=30000, timeout_unit='us')
+async def test_cdctl_i2c(dut):
+    dut._log.info('test_cdctl_i2c start.')
+    dut.addr_sel.value = ADDR_SEL
+    cocotb.start_soon(Clock(dut.clk, CLK_PERIOD).start())
+    await Timer(500000) # wait reset
+
+    for mode in I2C_MODES:
+        host = I2cHost(dut, mode, CLK_PERIOD)
+        i2c = I2c(host, ADDR_SEL)
+        value = (await i2c.read(REG_VERSION))[0]
+        dut._log.info(f'{mode}: REG_VERSION: 0x{value:02x}')
+        if value != DFT_VERSION:
+            dut._log.error('i2c: version mismatch')
+            await exit_err()
+
+        await i2c.write(REG_SETTING, [0b00010001])
+        for reg, val in ((REG_DIV_LS_L, 39), (REG_DIV_LS_H, 0), (REG_DIV_HS_L, 3), (REG_DIV_HS_H, 0)):
+            await i2c.write(reg, [val])
+            if (await i2c.read(reg))[0] != val:
+                dut._log.error(f'i2c: wrong value of reg 0x{reg:02x}')
+                await exit_err()
+        await i2c.write(REG_FILTER, [0x00])
+
+        await loopback(dut, i2c, bytes([0xcd]))
+        await loopback(dut, i2c, payload(16))
+        dut._log.info(f'{mode}: {host.stat}, {host.rate() / 1000:.1f} kB/s')
+
+        try:
+            await I2c(host, ADDR_SEL ^ 1).read(REG_VERSION)
+        except OSError as e:
+            dut._log.info(f'{mode}: an other address: {e}')
+            if e.errno != errno.ENXIO:
+                await exit_err()
+        else:
+            dut._log.error('i2c: ack from an other address')
+            await exit_err()
+
+    dut._log.info('test_cdctl_i2c done.')
+    await exit_ok()
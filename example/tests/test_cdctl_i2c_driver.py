@@ -0,0 +1,32 @@
+# This Source Code Form is subject to the terms of the Mozilla
+# Public License, v. 2.0. If a copy of the MPL was not distributed
+# with this file, You can obtain one at https://mozilla.org/MPL/2.0/.
+# Notice: The scope granted to MPL excludes the ASIC industry.
+#
+# Copyright (c) 2017 DUKELEC, All rights reserved.
+#
+# Author: Duke Fong <d@d-l.io>
+#
+
+# The host driver pycdbus.cdctl over I2C (pycdbus.sim.host.I2cHost, fast-mode plus).
+
+from common import *
+from pycdbus.cdctl import Cdctl, I2c
+from pycdbus.sim.host import I2cHost
+
+CLK_FREQ = 40000000
+CLK_PERIOD = round(1000000000000 / CLK_FREQ)
+
+
+@cocotb.test(timeout_time=30000, timeout_unit='us')
+async def test_cdctl_i2c_driver(dut):
+    dut._log.info('test_cdctl_i2c_driver start.')
+    dut.addr_sel.value = 0
+    host = I2cHost(dut, 'fast_plus', CLK_PERIOD)
+    cocotb.start_soon(Clock(dut.clk, CLK_PERIOD).start())
+    await Timer(500000) # wait reset
+
+    await cdctl_driver_test(dut, Cdctl(I2c(host)), CLK_FREQ)
+
+    dut._log.info('test_cdctl_i2c_driver done.')
+    await exit_ok()
@@ -0,0 +1,33 @@
+# This Source Code Form is subject to the terms of the Mozilla
+# Public License, v. 2.0. If a copy of the MPL was not distributed
+# with this file, You can obtain one at https://mozilla.org/MPL/2.0/.
+# Notice: The scope granted to MPL excludes the ASIC industry.
+#
+# Copyright (c) 2017 DUKELEC, All rights reserved.
+#
+# Author: Duke Fong <d@d-l.io>
+#
+
+# Host side bytes/s of the QSPI bursts, CDCTL_SCLK: the sck frequency in Hz.
+
+import os
+from common import *
+from pycdbus.cdctl import Cdctl, Qspi
+from pycdbus.sim.host import QspiHost
+
+CLK_FREQ = 40000000
+CLK_PERIOD = round(1000000000000 / CLK_FREQ)
+SCLK = float(os.environ.get('CDCTL_SCLK', 32000000))
+
+
+@cocotb.test(timeout_time=5000, timeout_unit='us')
+async def test_cdctl_qspi_throughput(dut):
+    dut._log.info('test_cdctl_qspi_throughput start.')
+    host = QspiHost(dut, SCLK, CLK_PERIOD)
+    cocotb.start_soon(Clock(dut.clk, CLK_PERIOD).start())
+    await Timer(500000) # wait reset
+
+    await cdctl_throughput_test(dut, Cdctl(Qspi(host)), host)
+
+    dut._log.info('test_cdctl_qspi_throughput done.')
+    await exit_ok()
@@ -0,0 +1,94 @@
+# This Source Code Form is subject to the terms of the Mozilla
+# Public License, v. 2.0. If a copy of the MPL was not distributed
+# with this file, You can obtain one at https://mozilla.org/MPL/2.0/.
+# Notice: The scope granted to MPL excludes the ASIC industry.
+#
+# Copyright (c) 2017 DUKELEC, All rights reserved.
+#
+# Author: Duke Fong <d@d-l.io>
+#
+
+# pycdbus.cdctl.RxEngine over SPI, woken up by int_n: frames piled up in the
+# rx pages come out in one wakeup, then frames arriving one by one, then 64
+# piled frames taking all the index entries (INT_FLAG[13:8] wraps to 0). The
+# frames are FrameBuf of one pool, checked in place and released.
+
+from common import *
+from cocotb.triggers import with_timeout
+from pycdbus.cdctl import Cdctl, Spi, RxEngine
+from pycdbus.framebuf import FramePool
+from pycdbus.sim.host import SpiHost, SimIrq
+
+CLK_FREQ = 40000000
+CLK_PERIOD = round(1000000000000 / CLK_FREQ)
+
+
+async def collect(rx, expected):
+    """The number of frames matching expected, in order."""
+    match = 0
+    for ref in expected:
+        frame = await anext(rx)
+        match += frame == ref
+        frame.release()
+    return match
+
+
+@cocotb.test(timeout_time=6000, timeout_unit='us')
+async def test_cdctl_rx_engine(dut):
+    dut._log.info('test_cdctl_rx_engine start.')
+    host = SpiHost(dut, 32000000, CLK_PERIOD)
+    cocotb.start_soon(Clock(dut.clk, CLK_PERIOD).start())
+    await Timer(500000) # wait reset
+
+    cdctl = Cdctl(Spi(host))
+    await cdctl.check_version()
+    await cdctl.setup(0x00)
+    await cdctl.set_div(39, 3)
+    pool = FramePool(4)
+    rx = RxEngine(cdctl, SimIrq(dut.int_n), pool=pool)
+    await rx.start()
+    await Timer(20, unit='us') # bus idle after the new baud rate
+
+    piled = [bytes([0x05, 0x00, 3, i, i, i]) for i in range(4)]
+    await send_frames(dut, piled, CLK_FREQ, 39, 3)
+    await Timer(20, unit='us') # the last frame ends after some idle bits
+    match = await with_timeout(collect(rx, piled), 100, 'us')
+    dut._log.info(f'rx engine: {rx.stat}')
+    if match != len(piled) or rx.stat['wakeups'] != 1 or rx.stat['max_drain'] != len(piled):
+        dut._log.error('rx engine: piled frames not drained in one wakeup')
+        await exit_err()
+
+    stream = [bytes([0x06, 0x00, i * 10]) + bytes(range(i * 10)) for i in range(6)]
+    task = cocotb.start_soon(collect(rx, stream))
+    await send_frames(dut, stream, CLK_FREQ, 39, 3, idle=30)
+    match = await with_timeout(task, 200, 'us')
+    dut._log.info(f'rx engine: {rx.stat}, pool: {pool.allocated} buffers')
+    if match != len(stream) or rx.stat['rx_lost'] or rx.stat['rx_error'] or pool.allocated != 4:
+        dut._log.error('rx engine: stream mismatch')
+        await exit_err()
+
+    flag, _ = await cdctl.status()
+    if flag & 0x3f00 or str(dut.int_n.value) == '0':
+        dut._log.error(f'rx engine: pages left: {flag:04x}')
+        await exit_err()
+
+    full = [bytes([0x05, 0x00, 1, i]) for i in range(64)] # one fragment each
+    await send_frames(dut, full, CLK_FREQ, 39, 3)
+    await Timer(20, unit='us')
+    flag, _ = await cdctl.status()
+    if flag & 0x3f00 or not flag & BIT_FLAG_RX_PENDING:
+        dut._log.error(f'rx engine: expected 64 pages, int_flag: {flag:04x}')
+        await exit_err()
+    wakeups = rx.stat['wakeups']
+    match = await with_timeout(collect(rx, full), 1000, 'us')
+    dut._log.info(f'rx engine: {rx.stat}')
+    if match != len(full) or rx.stat['wakeups'] != wakeups + 1 or rx.stat['max_drain'] != len(full) \
+            or rx.stat['rx_lost']:
+        dut._log.error('rx engine: 64 piled frames not drained in one wakeup')
+        await exit_err()
+    if str(dut.int_n.value) == '0':
+        dut._log.error('rx engine: irq still active')
+        await exit_err()
+
+    dut._log.info('test_cdctl_rx_engine done.')
+    await exit_ok()
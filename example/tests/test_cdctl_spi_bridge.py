@@ -0,0 +1,85 @@
+# This Source Code Form is subject to the terms of the Mozilla
+# Public License, v. 2.0. If a copy of the MPL was not distributed
+# with this file, You can obtain one at https://mozilla.org/MPL/2.0/.
+# Notice: The scope granted to MPL excludes the ASIC industry.
+#
+# Copyright (c) 2017 DUKELEC, All rights reserved.
+#
+# Author: Duke Fong <d@d-l.io>
+#
+
+# The host driver pycdbus.cdctl outside of the test, in a thread with its own
+# asyncio loop, on the SPI pins through pycdbus.bridge: loopback frames read
+# by an RxEngine on int_n.
+
+import asyncio, tempfile, threading
+from pathlib import Path
+from common import *
+from pycdbus.cdctl import Cdctl, Spi, RxEngine
+from pycdbus.framebuf import FramePool
+from pycdbus.bridge import Bridge
+from pycdbus.sim.bridge import BridgeServer
+from pycdbus.sim.host import SpiHost
+
+CLK_FREQ = 40000000
+CLK_PERIOD = round(1000000000000 / CLK_FREQ)
+
+
+async def host(path, frames):
+    bridge = await Bridge.connect(path)
+    cdctl = Cdctl(Spi(bridge.host('spi')))
+    await cdctl.check_version()
+    await cdctl.setup(0x00)
+    await cdctl.set_div(39, 3)
+    rx = RxEngine(cdctl, bridge.irq('int_n'), pool=FramePool(4))
+    await rx.start()
+    ret = []
+    for frame in frames:
+        await cdctl.send(frame)
+        buf = await asyncio.wait_for(rx.__anext__(), 20)
+        ret.append(bytes(buf.data))
+        buf.release()
+    await bridge.close()
+    return ret, bridge.stat
+
+
+@cocotb.test(timeout_time=100000, timeout_unit='us')
+async def test_cdctl_spi_bridge(dut):
+    dut._log.info('test_cdctl_spi_bridge start.')
+    spi = SpiHost(dut, 32000000, CLK_PERIOD)
+    cocotb.start_soon(Clock(dut.clk, CLK_PERIOD).start())
+    await Timer(500000) # wait reset
+
+    path = str(Path(tempfile.mkdtemp()) / 'cdbus.sock')
+    server = BridgeServer(path)
+    server.add_host('spi', spi)
+    server.add_irq('int_n', dut.int_n)
+
+    frames = [bytes([0x01, 0x00, len_]) + payload(len_, len_) for len_ in (0, 1, 16, 253, 100)]
+    result = {}
+
+    def run():
+        try:
+            result['frames'], result['bridge'] = asyncio.run(host(path, frames))
+        except Exception as err:
+            result['error'] = repr(err)
+
+    thread = threading.Thread(target=run)
+    thread.start()
+    await server.serve()
+    thread.join()
+
+    spi_bytes = spi.stat['tx'] + spi.stat['rx'] + spi.stat['dummy']
+    dut._log.info(f'server: {server.stat}, spi: {spi.stat["transfers"]} transfers, {spi_bytes} bytes')
+    if 'error' in result:
+        dut._log.error(f'host: {result["error"]}')
+        await exit_err()
+    if result['frames'] != frames:
+        dut._log.error(f'cdctl: loopback mismatch: {[f[:8].hex() for f in result["frames"]]}')
+        await exit_err()
+    if server.stat['requests'] != spi.stat['transfers'] or not server.stat['irqs']:
+        dut._log.error(f'bridge: one request per transfer expected')
+        await exit_err()
+
+    dut._log.info('test_cdctl_spi_bridge done.')
+    await exit_ok()
@@ -0,0 +1,17 @@
+# This Source Code Form is subject to the terms of the Mozilla
+# Public License, v. 2.0. If a copy of the MPL was not distributed
+# with this file, You can obtain one at https://mozilla.org/MPL/2.0/.
+# Notice: The scope granted to MPL excludes the ASIC industry.
+#
+# Copyright (c) 2017 DUKELEC, All rights reserved.
+#
+# Author: Duke Fong <d@d-l.io>
+#
+
+"""Python helpers for the CDBUS IP: models, drivers and tools.
+
+The pure Python parts need the standard library only, NumPy is optional:
+crc.crc16_batch, stream and tools/wave_analyzer.py use it when it is
+installed and fall back to pure Python without it. The cocotb based helpers
+live in pycdbus.sim.
+"""
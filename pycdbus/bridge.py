@@ -0,0 +1,189 @@
+# This Source Code Form is subject to the terms of the Mozilla
+# Public License, v. 2.0. If a copy of the MPL was not distributed
+# with this file, You can obtain one at https://mozilla.org/MPL/2.0/.
+# Notice: The scope granted to MPL excludes the ASIC industry.
+#
+# Copyright (c) 2017 DUKELEC, All rights reserved.
+#
+# Author: Duke Fong <d@d-l.io>
+#
+
+"""Hosts of pycdbus.cdctl on a Unix socket, served by a running RTL
+simulation (pycdbus.sim.bridge.BridgeServer): the host software runs outside
+of the cocotb test, in its own asyncio loop (thread or process), with the
+same driver as on a board.
+
+  bridge = await Bridge.connect('/tmp/cdbus.sock')
+  cdctl = Cdctl(Spi(bridge.host('spi')))        # SpiHost / QspiHost pins
+  cdctl = Cdctl(I2c(bridge.host('i2c')))        # I2cHost pins
+  cdctl = Cdctl(bridge.csr('m0'))               # CSR port of a cdbus node
+  rx = RxEngine(cdctl, bridge.irq('int_n'))
+  ...
+  await bridge.close()
+
+One message is one call of the driver: a transfer of a whole burst, a read
+of len_ bytes of a register (INT_FLAG_L + RX_LEN + INT_FLAG_H, a RX page of
+REG_DAT), a write of a TX page. The server sends a message of its own when
+an irq line changes, the irq is a MockIrq following them. Calls of several
+tasks are pipelined, the server runs them in the order they come.
+
+A message: HDR (body length, seq, op, target) + body, little endian. The
+server starts with OP_HELLO, a json body of its target and irq names, the
+targets and irqs are the indices of these lists. The reply of a request
+has its seq, with OP_ERROR if it raised (errno, then the text; errno 0
+is not an OSError).
+"""
+
+import json, struct, asyncio
+from .cdctl import MockIrq
+
+HDR = struct.Struct('<IHBB')
+
+OP_HELLO        = 0     # server: {'targets': [[name, kind], ...], 'irqs': [name, ...]},
+                        # kind: 'transfer' (SPI, QSPI), 'i2c' or 'csr'
+OP_TRANSFER     = 1     # <HH rx_len, dummy + tx -> rx
+OP_WRITE        = 2     # <B dev + data
+OP_WRITE_READ   = 3     # <BH dev, rx_len + data -> rx
+OP_READ         = 4     # <BH addr, len_ -> data
+OP_WRITE_REG    = 5     # <B addr + data
+OP_IRQ          = 6     # server: <B active
+OP_ERROR        = 7     # reply: <H errno + text
+
+
+def pack(seq, op, target, body=b''):
+    return HDR.pack(len(body), seq, op, target) + body
+
+
+class BridgeError(RuntimeError):
+    pass
+
+
+class Bridge:
+    def __init__(self, reader, writer, hello):
+        self.reader = reader
+        self.writer = writer
+        self.targets = {name: (idx, kind) for idx, (name, kind) in enumerate(hello['targets'])}
+        self.irqs = [MockIrq() for _ in hello['irqs']]
+        self.irq_names = hello['irqs']
+        self.seq = 0
+        self.pending = {}
+        self.stat = {'requests': 0, 'tx': 0, 'rx': 0, 'irqs': 0}
+        self.task = asyncio.get_running_loop().create_task(self._read_loop())
+
+    @classmethod
+    async def connect(cls, path, timeout=10):
+        """The simulation may still be starting: retry until timeout (s)."""
+        loop = asyncio.get_running_loop()
+        end = loop.time() + timeout
+        while True:
+            try:
+                reader, writer = await asyncio.open_unix_connection(path)
+                break
+            except (FileNotFoundError, ConnectionRefusedError):
+                if loop.time() > end:
+                    raise
+                await asyncio.sleep(0.05)
+        len_, _, op, _ = HDR.unpack(await reader.readexactly(HDR.size))
+        body = await reader.readexactly(len_)
+        if op != OP_HELLO:
+            raise BridgeError(f'bridge: no hello: op {op}')
+        return cls(reader, writer, json.loads(body))
+
+    def host(self, name):
+        """transfer() of Spi / Qspi, write() and write_read() of I2c."""
+        return BridgeHost(self, self._target(name, ('transfer', 'i2c')))
+
+    def csr(self, name):
+        """A transport of Cdctl: read() / write() of a CSR port."""
+        return BridgeCsr(self, self._target(name, ('csr',)))
+
+    def irq(self, name):
+        return self.irqs[self.irq_names.index(name)]
+
+    def _target(self, name, kinds):
+        idx, kind = self.targets[name]
+        if kind not in kinds:
+            raise BridgeError(f'bridge: {name} is a {kind} target')
+        return idx
+
+    async def call(self, op, target, body=b''):
+        """Send a request, return the body of its reply."""
+        self.seq = self.seq % 0xffff + 1
+        seq = self.seq
+        future = self.pending[seq] = asyncio.get_running_loop().create_future()
+        msg = pack(seq, op, target, body)
+        self.stat['requests'] += 1
+        self.stat['tx'] += len(msg)
+        self.writer.write(msg)
+        await self.writer.drain()
+        return await future
+
+    async def _read_loop(self):
+        reader = self.reader
+        try:
+            while True:
+                len_, seq, op, target = HDR.unpack(await reader.readexactly(HDR.size))
+                body = await reader.readexactly(len_)
+                self.stat['rx'] += HDR.size + len_
+                if op == OP_IRQ:
+                    self.stat['irqs'] += 1
+                    self.irqs[target].set(body[0])
+                    continue
+                future = self.pending.pop(seq, None)
+                if future is None or future.done():
+                    continue
+                if op == OP_ERROR:
+                    code, = struct.unpack_from('<H', body)
+                    text = body[2:].decode()
+                    future.set_exception(OSError(code, text) if code else BridgeError(text))
+                else:
+                    future.set_result(body)
+        except (asyncio.IncompleteReadError, ConnectionError) as err:
+            for future in self.pending.values():
+                if not future.done():
+                    future.set_exception(BridgeError(f'bridge: connection lost: {err!r}'))
+            self.pending.clear()
+
+    async def close(self):
+        self.writer.close()
+        try:
+            await self.writer.wait_closed()
+        except ConnectionError:
+            pass
+        self.task.cancel()
+
+
+def _into(data, into):
+    if into is None:
+        return data
+    into[:len(data)] = data
+    return into
+
+
+class BridgeHost:
+    def __init__(self, bridge, target):
+        self.bridge = bridge
+        self.target = target
+
+    async def transfer(self, tx, rx_len=0, dummy=0, into=None):
+        rx = await self.bridge.call(OP_TRANSFER, self.target, struct.pack('<HH', rx_len, dummy) + bytes(tx))
+        return _into(rx, into)
+
+    async def write(self, dev, data):
+        await self.bridge.call(OP_WRITE, self.target, bytes([dev]) + bytes(data))
+
+    async def write_read(self, dev, data, rx_len, into=None):
+        rx = await self.bridge.call(OP_WRITE_READ, self.target, struct.pack('<BH', dev, rx_len) + bytes(data))
+        return _into(rx, into)
+
+
+class BridgeCsr:
+    def __init__(self, bridge, target):
+        self.bridge = bridge
+        self.target = target
+
+    async def read(self, addr, len_=1, into=None):
+        return _into(await self.bridge.call(OP_READ, self.target, struct.pack('<BH', addr, len_)), into)
+
+    async def write(self, addr, data):
+        await self.bridge.call(OP_WRITE_REG, self.target, bytes([addr]) + bytes(data))
@@ -0,0 +1,606 @@
+# This Source Code Form is subject to the terms of the Mozilla
+# Public License, v. 2.0. If a copy of the MPL was not distributed
+# with this file, You can obtain one at https://mozilla.org/MPL/2.0/.
+# Notice: The scope granted to MPL excludes the ASIC industry.
+#
+# Copyright (c) 2017 DUKELEC, All rights reserved.
+#
+# Author: Duke Fong <d@d-l.io>
+#
+
+"""CDBUS-BS node in software, asyncio on a serial port or a stand-in of one.
+
+The node does what cd_tx_ser and cd_rx_bytes do in BS mode, at byte level:
+  bus idle    idle_wait bits after the last byte on the line (or the end of
+              the frame in progress, its length is in its header)
+  tx permit   tx_permit_len bits after the bus is idle, the head frame goes
+              out if it was queued by then (a single point, as the RTL)
+  max idle    else, once the bus is idle for max_idle_len bits, a break
+              character first, then the frame at the next tx permit
+  rx          frames by their length, crc checked, the filter of
+              pycdbus.traffic.accepts(), an incomplete frame is dropped
+              latency after the bus would be idle
+
+  a, b = open_pty()
+  node = BsNode(a, filter_=0x01, baud=115200, tx_permit_len=100)
+  node.start()
+  await node.send(b'\\x01\\x02\\x01\\xcd') # without crc
+  frame = await node.recv()                # without crc
+
+The ports:
+  open_serial(path, baud, echo=False)  a UART (e.g. USB or RS-485), echo: the
+                                       transceiver reads back the node's own
+                                       bytes, breaks by TIOCSBRK
+  open_pty()                           two ports of a pty pair, the bytes
+                                       move at once, a break is in-band
+  Hub(baud).port() / connect(path)     a line shared by any number of nodes,
+                                       over Unix sockets, paced at the baud
+                                       rate, overlapping bytes are ANDed
+
+Line conditions come in the PARMRK format of termios: b'\\xff\\x00\\x00' is a
+break, b'\\xff\\x00' + byte a framing error, b'\\xff\\xff' a 0xff. The tty
+layer writes it for a UART, the stand-ins use it on the wire.
+
+With echo, the node checks its own frame as it comes back, a different one
+is a tx error and the frame is sent again (as cd_tx_ser, err in BS mode).
+
+The timing is the one of the asyncio loop: the wakeups are late by tens of
+us up to more than 1 ms (epoll rounds the timeouts to ms), so the
+differences of tx_permit_len must be well above that in bit times, see
+tools/bs_node_bench.py.
+"""
+
+import os, fcntl, select, socket, termios, tty, asyncio
+from collections import deque
+from .crc import crc16, modbus_crc
+from .traffic import accepts
+
+# not exported by the termios module of CPython on every platform, the
+# fallbacks are the values of asm-generic/ioctls.h (Linux)
+TIOCSBRK = getattr(termios, 'TIOCSBRK', 0x5427)
+TIOCCBRK = getattr(termios, 'TIOCCBRK', 0x5428)
+
+BREAK = 'break' # markers in the symbols, as the events of pycdbus.model
+ERROR = 'error'
+
+
+class Unescape:
+    """PARMRK stream to symbols: runs of bytes, BREAK and ERROR, a marker
+    split between reads is kept for the next one."""
+
+    def __init__(self):
+        self.rest = b''
+
+    def feed(self, data):
+        if self.rest:
+            data = self.rest + data
+            self.rest = b''
+        ret = []
+        i, n = 0, len(data)
+        while True:
+            j = data.find(b'\xff', i)
+            if j < 0:
+                if i < n:
+                    ret.append(data[i:])
+                return ret
+            if j > i:
+                ret.append(data[i:j])
+            if j + 1 == n or (j + 2 == n and data[j + 1] == 0):
+                self.rest = data[j:]
+                return ret
+            if data[j + 1] == 0:
+                ret.append(BREAK if data[j + 2] == 0 else ERROR)
+                i = j + 3
+            else: # 0xff 0xff, or not escaped
+                ret.append(b'\xff')
+                i = j + 2 if data[j + 1] == 0xff else j + 1
+
+
+class FdPort:
+    """A byte stream on a file descriptor (tty, pty or socket).
+    escape: the stream is PARMRK both ways (stand-ins), else only the
+    received one is and a break is sent by TIOCSBRK (UART)."""
+
+    def __init__(self, fd, escape=True, echo=False, close=None):
+        self.fd = fd
+        self.escape = escape
+        self.echo = echo
+        self._close = close
+        self.unescape = Unescape()
+        self.sink = None
+
+    def attach(self, sink):
+        """sink(symbols, t) for the bytes received from now on."""
+        self.sink = sink
+        os.set_blocking(self.fd, False)
+        asyncio.get_running_loop().add_reader(self.fd, self._readable)
+
+    def close(self):
+        if self.sink:
+            asyncio.get_running_loop().remove_reader(self.fd)
+            self.sink = None
+        if self._close:
+            self._close()
+        else:
+            os.close(self.fd)
+
+    def _readable(self):
+        t = asyncio.get_running_loop().time()
+        try:
+            data = os.read(self.fd, 65536)
+        except (BlockingIOError, InterruptedError):
+            return
+        except OSError: # the other end of a pty is closed
+            data = b''
+        if not data:
+            asyncio.get_running_loop().remove_reader(self.fd)
+            return
+        symbols = self.unescape.feed(data)
+        if symbols:
+            self.sink(symbols, t)
+
+    def poll(self):
+        """Take the bytes already in, before a decision on the line."""
+        if self.sink and select.select([self.fd], [], [], 0)[0]:
+            self._readable()
+
+    async def write(self, data):
+        await self.write_raw(data.replace(b'\xff', b'\xff\xff') if self.escape else data)
+
+    async def send_break(self, duration):
+        """A low line for duration (s), one break character."""
+        if self.escape:
+            await self.write_raw(b'\xff\x00\x00')
+            return
+        fcntl.ioctl(self.fd, TIOCSBRK)
+        try:
+            await asyncio.sleep(duration)
+        finally:
+            fcntl.ioctl(self.fd, TIOCCBRK)
+
+    async def write_raw(self, data):
+        """All of data, a full buffer waits in the loop (not blocking it)."""
+        view = memoryview(data)
+        while view:
+            try:
+                view = view[os.write(self.fd, view):]
+            except BlockingIOError:
+                await self._writable()
+
+    def _writable(self):
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        loop.add_writer(self.fd, lambda: future.done() or future.set_result(None))
+        future.add_done_callback(lambda _: loop.remove_writer(self.fd))
+        return future
+
+
+def _speed(baud):
+    speed = getattr(termios, f'B{baud}', None)
+    if speed is None:
+        raise ValueError(f'baud rate not supported by termios: {baud}')
+    return speed
+
+
+def open_serial(path, baud=115200, echo=False):
+    """A UART in raw mode, 8N1, breaks and framing errors marked (PARMRK)."""
+    fd = os.open(path, os.O_RDWR | os.O_NOCTTY)
+    tty.setraw(fd)
+    attr = termios.tcgetattr(fd)
+    attr[0] |= termios.PARMRK | termios.INPCK
+    attr[0] &= ~(termios.IGNBRK | termios.BRKINT | termios.IGNPAR | termios.ISTRIP)
+    attr[2] |= termios.CLOCAL | termios.CREAD
+    attr[4] = attr[5] = _speed(baud)
+    termios.tcsetattr(fd, termios.TCSANOW, attr)
+    termios.tcflush(fd, termios.TCIOFLUSH)
+    return FdPort(fd, escape=False, echo=echo)
+
+
+def open_pty():
+    """Two ports, the two ends of a pty pair (no echo, no bit timing)."""
+    master, slave = os.openpty()
+    tty.setraw(master)
+    tty.setraw(slave)
+    return FdPort(master), FdPort(slave)
+
+
+def connect(path):
+    """A port on the Hub served at path, maybe by another process."""
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.connect(path)
+    return FdPort(sock.fileno(), echo=True, close=sock.close)
+
+
+class _Segment:
+    """The bytes on the line from start on, back to back."""
+
+    def __init__(self, start, symbols):
+        self.start = start
+        self.symbols = symbols
+        self.sent = 0 # delivered to the ports
+
+
+class Hub:
+    """A shared line: the symbols written by the ports go out to every port
+    (the writer included) as they would leave a UART, one every 10 bits.
+    A port writing while another one is on the line collides: its symbols
+    are ANDed into the ones not delivered yet (the low level dominates, as
+    bus_a), from the symbol on the line at that time.
+
+      hub = Hub(115200)
+      a, b = hub.port(), hub.port()   # in this process
+      await hub.serve('/tmp/cdbus')   # and for connect('/tmp/cdbus')
+    """
+
+    def __init__(self, baud=115200):
+        self.byte = 10 / baud
+        self.conns = {} # fd: (socket, Unescape)
+        self.seg = None
+        self.owner = None
+        self.timer = None
+        self.server = None
+        self.stat = {'bytes': 0, 'breaks': 0, 'collisions': 0, 'overruns': 0}
+
+    def port(self):
+        hub_end, node_end = socket.socketpair()
+        self._add(hub_end)
+        return FdPort(node_end.fileno(), echo=True, close=node_end.close)
+
+    async def serve(self, path):
+        if os.path.exists(path):
+            os.unlink(path)
+        self.server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.server.bind(path)
+        self.server.listen()
+        self.server.setblocking(False)
+        asyncio.get_running_loop().add_reader(self.server.fileno(), self._accept)
+
+    def close(self):
+        loop = asyncio.get_running_loop()
+        if self.timer:
+            self.timer.cancel()
+        if self.server:
+            loop.remove_reader(self.server.fileno())
+            self.server.close()
+        for sock, _ in self.conns.values():
+            loop.remove_reader(sock.fileno())
+            sock.close()
+        self.conns.clear()
+
+    def _accept(self):
+        try:
+            sock, _ = self.server.accept()
+        except BlockingIOError:
+            return
+        self._add(sock)
+
+    def _add(self, sock):
+        sock.setblocking(False)
+        fd = sock.fileno()
+        self.conns[fd] = (sock, Unescape())
+        asyncio.get_running_loop().add_reader(fd, self._readable, fd)
+
+    def _readable(self, fd):
+        t = asyncio.get_running_loop().time()
+        sock, unescape = self.conns[fd]
+        try:
+            data = sock.recv(65536)
+        except BlockingIOError:
+            return
+        except OSError:
+            data = b''
+        if not data:
+            asyncio.get_running_loop().remove_reader(fd)
+            del self.conns[fd]
+            sock.close()
+            return
+        symbols = []
+        for s in unescape.feed(data):
+            if isinstance(s, str):
+                symbols.append(s)
+            else:
+                symbols += s
+        if symbols:
+            self._line(fd, symbols, t)
+
+    def _line(self, fd, symbols, t):
+        seg = self.seg
+        if seg is None or t >= seg.start + len(seg.symbols) * self.byte:
+            if seg is not None:
+                self._deliver(len(seg.symbols))
+            self.seg = _Segment(t, symbols)
+            self.owner = fd
+        elif fd == self.owner:
+            seg.symbols += symbols
+        else:
+            self.stat['collisions'] += 1
+            at = max(self._bytes(t), seg.sent)
+            for i, s in enumerate(symbols, at):
+                if i < len(seg.symbols):
+                    old = seg.symbols[i]
+                    seg.symbols[i] = BREAK if isinstance(s, str) or isinstance(old, str) else old & s
+                else:
+                    seg.symbols.append(s)
+        self._arm()
+
+    def _bytes(self, t):
+        """Bytes of the segment on the line by t, a timer of the end of a byte
+        may come a rounding error early."""
+        return int((t - self.seg.start) / self.byte + 1e-6)
+
+    def _arm(self):
+        if self.timer:
+            self.timer.cancel()
+        seg = self.seg
+        self.timer = asyncio.get_running_loop().call_at(seg.start + (seg.sent + 1) * self.byte, self._tick)
+
+    def _tick(self):
+        self.timer = None
+        seg = self.seg
+        n = min(len(seg.symbols), self._bytes(asyncio.get_running_loop().time()))
+        self._deliver(n)
+        if seg.sent < len(seg.symbols):
+            self._arm()
+
+    def _deliver(self, n):
+        seg = self.seg
+        symbols = seg.symbols[seg.sent:n]
+        if not symbols:
+            return
+        seg.sent = n
+        self.stat['breaks'] += symbols.count(BREAK)
+        self.stat['bytes'] += len(symbols)
+        data = bytearray()
+        for s in symbols:
+            if s == BREAK:
+                data += b'\xff\x00\x00'
+            else:
+                data.append(s)
+                if s == 0xff:
+                    data.append(s)
+        for sock, _ in list(self.conns.values()):
+            try:
+                sock.sendall(data)
+            except BlockingIOError: # the line does not wait for a port not reading
+                self.stat['overruns'] += 1
+            except OSError:
+                pass
+
+
+class BsNode:
+    """filter_, m0, m1, msk0, msk1: as the filter registers, 0xff receives
+    all frames (its own ones included). The lengths are in bits, as the
+    registers. tx_pages: frames queued at most, send() waits for a free
+    one; rx_pages: frames not received yet at most, the next ones are lost.
+    latency: how late the bytes of a frame may come in (s, the loop, the
+    UART FIFO or USB frames), an incomplete frame is kept that much longer.
+    trace: a list getting (kind, planned, actual) of each transmission,
+    kind 'data' or 'break', the times in s of the loop."""
+
+    def __init__(self, port, filter_=0xff, baud=115200, tx_permit_len=20, max_idle_len=200, idle_wait=10,
+                 m0=0xff, m1=0xff, msk0=0xff, msk1=0xff, tx_pages=2, rx_pages=64, latency=0.002, trace=None):
+        self.port = port
+        self.flt = {'filter': filter_, 'm0': m0, 'm1': m1, 'msk0': msk0, 'msk1': msk1}
+        self.bit = 1 / baud
+        self.tx_permit_len = tx_permit_len
+        self.max_idle_len = max_idle_len
+        self.idle_wait = idle_wait
+        self.latency = latency
+        self.tx_pages = tx_pages
+        self.rx_pages = rx_pages
+        self.trace = trace
+        self.tx = deque()       # [frame with crc, time queued]
+        self.inflight = None    # frame sent, its echo not back yet
+        self.rx = deque()
+        self.rx_buf = bytearray()
+        self.quiet_since = 0.0  # end of the last byte on the line, sent or received
+        self.rx_last = 0.0      # the last byte received
+        self.stat = {k: 0 for k in ('tx', 'tx_break', 'tx_err', 'rx', 'rx_filtered', 'rx_crc', 'rx_error',
+                                    'rx_break', 'rx_lost')}
+        self._waiter = None
+        self._rx_timer = None
+        self._task = None
+        self._tx_free = asyncio.Event()
+        self._rx_ready = asyncio.Event()
+
+    def start(self):
+        """Attach to the port, the bus counts as busy until now."""
+        self.quiet_since = asyncio.get_running_loop().time()
+        self.port.attach(self._received)
+        self._task = asyncio.get_running_loop().create_task(self._tx_loop())
+        self._tx_free.set()
+
+    def close(self):
+        if self._task:
+            self._task.cancel()
+        if self._rx_timer:
+            self._rx_timer.cancel()
+        self.port.close()
+
+    def set_timing(self, tx_permit_len=None, max_idle_len=None, idle_wait=None):
+        if tx_permit_len is not None:
+            self.tx_permit_len = tx_permit_len
+        if max_idle_len is not None:
+            self.max_idle_len = max_idle_len
+        if idle_wait is not None:
+            self.idle_wait = idle_wait
+        self._poke()
+
+    def set_filter(self, filter_, m0=0xff, m1=0xff, msk0=0xff, msk1=0xff):
+        self.flt = {'filter': filter_, 'm0': m0, 'm1': m1, 'msk0': msk0, 'msk1': msk1}
+
+    # tx
+
+    async def send(self, frame):
+        """Queue the frame (without crc) once a tx page is free."""
+        if not 3 <= len(frame) <= 256 or len(frame) != frame[2] + 3:
+            raise ValueError(f'bad frame length: {len(frame)}')
+        while len(self.tx) + (self.inflight is not None) >= self.tx_pages:
+            self._tx_free.clear()
+            await self._tx_free.wait()
+        frame = bytes(frame)
+        self.tx.append([frame + modbus_crc(frame), asyncio.get_running_loop().time()])
+        self._poke()
+
+    async def flush(self):
+        """Wait until every frame queued is sent."""
+        while self.tx or self.inflight is not None:
+            self._tx_free.clear()
+            await self._tx_free.wait()
+
+    def idle_at(self):
+        """When the bus is idle, if nothing more comes: an incomplete frame
+        keeps it busy until it is dropped, at the same time on every node."""
+        idle_at = self.quiet_since + self.idle_wait * self.bit
+        return max(idle_at, self._rx_expire()) if self.rx_buf else idle_at
+
+    def _rx_end(self):
+        """When the frame in progress ends, by its length."""
+        buf = self.rx_buf
+        if not buf:
+            return self.rx_last
+        need = buf[2] + 5 if len(buf) >= 3 else 5
+        return self.rx_last + (need - len(buf)) * 10 * self.bit
+
+    def _poke(self):
+        if self._waiter and not self._waiter.done():
+            self._waiter.set_result(True)
+
+    async def _sleep_until(self, t):
+        """False at t, True if poked before."""
+        loop = asyncio.get_running_loop()
+        self._waiter = loop.create_future()
+        handle = loop.call_at(t, lambda w=self._waiter: w.done() or w.set_result(False))
+        try:
+            return await self._waiter
+        finally:
+            handle.cancel()
+            self._waiter = None
+
+    async def _tx_loop(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            if not self.tx and self.inflight is None:
+                self._tx_free.set()
+                await self._sleep_until(loop.time() + 3600)
+                continue
+            idle_at = self.idle_at()
+            if self.inflight is not None: # the echo never came back
+                if not await self._sleep_until(idle_at + self.latency):
+                    self.port.poll()
+                    if self.inflight is not None and self.idle_at() == idle_at:
+                        self._tx_fail()
+                continue
+            permit = idle_at + (self.tx_permit_len + 1) * self.bit
+            if self.tx[0][1] <= permit and loop.time() <= permit:
+                kind, planned = 'data', permit
+            else: # missed the tx permit, so the bus has been idle long enough
+                kind, planned = 'break', max(idle_at + (self.max_idle_len + 1) * self.bit, self.tx[0][1])
+            if await self._sleep_until(planned):
+                continue
+            self.port.poll() # carrier sense, the loop may have been late
+            if self.idle_at() != idle_at:
+                continue
+            now = loop.time()
+            if self.trace is not None:
+                self.trace.append((kind, planned, now))
+            start = max(now, self.quiet_since)
+            if kind == 'break':
+                self.stat['tx_break'] += 1
+                self.quiet_since = start + 10 * self.bit
+                await self.port.send_break(10 * self.bit)
+                self.tx[0][1] = now # ready for the next tx permit
+                continue
+            frame = self.tx.popleft()[0]
+            self.quiet_since = start + len(frame) * 10 * self.bit
+            if self.port.echo: # before the write, the echo may come back while it waits
+                self.inflight = frame
+            await self.port.write(frame)
+            if not self.port.echo:
+                self._tx_done()
+
+    def _tx_done(self):
+        self.stat['tx'] += 1
+        self.inflight = None
+        self._tx_free.set()
+
+    def _tx_fail(self):
+        self.stat['tx_err'] += 1
+        self.tx.appendleft([self.inflight, asyncio.get_running_loop().time()])
+        self.inflight = None
+
+    # rx
+
+    async def recv(self):
+        """The next frame received (without crc)."""
+        while not self.rx:
+            self._rx_ready.clear()
+            await self._rx_ready.wait()
+        return self.rx.popleft()
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        return await self.recv()
+
+    def _rx_expire(self):
+        return self._rx_end() + self.idle_wait * self.bit + self.latency
+
+    def _expire(self):
+        """Drop the incomplete frame, by a timer: the bytes read by then are
+        in, the loop runs the readers before the timers."""
+        self._rx_timer = None
+        self.port.poll()
+        if self.rx_buf and self._rx_timer is None:
+            self.rx_buf.clear()
+            self.stat['rx_error'] += 1
+            if self.inflight is not None:
+                self._tx_fail()
+            self._poke()
+
+    def _received(self, symbols, t):
+        for s in symbols:
+            if isinstance(s, str):
+                if self.rx_buf:
+                    self.stat['rx_error'] += 1
+                    self.rx_buf.clear()
+                if self.inflight is not None:
+                    self._tx_fail()
+                if s == BREAK:
+                    self.stat['rx_break'] += 1
+                continue
+            buf = self.rx_buf
+            buf += s
+            while len(buf) >= 3 and len(buf) >= buf[2] + 5:
+                n = buf[2] + 5
+                self._frame(bytes(buf[:n]))
+                del buf[:n]
+        self.rx_last = t
+        self.quiet_since = max(self.quiet_since, t)
+        if self._rx_timer:
+            self._rx_timer.cancel()
+            self._rx_timer = None
+        if self.rx_buf:
+            self._rx_timer = asyncio.get_running_loop().call_at(self._rx_expire(), self._expire)
+        self._poke()
+
+    def _frame(self, frame):
+        if self.inflight is not None:
+            if frame == self.inflight:
+                self._tx_done()
+            elif crc16(frame) or frame[0] == self.inflight[0]:
+                self._tx_fail()
+            # else a frame on the line before this one, seen late
+        if crc16(frame):
+            self.stat['rx_crc'] += 1
+            return
+        if not accepts(self.flt, frame):
+            self.stat['rx_filtered'] += 1
+            return
+        if len(self.rx) >= self.rx_pages:
+            self.stat['rx_lost'] += 1
+            return
+        self.stat['rx'] += 1
+        self.rx.append(frame[:-2])
+        self._rx_ready.set()
@@ -0,0 +1,346 @@
+# This Source Code Form is subject to the terms of the Mozilla
+# Public License, v. 2.0. If a copy of the MPL was not distributed
+# with this file, You can obtain one at https://mozilla.org/MPL/2.0/.
+# Notice: The scope granted to MPL excludes the ASIC industry.
+#
+# Copyright (c) 2017 DUKELEC, All rights reserved.
+#
+# Author: Duke Fong <d@d-l.io>
+#
+
+"""Host driver of the CDCTL-Bx controllers, the CDBUS IP behind the SPI,
+QSPI or I2C slave of example/common/.
+
+The layers:
+  Cdctl       config, TX and RX on the registers of pycdbus.regs
+  transport   read(addr, len_) / write(addr, data) in the frames of one
+              interface: Spi, Qspi or I2c
+  host        moves the bytes: pycdbus.linux (spidev, i2c-dev) on a
+              board, pycdbus.sim.host (pins of the cocotb wrapper) in the
+              RTL tests
+
+A host of Spi / Qspi has transfer(tx, rx_len=0, dummy=0, into=None): chip
+select, tx bytes out, dummy bytes of turnaround, then rx_len bytes in. A host
+of I2c has write(dev, data) and write_read(dev, data, rx_len, into=None) with
+a repeated start. into: a writable buffer of rx_len bytes filled in place.
+
+Every call is a coroutine, so the same driver runs under asyncio and under
+cocotb, the hardware hosts simply block in their ioctl.
+Each register access is one transfer, and the driver keeps them few: the
+frame is written or read in one burst of REG_DAT (the TX page is submitted
+and the RX page released at the end of the transfer), INT_FLAG_L, RX_LEN and
+INT_FLAG_H come in one read.
+
+  cdctl = Cdctl(Spi(SpidevHost('/dev/spidev0.0')))
+  await cdctl.check_version()
+  await cdctl.setup(filter_=0x0c, baud_ls=115200, baud_hs=115200)
+  await cdctl.send(b'\\x0c\\x0d\\x01\\xcd')
+  frame = await cdctl.recv() # None if no RX page is ready
+
+RxEngine reads the RX pages when the irq line is active instead of polling
+INT_FLAG, the frames come out of an async iterator.
+
+read_rx() and recv() take a pycdbus.framebuf.FrameBuf to read the frame into,
+RxEngine one FramePool for all of them:
+
+  pool = FramePool(8)
+  frame = await cdctl.recv(pool.get())
+  ...
+  frame.release()
+"""
+
+import asyncio
+from collections import deque
+from .regs import *
+from .framebuf import FrameBuf
+
+SYS_CLK = 40000000 # of the CDCTL-Bx modules (example/pll)
+
+MODES = {
+    'traditional': MODE_TRADITIONAL,
+    'arbitration': MODE_ARBITRATION,
+    'bs': MODE_BREAK_SYNC,
+    'full_duplex': MODE_FULL_DUPLEX
+}
+
+
+class Spi:
+    """spi_slave.v: {W/R, addr, 0}, then the data, the read data follows the
+    first byte without turnaround."""
+
+    def __init__(self, host):
+        self.host = host
+
+    async def read(self, addr, len_=1, into=None):
+        return await self.host.transfer(bytes([addr << 1]), len_, into=into)
+
+    async def write(self, addr, data):
+        await self.host.transfer(bytes([addr << 1 | 0x80]) + bytes(data))
+
+
+class Qspi:
+    """qspi_slave.v: {W/R, addr}, then the data, 4 bits per sck, 2 bytes of
+    turnaround before the read data."""
+
+    TURNAROUND = 2
+
+    def __init__(self, host):
+        self.host = host
+
+    async def read(self, addr, len_=1, into=None):
+        return await self.host.transfer(bytes([addr]), len_, self.TURNAROUND, into=into)
+
+    async def write(self, addr, data):
+        await self.host.transfer(bytes([addr | 0x80]) + bytes(data))
+
+
+class I2c:
+    """i2c_slave.v: device address 0b11000xx (xx: the addr_sel pins), write
+    {addr, data}, read {addr} then the data after a repeated start."""
+
+    DEV_ADDR = 0b1100000
+
+    def __init__(self, host, addr_sel=0):
+        self.host = host
+        self.dev = self.DEV_ADDR | (addr_sel & 0b11)
+
+    async def read(self, addr, len_=1, into=None):
+        return await self.host.write_read(self.dev, bytes([addr]), len_, into=into)
+
+    async def write(self, addr, data):
+        await self.host.write(self.dev, bytes([addr]) + bytes(data))
+
+
+def div(baud, sys_clk=SYS_CLK):
+    """DIV_xx = sysclk / baud_rate - 1"""
+    value = round(sys_clk / baud) - 1
+    if not 2 <= value <= 0xffff:
+        raise ValueError(f'baud rate out of range: {baud}')
+    return value
+
+
+class Cdctl:
+    def __init__(self, transport, sys_clk=SYS_CLK):
+        self.t = transport
+        self.sys_clk = sys_clk
+
+    async def read(self, addr, len_=1, into=None):
+        """into: a writable buffer of len_ bytes, or a FrameBuf (resized),
+        filled in place and returned."""
+        if isinstance(into, FrameBuf):
+            await self.t.read(addr, len_, into.resize(len_))
+            return into
+        return await self.t.read(addr, len_, into)
+
+    async def write(self, addr, data):
+        """data: an int for one byte, else any buffer (bytes, memoryview,
+        FrameBuf, a list of ints), the transports take bytes() of it."""
+        await self.t.write(addr, bytes([data]) if isinstance(data, int) else data)
+
+    async def read_reg(self, addr):
+        return (await self.t.read(addr))[0]
+
+    async def check_version(self):
+        version = await self.read_reg(REG_VERSION)
+        if version != DFT_VERSION:
+            raise RuntimeError(f'cdctl: version 0x{version:02x}, expected 0x{DFT_VERSION:02x}')
+        return version
+
+    # config
+
+    # the _L write loads {_H, _L} from a backup of the _H write, which any other
+    # access clears, so each _H goes right before its _L
+
+    async def set_div(self, div_ls, div_hs):
+        for reg, val in ((REG_DIV_LS_H, div_ls >> 8), (REG_DIV_LS_L, div_ls & 0xff),
+                         (REG_DIV_HS_H, div_hs >> 8), (REG_DIV_HS_L, div_hs & 0xff)):
+            await self.write(reg, val)
+
+    async def set_baud(self, baud_ls, baud_hs=None):
+        await self.set_div(div(baud_ls, self.sys_clk), div(baud_hs or baud_ls, self.sys_clk))
+
+    async def set_filter(self, filter_, m0=0xff, m1=0xff, msk0=0xff, msk1=0xff):
+        """filter_: own address, 0xff receives all. m0 / msk0, m1 / msk1: the
+        multicast groups, (dst & msk) == m, the default only matches 0xff."""
+        for reg, val in ((REG_FILTER, filter_), (REG_FILTER_M0, m0), (REG_FILTER_M1, m1),
+                         (REG_FILTER_MSK0, msk0), (REG_FILTER_MSK1, msk1)):
+            await self.write(reg, val)
+
+    async def set_tx_permit_len(self, value):
+        await self.write(REG_TX_PERMIT_LEN_H, value >> 8)
+        await self.write(REG_TX_PERMIT_LEN_L, value & 0xff)
+
+    async def set_max_idle_len(self, value):
+        await self.write(REG_MAX_IDLE_LEN_H, value >> 8)
+        await self.write(REG_MAX_IDLE_LEN_L, value & 0xff)
+
+    async def set_int_mask(self, mask):
+        await self.write(REG_INT_MASK_L, mask & 0xff)
+        await self.write(REG_INT_MASK_H, mask >> 8)
+
+    async def setup(self, filter_, baud_ls=115200, baud_hs=None, mode='arbitration', setting=BIT_SETTING_TX_PUSH_PULL,
+                    int_mask=None):
+        """The usual config, the other registers keep their defaults.
+        setting: the bits of REG_SETTING besides the mode."""
+        await self.write(REG_SETTING, MODES[mode] << 4 | setting)
+        await self.set_baud(baud_ls, baud_hs)
+        await self.write(REG_FILTER, filter_)
+        if int_mask is not None:
+            await self.set_int_mask(int_mask)
+
+    # status
+
+    async def int_flag(self):
+        return await self.read_reg(REG_INT_FLAG_L)
+
+    async def status(self):
+        """(INT_FLAG, RX_LEN) in one read of 3 bytes, INT_FLAG is 16 bits,
+        INT_FLAG[13:8] is the number of RX pages ready."""
+        flag_l, rx_len, flag_h = await self.read(REG_INT_FLAG_L, 3)
+        return flag_h << 8 | flag_l, rx_len
+
+    # tx
+
+    async def tx_free(self):
+        return bool(await self.int_flag() & BIT_FLAG_TX_BUF_FREE)
+
+    async def write_tx(self, frame):
+        """Fill a free TX page with the frame (without crc), it is sent at the
+        end of the transfer."""
+        if not 3 <= len(frame) <= 256:
+            raise ValueError(f'frame length out of range: {len(frame)}')
+        await self.write(REG_DAT, frame)
+
+    async def send(self, frame, tries=None):
+        """Wait for a free TX page and write the frame, tries: polls of
+        INT_FLAG_L before giving up (None: no limit). Returns False if the
+        page was never free."""
+        while not await self.tx_free():
+            if tries is not None:
+                tries -= 1
+                if tries <= 0:
+                    return False
+        await self.write_tx(frame)
+        return True
+
+    async def tx_abort(self):
+        await self.write(REG_CTRL, BIT_TX_ABORT)
+
+    async def send_break(self):
+        await self.write(REG_CTRL, BIT_TX_SEND_BREAK)
+
+    # rx
+
+    async def read_rx(self, rx_len, into=None):
+        """The frame (without crc) of the RX page ready, rx_len: RX_LEN."""
+        return await self.read(REG_DAT, rx_len + 3, into)
+
+    async def recv(self, into=None):
+        """The frame of the next RX page, None if no page is ready.
+        One read of INT_FLAG_L + RX_LEN, then one of the frame."""
+        flag, rx_len = await self.read(REG_INT_FLAG_L, 2)
+        if not flag & BIT_FLAG_RX_PENDING:
+            return None
+        return await self.read_rx(rx_len, into)
+
+    async def rx_reset(self):
+        await self.write(REG_CTRL, BIT_RX_RST)
+
+
+class MockIrq:
+    """Stand-in of the irq line (e.g. a GPIO) for asyncio, set() by whoever
+    plays the controller. Hosts of the line have the same wait()."""
+
+    def __init__(self):
+        self.event = asyncio.Event()
+
+    def set(self, active=True):
+        if active:
+            self.event.set()
+        else:
+            self.event.clear()
+
+    async def wait(self):
+        """Return once the line is active, at once if it is."""
+        await self.event.wait()
+
+
+class RxEngine:
+    """Frames of the RX pages, read when the irq line is active:
+
+      rx = RxEngine(cdctl, irq)
+      await rx.start()
+      async for frame in rx:
+          ...
+
+    irq: wait() returns once the line is active (level, not edge), e.g.
+    pycdbus.linux.GpioIrq, pycdbus.sim.host.SimIrq or MockIrq.
+    A wakeup reads INT_FLAG_L, RX_LEN and INT_FLAG_H in one transfer and
+    drains every page of INT_FLAG[13:8] (0 with RX_PENDING set: 64): each page is one read of REG_DAT,
+    and one of INT_FLAG_L + RX_LEN for the length of the next page.
+    pool: a FramePool, the frames are FrameBuf of it, release() each one
+    when done with it (bytes without a pool).
+    """
+
+    INT_MASK = BIT_FLAG_RX_PENDING | BIT_FLAG_RX_LOST | BIT_FLAG_RX_ERROR
+
+    def __init__(self, cdctl, irq, int_mask=INT_MASK, pool=None):
+        self.cdctl = cdctl
+        self.pool = pool
+        self.irq = irq
+        self.int_mask = int_mask
+        self.frames = deque()
+        self.closed = False
+        self.stat = {'wakeups': 0, 'frames': 0, 'empty': 0, 'rx_lost': 0, 'rx_error': 0, 'max_drain': 0}
+
+    async def start(self):
+        await self.cdctl.set_int_mask(self.int_mask)
+
+    def close(self):
+        """The iteration ends once the frames already read are out."""
+        self.closed = True
+
+    def _flags(self, flag):
+        if flag & BIT_FLAG_RX_LOST:
+            self.stat['rx_lost'] += 1
+        if flag & BIT_FLAG_RX_ERROR:
+            self.stat['rx_error'] += 1
+
+    async def drain(self):
+        """Read every RX page ready, return the number of frames."""
+        flag, rx_len = await self.cdctl.status()
+        self._flags(flag)
+        pages = flag >> 8 & 0x3f
+        if not flag & BIT_FLAG_RX_PENDING:
+            pages = 0
+        elif not pages:
+            pages = 64 # the 6 bits of rx_pend_len wrap to 0 with all the index entries taken
+        for i in range(pages):
+            if i:
+                flag, rx_len = await self.cdctl.read(REG_INT_FLAG_L, 2)
+                self._flags(flag)
+                if not flag & BIT_FLAG_RX_PENDING:
+                    pages = i
+                    break
+            into = self.pool.get() if self.pool else None
+            self.frames.append(await self.cdctl.read_rx(rx_len, into))
+        self.stat['frames'] += pages
+        self.stat['max_drain'] = max(self.stat['max_drain'], pages)
+        if not pages:
+            self.stat['empty'] += 1
+        return pages
+
+    async def wakeup(self):
+        await self.irq.wait()
+        self.stat['wakeups'] += 1
+        return await self.drain()
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        while not self.frames:
+            if self.closed:
+                raise StopAsyncIteration
+            await self.wakeup()
+        return self.frames.popleft()
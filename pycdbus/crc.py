@@ -0,0 +1,101 @@
+# This Source Code Form is subject to the terms of the Mozilla
+# Public License, v. 2.0. If a copy of the MPL was not distributed
+# with this file, You can obtain one at https://mozilla.org/MPL/2.0/.
+# Notice: The scope granted to MPL excludes the ASIC industry.
+#
+# Copyright (c) 2017 DUKELEC, All rights reserved.
+#
+# Author: Duke Fong <d@d-l.io>
+#
+
+"""MODBUS CRC (LSB first, poly 0xa001, init 0xffff), same as hdl/cd_crc.v.
+
+  crc16(data)                  -> int
+  crc16(data2, crc16(data1))   -> streaming, same as crc16(data1 + data2)
+  modbus_crc(data)             -> 2 bytes as sent on the bus (little endian)
+  Crc16().update(data).digest()
+  crc16_batch(frames)          -> CRCs of many frames at once (numpy)
+"""
+
+CRC_INIT = 0xffff
+CRC_POLY = 0xa001 # 0x8005 reversed
+
+
+def crc16_bit(crc, bit):
+    """One step of the bit-serial LFSR in cd_crc.v."""
+    fb = (crc ^ bit) & 1
+    crc >>= 1
+    return crc ^ CRC_POLY if fb else crc
+
+
+def _make_table():
+    table = []
+    for i in range(256):
+        crc = i
+        for _ in range(8):
+            crc = crc16_bit(crc, 0)
+        table.append(crc)
+    return tuple(table)
+
+CRC_TABLE = _make_table()
+
+
+def crc16(data, crc=CRC_INIT):
+    table = CRC_TABLE
+    for byte in data:
+        crc = (crc >> 8) ^ table[(crc ^ byte) & 0xff]
+    return crc
+
+def modbus_crc(data):
+    return crc16(data).to_bytes(2, byteorder='little')
+
+
+class Crc16:
+    __slots__ = ('crc',)
+
+    def __init__(self, data=b'', crc=CRC_INIT):
+        self.crc = crc16(data, crc)
+
+    def update(self, data):
+        self.crc = crc16(data, self.crc)
+        return self
+
+    def digest(self):
+        return self.crc.to_bytes(2, byteorder='little')
+
+
+def crc16_batch(frames, crc=CRC_INIT):
+    """CRC of each frame, the frames may have different lengths.
+
+    The frames are packed into a zero padded 2d array, then one table lookup
+    per byte column is done for all frames together, so the python loop
+    runs max(len) times instead of sum(len) times.
+    Fall back to crc16() per frame if numpy is not available.
+    """
+    try:
+        import numpy as np
+    except ImportError:
+        return [crc16(f, crc) for f in frames]
+
+    n = len(frames)
+    if not n:
+        return []
+    lens = np.fromiter((len(f) for f in frames), dtype=np.int64, count=n)
+    order = np.argsort(-lens, kind='stable') # longest first, active frames are always a prefix
+    lens_sorted = lens[order]
+    width = int(lens_sorted[0])
+    valid = np.arange(width)[:, None] < lens_sorted[None, :]
+    buf = np.zeros((n, width), dtype=np.uint8)
+    buf[valid.T] = np.frombuffer(b''.join(bytes(frames[i]) for i in order), dtype=np.uint8)
+    buf = np.ascontiguousarray(buf.T) # one row per byte position
+    active = valid.sum(axis=1)
+
+    table = np.array(CRC_TABLE, dtype=np.uint16)
+    crcs = np.full(n, crc, dtype=np.uint16)
+    for col in range(width):
+        k = active[col]
+        c = crcs[:k]
+        crcs[:k] = (c >> 8) ^ table[(c ^ buf[col, :k]) & 0xff]
+    ret = np.empty(n, dtype=np.uint16)
+    ret[order] = crcs
+    return ret.tolist()
@@ -0,0 +1,181 @@
+# This Source Code Form is subject to the terms of the Mozilla
+# Public License, v. 2.0. If a copy of the MPL was not distributed
+# with this file, You can obtain one at https://mozilla.org/MPL/2.0/.
+# Notice: The scope granted to MPL excludes the ASIC industry.
+#
+# Copyright (c) 2017 DUKELEC, All rights reserved.
+#
+# Author: Duke Fong <d@d-l.io>
+#
+
+"""CDBUS frames out of the edges of a line, as cd_rx_des sees them.
+
+The decoder is fed the level changes of the line in time order, it never
+looks at a clock: the bits are sampled in the middle (the first byte of a
+frame at bit_ls, the next ones at bit_hs, each byte synced to its start
+edge), the frame ends once the line is idle for idle_wait bits of bit_ls
+after a stop bit:
+
+  dec = LineDecoder(bit_ls, bit_hs, on_frame=frames.append) # ps
+  dec.edge(t, level) ...
+  dec.finish(t_end)
+
+A bad start or stop bit ends the frame as 'error', a zero byte with a low
+stop bit is a break character ('break'), then the line must be high for
+idle_wait bits before the next frame, as the RTL. Times are in any unit,
+the one of bit_ls and bit_hs.
+"""
+
+from .crc import crc16
+
+WAIT_IDLE, BUS_IDLE, DATA, WAIT_DATA = range(4)
+
+KINDS = ('ok', 'crc', 'short', 'error', 'break')
+
+
+class Frame:
+    """start: falling edge of the first start bit, end: end of the last stop
+    bit (or of the bad bit), gap: from the end of the previous frame (None
+    for the first one). data: the bytes, cut to len + 5 for a complete frame.
+    kind: ok, crc (crc error), short (idle before len + 5 bytes), error (bad
+    start or stop bit) or break."""
+
+    __slots__ = ('start', 'end', 'data', 'kind', 'gap')
+
+    def __init__(self, start, end, data, kind, gap=None):
+        self.start = start
+        self.end = end
+        self.data = data
+        self.kind = kind
+        self.gap = gap
+
+    @property
+    def src(self):
+        return self.data[0] if self.data else None
+
+    @property
+    def dst(self):
+        return self.data[1] if len(self.data) > 1 else None
+
+    @property
+    def payload(self):
+        return self.data[3:3 + self.data[2]] if len(self.data) > 2 else b''
+
+    def __repr__(self):
+        return f'Frame({self.start}, {self.end}, {self.kind}, {self.data.hex()})'
+
+
+def frame_kind(data):
+    """The kind of a frame ended by the idle line, and its bytes."""
+    if len(data) < 3 or len(data) < data[2] + 5:
+        return 'short', data
+    data = data[:data[2] + 5]
+    return ('ok' if crc16(data) == 0 else 'crc'), data
+
+
+class LineDecoder:
+    def __init__(self, bit_ls, bit_hs, idle_wait=10, on_frame=None):
+        self.set_rate(bit_ls, bit_hs, idle_wait)
+        self.on_frame = on_frame
+        self.level = 1
+        self.rise = 0 # last rising edge
+        self.state = WAIT_IDLE
+        self.last_end = None
+        self.data = bytearray()
+
+    def set_rate(self, bit_ls, bit_hs, idle_wait=None):
+        """Takes effect from the next byte."""
+        self.bit_ls = bit_ls
+        self.bit_hs = bit_hs
+        if idle_wait is not None:
+            self.idle_wait = idle_wait
+        self.idle_len = self.idle_wait * bit_ls
+
+    def edge(self, t, level):
+        if level == self.level:
+            return
+        self.advance(t)
+        self.level = level
+        if level:
+            self.rise = t
+        elif self.state == BUS_IDLE:
+            self.start = t
+            self.data = bytearray()
+            self._byte(t, self.bit_ls)
+        elif self.state == WAIT_DATA:
+            self._byte(t, self.bit_hs)
+
+    def advance(self, t):
+        """Take the samples before t, at the current level."""
+        while True:
+            state = self.state
+            if state == DATA:
+                if self.sample >= t:
+                    return
+                self._bit(self.level)
+            elif state == WAIT_DATA:
+                if t < self.idle_at:
+                    return
+                kind, data = frame_kind(bytes(self.data))
+                self._emit(self.stop + self.bit / 2, data, kind)
+                self.state = BUS_IDLE
+            elif state == WAIT_IDLE:
+                if not self.level or t < self.rise + self.idle_len:
+                    return
+                self.state = BUS_IDLE
+            else:
+                return
+
+    def deadline(self):
+        """When the frame on the line ends if the line does not change any
+        more, None if there is no frame."""
+        if self.state == DATA:
+            return self.t0 + 9.5 * self.bit + self.idle_len
+        if self.state == WAIT_DATA:
+            return self.idle_at
+        return None
+
+    def finish(self, t):
+        """End of the waveform: a frame still waiting for the idle time ends."""
+        self.advance(t)
+        if self.state == WAIT_DATA:
+            self.advance(self.idle_at)
+
+    def _byte(self, t, bit):
+        self.state = DATA
+        self.t0 = t
+        self.bit = bit
+        self.k = 0
+        self.byte = 0
+        self.sample = t + bit / 2
+
+    def _bit(self, level):
+        k = self.k
+        if k == 0:
+            if level:
+                return self._fail('error')
+        elif k < 9:
+            if level:
+                self.byte |= 1 << (k - 1)
+        else:
+            if not level:
+                return self._fail('break' if self.byte == 0 else 'error')
+            self.data.append(self.byte)
+            self.stop = self.sample
+            self.idle_at = self.sample + self.idle_len
+            self.state = WAIT_DATA
+            return
+        self.k = k + 1
+        self.sample = self.t0 + (k + 1.5) * self.bit
+
+    def _fail(self, kind):
+        if kind == 'break' and self.data:
+            kind = 'error'
+        self._emit(self.sample + self.bit / 2, bytes(self.data), kind)
+        self.state = WAIT_IDLE
+
+    def _emit(self, end, data, kind):
+        gap = None if self.last_end is None else self.start - self.last_end
+        self.last_end = end
+        if self.on_frame:
+            self.on_frame(Frame(self.start, end, data, kind, gap))
@@ -0,0 +1,121 @@
+# This Source Code Form is subject to the terms of the Mozilla
+# Public License, v. 2.0. If a copy of the MPL was not distributed
+# with this file, You can obtain one at https://mozilla.org/MPL/2.0/.
+# Notice: The scope granted to MPL excludes the ASIC industry.
+#
+# Copyright (c) 2017 DUKELEC, All rights reserved.
+#
+# Author: Duke Fong <d@d-l.io>
+#
+
+"""Frame buffers filled in place and reused, for the test and host paths.
+
+A FrameBuf is a bytearray of the largest frame and the length in use, a
+csr burst or a host transfer writes into it through a memoryview, and it
+compares with bytes without a copy. A FramePool allocates some once, get()
+one and put() it back (or release() it) when the frame is done:
+
+  pool = FramePool(8)
+  buf = await node.read_rx(len_ + 3, pool.get())
+  if buf != expected:
+      log(f'mismatch: {buf.hex()}')
+  buf.release()
+
+payload(len_) makes the usual 0, 1, 2 ... test payload in one slice.
+"""
+
+MAX_FRAME = 258 # 3 bytes of header, 253 of data, 2 of crc
+
+_RAMP = bytes(range(256)) * 2
+
+
+def payload(len_, start=0):
+    """bytes (start + i) & 0xff for i in range(len_)"""
+    start &= 0xff
+    if len_ <= 256:
+        return _RAMP[start:start + len_]
+    return (_RAMP[start:256] + _RAMP * (len_ // 256 + 1))[:len_]
+
+
+class FrameBuf:
+    __slots__ = ('buf', 'view', 'len', 'pool', 'free')
+
+    def __init__(self, size=MAX_FRAME, pool=None):
+        self.buf = bytearray(size)
+        self.view = memoryview(self.buf)
+        self.len = 0
+        self.pool = pool
+        self.free = pool is not None # in the free list of its pool
+
+    def resize(self, len_):
+        """Set the length, return the writable memoryview of it."""
+        if len_ > len(self.buf):
+            self.buf = bytearray(len_)
+            self.view = memoryview(self.buf)
+        self.len = len_
+        return self.view[:len_]
+
+    def set(self, data):
+        self.resize(len(data))[:] = data
+        return self
+
+    @property
+    def data(self):
+        return self.view[:self.len]
+
+    def release(self):
+        if self.pool is not None:
+            self.pool.put(self)
+
+    def __len__(self):
+        return self.len
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            return self.view[:self.len][key]
+        if not -self.len <= key < self.len:
+            raise IndexError('frame index out of range')
+        return self.buf[key % self.len]
+
+    def __iter__(self):
+        return iter(self.view[:self.len])
+
+    def __eq__(self, other):
+        if isinstance(other, FrameBuf):
+            other = other.data
+        return self.view[:self.len] == other
+
+    def __bytes__(self):
+        return bytes(self.view[:self.len])
+
+    def hex(self, *args):
+        return self.view[:self.len].hex(*args)
+
+    def __repr__(self):
+        return f'FrameBuf({self.hex()})'
+
+
+class FramePool:
+    """count buffers of size bytes, get() allocates more once they are all out.
+    A buffer put back twice raises ValueError: it would be handed out twice."""
+
+    def __init__(self, count=8, size=MAX_FRAME):
+        self.size = size
+        self.free = [FrameBuf(size, self) for _ in range(count)]
+        self.allocated = count
+
+    def get(self):
+        if self.free:
+            buf = self.free.pop()
+        else:
+            self.allocated += 1
+            buf = FrameBuf(self.size, self)
+        buf.free = False
+        return buf
+
+    def put(self, buf):
+        if buf.free:
+            raise ValueError(f'frame buffer released twice: {buf!r}')
+        buf.len = 0
+        buf.free = True
+        self.free.append(buf)
@@ -0,0 +1,168 @@
+# This Source Code Form is subject to the terms of the Mozilla
+# Public License, v. 2.0. If a copy of the MPL was not distributed
+# with this file, You can obtain one at https://mozilla.org/MPL/2.0/.
+# Notice: The scope granted to MPL excludes the ASIC industry.
+#
+# Copyright (c) 2017 DUKELEC, All rights reserved.
+#
+# Author: Duke Fong <d@d-l.io>
+#
+
+"""Hosts of pycdbus.cdctl on Linux: spidev and i2c-dev, by ioctl only.
+
+  SpidevHost('/dev/spidev0.0', speed=20000000)           for cdctl.Spi
+  SpidevHost('/dev/spidev0.0', speed=..., width=4)       for cdctl.Qspi
+  I2cDevHost('/dev/i2c-1')                               for cdctl.I2c
+  GpioIrq(23)                                            for cdctl.RxEngine
+
+A transfer is one SPI_IOC_MESSAGE / I2C_RDWR, the chip select stays low
+(no stop condition) between its parts.
+"""
+
+import os, fcntl, ctypes, select, asyncio
+
+# linux/spi/spidev.h
+_SPI_IOC_MAGIC = ord('k')
+_SPI_IOC_WR_MODE = 0x40000000 | 1 << 16 | _SPI_IOC_MAGIC << 8 | 1
+_SPI_IOC_WR_MAX_SPEED_HZ = 0x40000000 | 4 << 16 | _SPI_IOC_MAGIC << 8 | 4
+
+
+class _SpiIocTransfer(ctypes.Structure):
+    _fields_ = [('tx_buf', ctypes.c_uint64), ('rx_buf', ctypes.c_uint64), ('len', ctypes.c_uint32),
+                ('speed_hz', ctypes.c_uint32), ('delay_usecs', ctypes.c_uint16), ('bits_per_word', ctypes.c_uint8),
+                ('cs_change', ctypes.c_uint8), ('tx_nbits', ctypes.c_uint8), ('rx_nbits', ctypes.c_uint8),
+                ('word_delay_usecs', ctypes.c_uint8), ('pad', ctypes.c_uint8)]
+
+
+def _spi_ioc_message(n):
+    return 0x40000000 | (ctypes.sizeof(_SpiIocTransfer) * n) << 16 | _SPI_IOC_MAGIC << 8
+
+
+# linux/i2c-dev.h, linux/i2c.h
+_I2C_RDWR = 0x0707
+_I2C_M_RD = 0x0001
+
+
+class _I2cMsg(ctypes.Structure):
+    _fields_ = [('addr', ctypes.c_uint16), ('flags', ctypes.c_uint16), ('len', ctypes.c_uint16),
+                ('buf', ctypes.c_void_p)]
+
+
+class _I2cRdwrIoctlData(ctypes.Structure):
+    _fields_ = [('msgs', ctypes.c_void_p), ('nmsgs', ctypes.c_uint32)]
+
+
+def _rx_buf(len_, into=None):
+    # into: the caller's buffer (bytearray, memoryview of one), the kernel writes it in place
+    if into is None:
+        return ctypes.create_string_buffer(len_)
+    return (ctypes.c_char * len_).from_buffer(into)
+
+
+class SpidevHost:
+    """width: 1 for SPI, 4 for QSPI (the controller must support quad)."""
+
+    def __init__(self, path='/dev/spidev0.0', speed=20000000, mode=0, width=1):
+        self.fd = os.open(path, os.O_RDWR)
+        self.speed = speed
+        self.width = width
+        fcntl.ioctl(self.fd, _SPI_IOC_WR_MODE, ctypes.c_uint8(mode))
+        fcntl.ioctl(self.fd, _SPI_IOC_WR_MAX_SPEED_HZ, ctypes.c_uint32(speed))
+
+    def close(self):
+        os.close(self.fd)
+
+    def _xfer(self, tx=None, rx=None, len_=0):
+        return _SpiIocTransfer(tx_buf=ctypes.addressof(tx) if tx is not None else 0,
+                               rx_buf=ctypes.addressof(rx) if rx is not None else 0,
+                               len=len_, speed_hz=self.speed, bits_per_word=8,
+                               tx_nbits=self.width if tx is not None else 0,
+                               rx_nbits=self.width if rx is not None else 0)
+
+    async def transfer(self, tx, rx_len=0, dummy=0, into=None):
+        """into: a writable buffer of rx_len bytes the kernel reads into."""
+        # the turnaround bytes are read, not driven: the slave may drive the lines already
+        tx_buf = ctypes.create_string_buffer(bytes(tx), len(tx))
+        parts = [self._xfer(tx_buf, None, len(tx))]
+        if dummy:
+            parts.append(self._xfer(None, ctypes.create_string_buffer(dummy), dummy))
+        rx_buf = None
+        if rx_len:
+            rx_buf = _rx_buf(rx_len, into)
+            parts.append(self._xfer(None, rx_buf, rx_len))
+        msg = (_SpiIocTransfer * len(parts))(*parts)
+        fcntl.ioctl(self.fd, _spi_ioc_message(len(parts)), msg)
+        if into is not None:
+            return into
+        return rx_buf.raw if rx_buf else b''
+
+
+class I2cDevHost:
+    def __init__(self, path='/dev/i2c-1'):
+        self.fd = os.open(path, os.O_RDWR)
+
+    def close(self):
+        os.close(self.fd)
+
+    def _rdwr(self, msgs):
+        arr = (_I2cMsg * len(msgs))(*msgs)
+        data = _I2cRdwrIoctlData(msgs=ctypes.addressof(arr), nmsgs=len(msgs))
+        fcntl.ioctl(self.fd, _I2C_RDWR, data)
+
+    async def write(self, dev, data):
+        buf = ctypes.create_string_buffer(bytes(data), len(data))
+        self._rdwr([_I2cMsg(addr=dev, flags=0, len=len(data), buf=ctypes.addressof(buf))])
+
+    async def write_read(self, dev, data, rx_len, into=None):
+        wbuf = ctypes.create_string_buffer(bytes(data), len(data))
+        rbuf = _rx_buf(rx_len, into)
+        self._rdwr([_I2cMsg(addr=dev, flags=0, len=len(data), buf=ctypes.addressof(wbuf)),
+                    _I2cMsg(addr=dev, flags=_I2C_M_RD, len=rx_len, buf=ctypes.addressof(rbuf))])
+        return rbuf.raw if into is None else into
+
+
+class GpioIrq:
+    """The int_n pin (active low) on a sysfs GPIO, the edge interrupt wakes
+    the asyncio loop up: /sys/class/gpio/gpio<num>/ must be exported.
+
+    A sysfs value is always readable, an edge is signalled by POLLPRI |
+    POLLERR only, so the loop waits on an epoll of these events instead of a
+    reader of the value itself, which would fire at once every time."""
+
+    def __init__(self, num, active_low=True):
+        path = f'/sys/class/gpio/gpio{num}'
+        with open(f'{path}/direction', 'w') as f:
+            f.write('in')
+        with open(f'{path}/edge', 'w') as f:
+            f.write('both')
+        self.fd = os.open(f'{path}/value', os.O_RDONLY)
+        self.ep = select.epoll()
+        self.ep.register(self.fd, select.EPOLLPRI | select.EPOLLERR)
+        self.active = b'0' if active_low else b'1'
+
+    def close(self):
+        self.ep.close()
+        os.close(self.fd)
+
+    def level(self):
+        """The value, reading it also clears the pending edge event."""
+        os.lseek(self.fd, 0, os.SEEK_SET)
+        return os.read(self.fd, 2)[:1]
+
+    async def wait(self):
+        """Return once the line is active, at once if it is."""
+        loop = asyncio.get_running_loop()
+        while self.level() != self.active:
+            changed = loop.create_future()
+
+            def edge():
+                self.ep.poll(0) # level triggered, the next level() clears it
+                if not changed.done():
+                    changed.set_result(None)
+
+            # an edge after the level() above is still pending in the epoll
+            loop.add_reader(self.ep.fileno(), edge)
+            try:
+                await changed
+            finally:
+                loop.remove_reader(self.ep.fileno())
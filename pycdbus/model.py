@@ -0,0 +1,619 @@
+# This Source Code Form is subject to the terms of the Mozilla
+# Public License, v. 2.0. If a copy of the MPL was not distributed
+# with this file, You can obtain one at https://mozilla.org/MPL/2.0/.
+# Notice: The scope granted to MPL excludes the ASIC industry.
+#
+# Copyright (c) 2017 DUKELEC, All rights reserved.
+#
+# Author: Duke Fong <d@d-l.io>
+#
+
+"""Bit-time behavioral model of the CDBUS IP (hdl/cdbus.v).
+
+The model steps from one bus transmission to the next instead of clock by
+clock. Time is in seconds (float), bit times come from each node's own
+sys_clk and DIV_LS / DIV_HS, so nodes with inaccurate clocks work too.
+
+  Node   cd_csr (CD_CHIP_SELECT, CD_CSR_NO_LATENCY), cd_tx_ram, cd_rx_ram,
+         cd_rx_bytes; the host accesses it by read() / write() and the
+         burst versions, each call is one chip select cycle.
+  Bus    wired-AND half-duplex bus: works out when each node leaves the
+         WAIT state of cd_tx_ser (TX_PRE / BS_PRE / DATA), resolves the
+         arbitration field on the first byte (sampled at 3/4 bit), then
+         every node decodes the resulting waveform like cd_rx_des
+         (sampled at 1/2 bit, resync at each start bit).
+
+Not modelled: the full-duplex mode (a REG_SETTING write of it raises
+ValueError), pin inversion / tx_en_inner, and the few clocks of synchronizer
+latency (SYNC_CLKS only decides whether two nodes start "at the same time").
+
+Example:
+  bus = Bus([Node('a'), Node('b')])
+  bus.nodes[0].write(REG_FILTER, 0x01)
+  bus.nodes[0].write_burst(REG_DAT, b'\\x01\\x02\\x01\\xcd')
+  bus.run_until(lambda: bus.nodes[1].irq)
+"""
+
+from bisect import bisect_right
+from .crc import crc16, modbus_crc
+from .regs import *
+from .rx_ram import RxRam
+
+# a node leaving WAIT less than SYNC_CLKS (of its clock) after the first
+# falling edge of another node has not seen the bus busy yet
+# (rx_d in cdbus.v, rx_d in cd_rx_des.v and the state register)
+SYNC_CLKS = 4
+
+# a receiver whose bit times are within this relative error of the sender's
+# samples every bit of a frame correctly, skip the waveform decoding for it
+RATE_TOLERANCE = 0.02
+
+
+class TxRam:
+    """hdl/cd_tx_ram.v: two pages of 256 bytes."""
+
+    def __init__(self):
+        self.pages = [bytearray(256), bytearray(256)]
+        self.wr_sel = 0
+        self.rd_sel = 0
+        self.dirty = [False, False]
+
+    @property
+    def unread(self):
+        return self.dirty[self.rd_sel]
+
+    @property
+    def full(self):
+        return self.dirty[self.rd_sel ^ 1]
+
+    def write(self, addr, byte):
+        self.pages[self.wr_sel][addr & 0xff] = byte
+
+    def wr_done(self):
+        if not self.dirty[self.wr_sel]:
+            self.dirty[self.wr_sel] = True
+            self.wr_sel ^= 1
+
+    def wr_drop(self):
+        self.wr_sel = self.rd_sel ^ 1 if self.unread else self.rd_sel
+        self.dirty[self.rd_sel ^ 1] = False
+
+    def page(self):
+        return self.pages[self.rd_sel]
+
+    def rd_done(self):
+        if self.unread:
+            self.dirty[self.rd_sel] = False
+            self.rd_sel ^= 1
+
+
+class Node:
+    def __init__(self, name=None, sys_clk=40000000, div_ls=346, div_hs=346, i_width=6, b_width=11):
+        self.name = name
+        self.sys_clk = sys_clk
+        self.bus = None
+        self.rx_ram = RxRam(i_width, b_width)
+        self.reset(div_ls, div_hs)
+
+    def reset(self, div_ls=346, div_hs=346):
+        self.setting = 0x10
+        self.idle_wait_len = 10
+        self.tx_permit_len = 20
+        self.max_idle_len = 200
+        self.tx_pre_len = 1
+        self.filter = 0xff
+        self.filter_m0 = 0xff
+        self.filter_m1 = 0xff
+        self.filter_msk0 = 0xff
+        self.filter_msk1 = 0xff
+        self.div_ls = div_ls
+        self.div_hs = div_hs
+        self.int_mask = 0
+
+        self.tx_error_flag = False
+        self.cd_flag = False
+        self.rx_error_flag = False
+        self.rx_lost_flag = False
+        self.rx_break_flag = False
+        self.has_break = False
+        self.h_val_bkup = 0
+
+        self.rx_ram.clean_all()
+        self.tx_ram = TxRam()
+        self.tx_ready_at = 0.0      # when the pending tx page or break became ready
+        self.quiet_since = self.now # idle_cnt of cd_rx_des counts from here
+
+    def __repr__(self):
+        return f'Node({self.name!r})'
+
+    @property
+    def now(self):
+        return self.bus.t if self.bus else 0.0
+
+    # settings
+
+    @property
+    def mode(self):
+        return (self.setting >> 4) & 3
+
+    @property
+    def arbitration(self):
+        return self.mode == MODE_ARBITRATION
+
+    @property
+    def not_drop(self):
+        return bool(self.setting & BIT_SETTING_NO_DROP)
+
+    @property
+    def user_crc(self):
+        return bool(self.setting & BIT_SETTING_USER_CRC)
+
+    @property
+    def bit_ls(self):
+        return (self.div_ls + 1) / self.sys_clk
+
+    @property
+    def bit_hs(self):
+        return (self.div_hs + 1) / self.sys_clk
+
+    # status
+
+    @property
+    def idle_at(self):
+        return self.quiet_since + self.idle_wait_len * self.bit_ls
+
+    @property
+    def bus_idle(self):
+        return self.now >= self.idle_at
+
+    @property
+    def int_flag(self):
+        idle = self.bus_idle
+        val = (not idle) << 15 | idle << 14 | (self.rx_ram.unread_len & 0x3f) << 8
+        val |= self.tx_error_flag << 7 | self.cd_flag << 6
+        val |= (not self.tx_ram.unread) << 5 | (not self.tx_ram.full) << 4
+        val |= (self.rx_ram.rd_err if self.not_drop else self.rx_error_flag) << 3
+        val |= self.rx_lost_flag << 2 | self.rx_break_flag << 1 | self.rx_ram.unread
+        return val
+
+    @property
+    def irq(self):
+        return (self.int_flag & self.int_mask) != 0
+
+    # csr, one chip select cycle per call
+
+    def read(self, address):
+        return self.read_burst(address, 1)[0]
+
+    def write(self, address, data):
+        self.write_burst(address, (data,))
+
+    def read_burst(self, address, len_):
+        self._cs_start()
+        if address == REG_DAT and len_ <= 256:
+            ret = self.rx_ram.read_bytes(0, len_)
+            self.has_read_rx = len_ != 0
+            self.h_val_bkup = 0
+        else:
+            ret = bytes(self._read(address) for _ in range(len_))
+        self._cs_end()
+        return ret
+
+    def write_burst(self, address, data):
+        self._cs_start()
+        if address == REG_DAT and len(data) <= 256:
+            self.tx_ram.pages[self.tx_ram.wr_sel][:len(data)] = data
+            self.has_write_tx = len(data) != 0
+            self.h_val_bkup = 0
+        else:
+            for val in data:
+                self._write(address, val)
+        self._cs_end()
+
+    def _cs_start(self):
+        self.snapshot = flag = self.int_flag
+        self.int_flag_shift = [flag & 0xff, self.rx_ram.rd_len, flag >> 8]
+        self.rx_rd_addr = 0
+        self.tx_wr_addr = 0
+        self.has_read_rx = False
+        self.has_write_tx = False
+
+    def _cs_end(self):
+        if self.has_read_rx:
+            self.rx_ram.rd_done()
+        if self.has_write_tx:
+            self._tx_wr_done()
+
+    def _tx_wr_done(self):
+        was_unread = self.tx_ram.unread
+        self.tx_ram.wr_done()
+        if not was_unread:
+            self.tx_ready_at = self.now
+
+    def _read(self, address):
+        self.h_val_bkup = 0
+        if address == REG_INT_FLAG_L:
+            snapshot = self.snapshot
+            if snapshot & BIT_FLAG_RX_ERROR:
+                self.rx_error_flag = False
+            if snapshot & BIT_FLAG_RX_LOST:
+                self.rx_lost_flag = False
+            if snapshot & BIT_FLAG_RX_BREAK:
+                self.rx_break_flag = False
+            if snapshot & BIT_FLAG_TX_CD:
+                self.cd_flag = False
+            if snapshot & BIT_FLAG_TX_ERROR:
+                self.tx_error_flag = False
+            # INT_FLAG_L, RX_LEN, INT_FLAG_H in a burst
+            return self.int_flag_shift.pop(0) if self.int_flag_shift else 0
+        if address == REG_DAT:
+            val = self.rx_ram.read(self.rx_rd_addr)
+            self.rx_rd_addr = (self.rx_rd_addr + 1) & 0xff
+            self.has_read_rx = True
+            return val
+        return {
+            REG_VERSION:         DFT_VERSION,
+            REG_SETTING:         self.setting,
+            REG_IDLE_WAIT_LEN:   self.idle_wait_len,
+            REG_TX_PERMIT_LEN_L: self.tx_permit_len & 0xff,
+            REG_TX_PERMIT_LEN_H: self.tx_permit_len >> 8,
+            REG_MAX_IDLE_LEN_L:  self.max_idle_len & 0xff,
+            REG_MAX_IDLE_LEN_H:  self.max_idle_len >> 8,
+            REG_TX_PRE_LEN:      self.tx_pre_len,
+            REG_FILTER:          self.filter,
+            REG_DIV_LS_L:        self.div_ls & 0xff,
+            REG_DIV_LS_H:        self.div_ls >> 8,
+            REG_DIV_HS_L:        self.div_hs & 0xff,
+            REG_DIV_HS_H:        self.div_hs >> 8,
+            REG_INT_MASK_L:      self.int_mask & 0xff,
+            REG_INT_MASK_H:      self.int_mask >> 8,
+            REG_RX_LEN:          self.rx_ram.rd_len,
+            REG_FILTER_M0:       self.filter_m0,
+            REG_FILTER_M1:       self.filter_m1,
+            REG_FILTER_MSK0:     self.filter_msk0,
+            REG_FILTER_MSK1:     self.filter_msk1
+        }.get(address, 0) # INT_FLAG_H is not mapped without latency, read 3 bytes of INT_FLAG_L
+
+    def _write(self, address, val):
+        h_val, self.h_val_bkup = self.h_val_bkup, 0
+        if address == REG_SETTING:
+            if (val >> 4) & 3 == MODE_FULL_DUPLEX:
+                raise ValueError(f'{self}: the full-duplex mode is not modelled, the bus is half-duplex')
+            self.setting = val
+        elif address == REG_IDLE_WAIT_LEN:
+            self.idle_wait_len = val
+        elif address == REG_TX_PERMIT_LEN_L:
+            self.tx_permit_len = (h_val & 3) << 8 | val
+        elif address == REG_MAX_IDLE_LEN_L:
+            self.max_idle_len = (h_val & 3) << 8 | val
+        elif address in (REG_TX_PERMIT_LEN_H, REG_MAX_IDLE_LEN_H, REG_DIV_LS_H, REG_DIV_HS_H):
+            self.h_val_bkup = val
+        elif address == REG_TX_PRE_LEN:
+            self.tx_pre_len = val & 3
+        elif address == REG_FILTER:
+            self.filter = val
+        elif address == REG_DIV_LS_L:
+            self.div_ls = h_val << 8 | val
+        elif address == REG_DIV_HS_L:
+            self.div_hs = h_val << 8 | val
+        elif address == REG_INT_MASK_L:
+            self.int_mask = (self.int_mask & 0xff00) | val
+        elif address == REG_INT_MASK_H:
+            self.int_mask = (self.int_mask & 0xff) | val << 8
+        elif address == REG_DAT:
+            self.tx_ram.write(self.tx_wr_addr, val)
+            self.tx_wr_addr = (self.tx_wr_addr + 1) & 0xff
+            self.has_write_tx = True
+        elif address == REG_CTRL:
+            if val & BIT_RX_RST:
+                self.rx_ram.clean_all()
+            if val & BIT_RX_CLR_PENDING:
+                self.rx_ram.rd_done()
+            if val & BIT_TX_ABORT:
+                self.tx_ram.rd_done()
+            if val & BIT_TX_DROP:
+                self.tx_ram.wr_drop()
+            if val & BIT_TX_SEND_BREAK:
+                if not self.has_break:
+                    self.tx_ready_at = self.now
+                self.has_break = True
+            if val & BIT_TX_START:
+                self._tx_wr_done()
+        elif address == REG_FILTER_M0:
+            self.filter_m0 = val
+        elif address == REG_FILTER_M1:
+            self.filter_m1 = val
+        elif address == REG_FILTER_MSK0:
+            self.filter_msk0 = val
+        elif address == REG_FILTER_MSK1:
+            self.filter_msk1 = val
+
+    # cd_tx_bytes
+
+    def tx_frame(self):
+        """Bytes of the pending tx page as sent on the bus, include crc."""
+        page = self.tx_ram.page()
+        len_ = page[2] + 3
+        if self.user_crc:
+            return bytes(page[i & 0xff] for i in range(len_ + 2))
+        data = bytes(page[i & 0xff] for i in range(len_))
+        return data + modbus_crc(data)
+
+    # cd_rx_bytes
+
+    def rx_bytes(self, events):
+        """Feed what cd_rx_des decoded between two bus idles.
+        events: byte values, may end with 'break' or 'error'."""
+        if isinstance(events, (bytes, bytearray)):
+            data, tail = events, None
+        else:
+            data = bytearray()
+            tail = None
+            for ev in events:
+                if isinstance(ev, str):
+                    tail = ev
+                    break
+                data.append(ev)
+        n = len(data)
+        data_len = data[2] if n > 2 else 0
+        complete = n > data_len + 4
+        if complete:
+            data = data[:data_len + 5] # the rest is ignored until bus idle
+        elif tail == 'break':
+            self.rx_break_flag = True
+        if n:
+            self.rx_ram.write_bytes(data)
+
+        promiscuous = self.filter == 0xff
+        drop = False
+        if n > 0 and data[0] == self.filter:
+            drop = not promiscuous
+        if n > 1 and data[1] != self.filter and data[1] != 0xff and not self._multicast(data[1]):
+            drop = not promiscuous
+        if drop:
+            return
+        if complete:
+            ok = (crc16(data) == 0 or self.user_crc) and data_len <= 253
+            self._rx_switch(data, data_len, ok)
+        elif n > 1: # bus idle before the frame completes
+            self._rx_switch(data, data_len, False)
+
+    def _multicast(self, addr):
+        return (addr & self.filter_msk0) == self.filter_m0 or (addr & self.filter_msk1) == self.filter_m1
+
+    def _rx_switch(self, data, data_len, ok):
+        if not ok:
+            self.rx_error_flag = True
+            if not self.not_drop:
+                return
+        wr_len = min(len(data) - 1, 255) if self.not_drop else data_len
+        if not self.rx_ram.switch(wr_len, not ok):
+            self.rx_lost_flag = True
+
+
+class _Tx:
+    """One node driving the bus in a transmission."""
+
+    def __init__(self, node, start, kind):
+        self.node = node
+        self.start = start # time leaving WAIT
+        self.kind = kind   # 'data', 'break' (CTRL) or 'bs_break' (max idle in BS mode)
+        pre = 0 if node.arbitration else node.tx_pre_len
+        self.edge = start + pre * node.bit_ls # TX_PRE / BS_PRE before the first bit
+        self.stop = None   # lost the arbitration at this time
+        if kind == 'data':
+            self.frame = node.tx_frame()
+            self.first_bits = [0] + [(self.frame[0] >> i) & 1 for i in range(8)] + [1]
+            self.end = self.edge + 10 * node.bit_ls + 10 * (len(self.frame) - 1) * node.bit_hs
+        else:
+            self.frame = None
+            self.first_bits = [0] * 10
+            self.end = self.edge + 10 * node.bit_ls
+        self._lows = None
+
+    @property
+    def lows(self):
+        if self._lows is None:
+            self._lows = self._make_lows()
+            self.starts = [s for s, _ in self._lows]
+        return self._lows
+
+    def _make_lows(self):
+        lows = []
+        t = self.edge
+        def put(level, duration):
+            nonlocal t
+            if not level:
+                if lows and lows[-1][1] == t:
+                    lows[-1][1] = t + duration
+                else:
+                    lows.append([t, t + duration])
+            t += duration
+        if self.frame is None:
+            put(0, 10 * self.node.bit_ls)
+            return lows
+        for n, byte in enumerate(self.frame):
+            bit = self.node.bit_hs if n else self.node.bit_ls
+            put(0, bit)
+            for i in range(8):
+                put((byte >> i) & 1, bit)
+            put(1, bit)
+        return lows
+
+    def low_at(self, t):
+        if self.stop is not None and t >= self.stop:
+            return False
+        lows = self.lows
+        i = bisect_right(self.starts, t) - 1
+        return i >= 0 and t < lows[i][1]
+
+    def truncated_lows(self):
+        if self.stop is None:
+            return self.lows
+        return [[s, min(e, self.stop)] for s, e in self.lows if s < self.stop]
+
+
+def _same_rate(a, b):
+    if a is b:
+        return True
+    return abs(a.bit_ls - b.bit_ls) <= b.bit_ls * RATE_TOLERANCE and \
+           abs(a.bit_hs - b.bit_hs) <= b.bit_hs * RATE_TOLERANCE
+
+
+def _merge(lows):
+    ret = []
+    for s, e in sorted(lows):
+        if ret and s <= ret[-1][1]:
+            ret[-1][1] = max(ret[-1][1], e)
+        else:
+            ret.append([s, e])
+    return ret
+
+
+class Bus:
+    """Half-duplex bus shared by the nodes, 0 is dominant."""
+
+    def __init__(self, nodes=()):
+        self.t = 0.0
+        self.nodes = []
+        for node in nodes:
+            self.add(node)
+
+    def add(self, node):
+        node.bus = self
+        node.quiet_since = self.t
+        self.nodes.append(node)
+        return node
+
+    def _pending(self, node):
+        """(time leaving WAIT, kind) of the next transmission of node, or None."""
+        has_data = node.tx_ram.unread
+        if not has_data and not node.has_break:
+            return None
+        kind = 'break' if node.has_break else 'data'
+        idle_at = node.idle_at
+        permit = idle_at + (node.tx_permit_len + 1) * node.bit_ls
+        ready = max(node.tx_ready_at, self.t)
+        if node.mode != MODE_BREAK_SYNC:
+            return max(permit, ready), kind
+        # tx_permit is a single pulse in BS mode
+        if node.tx_ready_at <= permit and permit >= self.t:
+            return permit, kind
+        if not has_data:
+            return None
+        return max(idle_at + (node.max_idle_len + 1) * node.bit_ls, ready), 'bs_break'
+
+    def step(self, until=None):
+        """Run the next transmission if it starts no later than until,
+        return a dict describing it, or None."""
+        pending = []
+        for node in self.nodes:
+            p = self._pending(node)
+            if p:
+                pending.append((p[0], node, p[1]))
+        if not pending:
+            return None
+        pending.sort(key=lambda p: p[0])
+        if until is not None and pending[0][0] > until:
+            return None
+
+        txs = [_Tx(pending[0][1], pending[0][0], pending[0][2])]
+        for start, node, kind in pending[1:]:
+            if start < min(tx.edge for tx in txs) + SYNC_CLKS / node.sys_clk:
+                txs.append(_Tx(node, start, kind))
+
+        # arbitration field: a node reading back 0 while sending 1 stops (cd)
+        if len(txs) > 1:
+            samples = sorted(((tx.edge + (k + 0.75) * tx.node.bit_ls, k, tx) for tx in txs
+                              if tx.node.arbitration for k in range(10)), key=lambda s: s[0])
+            for ts, k, tx in samples:
+                if tx.stop is None and tx.first_bits[k] and any(o.low_at(ts) for o in txs if o is not tx):
+                    tx.stop = ts
+
+        end = max(tx.stop if tx.stop is not None else tx.end for tx in txs)
+        self.t = max(self.t, end)
+
+        for tx in txs:
+            node = tx.node
+            if tx.stop is not None:
+                node.cd_flag = True
+            elif tx.kind == 'data':
+                node.tx_ram.rd_done()
+            elif tx.kind == 'break':
+                node.has_break = False
+        lows = None
+        for node in self.nodes:
+            if len(txs) == 1 and _same_rate(node, txs[0].node):
+                events, node.quiet_since = self._decode_fast(node, txs[0])
+            else:
+                if lows is None:
+                    lows = _merge([l for tx in txs for l in tx.truncated_lows()])
+                events, node.quiet_since = self._decode(node, lows)
+            node.rx_bytes(events)
+
+        return {'start': txs[0].start, 'end': end,
+                'tx': [(tx.node, tx.kind, tx.frame, tx.stop is None) for tx in txs]}
+
+    def _decode_fast(self, node, tx):
+        if node.idle_at > tx.edge: # still WAIT_IDLE
+            return [], tx.end
+        if tx.frame is None:
+            return ['break'], tx.end
+        return tx.frame, tx.end - 0.5 * tx.node.bit_hs # middle of the last stop bit
+
+    def _decode(self, node, lows):
+        """cd_rx_des of node over the bus waveform (low intervals),
+        return (events, quiet_since)."""
+        if not lows:
+            return [], node.quiet_since
+        if node.idle_at > lows[0][0]: # still WAIT_IDLE
+            return [], lows[-1][1]
+        starts = [s for s, _ in lows]
+        def low_at(t):
+            i = bisect_right(starts, t) - 1
+            return i >= 0 and t < lows[i][1]
+
+        events = []
+        t = starts[0]
+        bit = node.bit_ls
+        while True:
+            if not low_at(t + 0.5 * bit): # start bit
+                events.append('error')
+                return events, lows[-1][1]
+            data = 0
+            for i in range(8):
+                if not low_at(t + (i + 1.5) * bit):
+                    data |= 1 << i
+            t_stop = t + 9.5 * bit
+            if low_at(t_stop):
+                events.append('break' if data == 0 else 'error')
+                return events, lows[-1][1]
+            events.append(data)
+            # WAIT_DATA: next start bit at high speed, or bus idle
+            j = bisect_right(starts, t_stop)
+            if j == len(starts) or starts[j] >= t_stop + node.idle_wait_len * node.bit_ls:
+                return events, t_stop
+            t = starts[j]
+            bit = node.bit_hs
+
+    def run(self, duration=None, until=None):
+        """Run the transmissions starting before the time limit,
+        or all the pending ones if no limit."""
+        if duration is not None:
+            until = self.t + duration
+        while self.step(until):
+            pass
+        if until is not None:
+            self.t = max(self.t, until)
+
+    def run_until(self, cond, timeout=None):
+        """Step until cond() is true, return False on timeout or no more activity."""
+        limit = None if timeout is None else self.t + timeout
+        while not cond():
+            if not self.step(limit):
+                # a node may still become idle or ready later
+                if limit is None:
+                    return cond()
+                self.t = limit
+                return cond()
+        return True
@@ -0,0 +1,66 @@
+# This Source Code Form is subject to the terms of the Mozilla
+# Public License, v. 2.0. If a copy of the MPL was not distributed
+# with this file, You can obtain one at https://mozilla.org/MPL/2.0/.
+# Notice: The scope granted to MPL excludes the ASIC industry.
+#
+# Copyright (c) 2017 DUKELEC, All rights reserved.
+#
+# Author: Duke Fong <d@d-l.io>
+#
+
+"""Register map of the CDBUS IP, see the Registers section of the Readme."""
+
+DFT_VERSION         = 0x0f
+
+REG_VERSION         = 0x00
+REG_SETTING         = 0x02
+REG_IDLE_WAIT_LEN   = 0x04
+REG_TX_PERMIT_LEN_L = 0x05
+REG_TX_PERMIT_LEN_H = 0x06
+REG_MAX_IDLE_LEN_L  = 0x07
+REG_MAX_IDLE_LEN_H  = 0x08
+REG_TX_PRE_LEN      = 0x09
+REG_FILTER          = 0x0b
+REG_DIV_LS_L        = 0x0c
+REG_DIV_LS_H        = 0x0d
+REG_DIV_HS_L        = 0x0e
+REG_DIV_HS_H        = 0x0f
+REG_INT_MASK_L      = 0x10
+REG_INT_MASK_H      = 0x11
+REG_INT_FLAG_L      = 0x12
+REG_INT_FLAG_H      = 0x13
+REG_RX_LEN          = 0x14
+REG_DAT             = 0x15
+REG_CTRL            = 0x16
+REG_FILTER_M0       = 0x1a
+REG_FILTER_M1       = 0x1b
+REG_FILTER_MSK0     = 0x1c
+REG_FILTER_MSK1     = 0x1d
+
+BIT_SETTING_RX_INVERT       = 1 << 6
+BIT_SETTING_NO_DROP         = 1 << 3
+BIT_SETTING_USER_CRC        = 1 << 2
+BIT_SETTING_TX_INVERT       = 1 << 1
+BIT_SETTING_TX_PUSH_PULL    = 1 << 0
+
+BIT_FLAG_TX_ERROR           = 1 << 7
+BIT_FLAG_TX_CD              = 1 << 6
+BIT_FLAG_TX_BUF_CLEAN       = 1 << 5
+BIT_FLAG_TX_BUF_FREE        = 1 << 4
+BIT_FLAG_RX_ERROR           = 1 << 3
+BIT_FLAG_RX_LOST            = 1 << 2
+BIT_FLAG_RX_BREAK           = 1 << 1
+BIT_FLAG_RX_PENDING         = 1 << 0
+
+BIT_RX_RST                  = 1 << 7
+BIT_RX_CLR_PENDING          = 1 << 4
+BIT_TX_ABORT                = 1 << 3
+BIT_TX_DROP                 = 1 << 2
+BIT_TX_SEND_BREAK           = 1 << 1
+BIT_TX_START                = 1 << 0
+
+# SETTING[5:4]
+MODE_TRADITIONAL            = 0
+MODE_ARBITRATION            = 1 # CDBUS-A, default
+MODE_BREAK_SYNC             = 2 # CDBUS-BS
+MODE_FULL_DUPLEX            = 3
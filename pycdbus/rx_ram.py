@@ -0,0 +1,199 @@
+# This Source Code Form is subject to the terms of the Mozilla
+# Public License, v. 2.0. If a copy of the MPL was not distributed
+# with this file, You can obtain one at https://mozilla.org/MPL/2.0/.
+# Notice: The scope granted to MPL excludes the ASIC industry.
+#
+# Copyright (c) 2017 DUKELEC, All rights reserved.
+#
+# Author: Duke Fong <d@d-l.io>
+#
+
+"""Model of hdl/cd_rx_ram.v.
+
+The RX buffer (2^B_WIDTH bytes) is split into 2^I_WIDTH fragments of
+2^(B_WIDTH-I_WIDTH) bytes. A frame takes as many continuous fragments as it
+needs (wrapping around), the first fragment of each frame is marked in the
+dirty bitmap and its index entry keeps {err, frag_amount - 1, len}.
+
+push() stores a whole frame at once, e.g. the dirty bitmap expected after
+a list of frames without reading any:
+  ram = RxRam()
+  for data_len in sizes:
+      ram.push(data_len)
+
+plan() estimates the RX lost probability of a buffer size for some
+traffic, see tools/rx_ram_plan.py.
+"""
+
+import random
+
+
+class RxRam:
+    def __init__(self, i_width=6, b_width=11):
+        assert 0 < b_width - i_width <= 8
+        self.i_width = i_width
+        self.b_width = b_width
+        self.s_width = b_width - i_width # fragment size width
+        self.entries = 1 << i_width
+        self.buf = bytearray(1 << b_width)
+        self.idx_out = (False, 0, 0) # read port of the index table, only enabled for a dirty rd_sel
+        self.clean_all()
+
+    def clean_all(self): # rd_done_all
+        self.wr_sel = 0
+        self.rd_sel = 0
+        self.dirty = 0
+        self.wr_cancel = False
+        self.wr_frag_amount = 0 # fragments of the frame being written, minus one
+        self.unread_len = 0
+        self.idx = [(False, 0, 0)] * self.entries # (err, frag_amount, len)
+
+    def is_dirty(self, sel):
+        return (self.dirty >> (sel % self.entries)) & 1
+
+    # write side, driven by rx_bytes
+
+    def write(self, addr, byte):
+        if self.wr_cancel:
+            return
+        frag = addr >> self.s_width
+        if self.is_dirty(self.wr_sel + frag):
+            self.wr_cancel = True
+        else:
+            self.buf[((self.wr_sel << self.s_width) + addr) % len(self.buf)] = byte
+            self.wr_frag_amount = frag
+
+    def write_bytes(self, data):
+        """Same as write() for data[i] at address i, one dirty check per fragment."""
+        size = 1 << self.s_width
+        for frag, addr in enumerate(range(0, min(len(data), 256), size)):
+            if self.wr_cancel:
+                return
+            if self.is_dirty(self.wr_sel + frag):
+                self.wr_cancel = True
+                return
+            chunk = data[addr:addr + size]
+            pos = ((self.wr_sel << self.s_width) + addr) % len(self.buf)
+            self.buf[pos:pos + len(chunk)] = chunk # fragments never cross the end of buf
+            self.wr_frag_amount = frag
+
+    def push(self, data_len, err=False):
+        """Receive a frame of data_len user bytes (header and crc added, up to
+        256 bytes are stored), return False if it is lost."""
+        last_frag = (min(data_len + 5, 256) - 1) >> self.s_width
+        for frag in range(last_frag + 1):
+            if self.wr_cancel:
+                break
+            if self.is_dirty(self.wr_sel + frag):
+                self.wr_cancel = True
+                break
+            self.wr_frag_amount = frag
+        return self.switch(data_len, err)
+
+    def switch(self, wr_len, err=False):
+        """Commit the frame, return False for switch_fail (RX lost)."""
+        if self.wr_cancel:
+            self.wr_cancel = False
+            return False
+        self.idx[self.wr_sel] = (err, self.wr_frag_amount, wr_len)
+        self.dirty |= 1 << self.wr_sel
+        self.wr_sel = (self.wr_sel + self.wr_frag_amount + 1) % self.entries
+        self.unread_len = (self.unread_len + 1) % self.entries
+        self._idx_read()
+        return True
+
+    # read side, driven by the csr
+
+    @property
+    def unread(self):
+        return self.is_dirty(self.rd_sel)
+
+    def _idx_read(self):
+        if self.unread:
+            self.idx_out = self.idx[self.rd_sel]
+
+    @property
+    def rd_len(self):
+        return self.idx_out[2]
+
+    @property
+    def rd_err(self):
+        return self.idx_out[0]
+
+    def read(self, addr):
+        return self.buf[((self.rd_sel << self.s_width) + addr) % len(self.buf)]
+
+    def read_bytes(self, addr, len_):
+        pos = (self.rd_sel << self.s_width) + addr
+        if pos + len_ <= len(self.buf):
+            return bytes(self.buf[pos:pos + len_])
+        return bytes(self.read(addr + i) for i in range(len_))
+
+    def rd_done(self):
+        if not self.unread:
+            return
+        self.dirty &= ~(1 << self.rd_sel)
+        self.rd_sel = (self.rd_sel + 1 + self.idx[self.rd_sel][1]) % self.entries
+        self.unread_len = (self.unread_len - 1) % self.entries
+        self._idx_read()
+
+
+def plan(i_width, b_width, sizes, rate, drain, frames=100000, bit_rate=None, seed=0):
+    """Monte Carlo run of the allocator for some traffic.
+
+    sizes:    data_len values, picked at random for each frame
+    rate:     average frames per second (poisson arrivals)
+    drain:    time the host takes to read out one page, pages are read in
+              order, one at a time
+    bit_rate: if set, frames do not overlap on the bus (single rate)
+    """
+    rnd = random.Random(seed)
+    ram = RxRam(i_width, b_width)
+    frag_size = 1 << ram.s_width
+    pending = [] # (ready time, fragments) of the unread pages
+    head = 0
+    host_free = 0.0
+    allocated = 0 # fragments
+    t = 0.0
+    lost = 0
+    used_bytes = alloc_bytes = 0
+    occupancy_sum = occupancy_max = 0
+
+    for _ in range(frames):
+        data_len = rnd.choice(sizes)
+        len_ = min(data_len + 5, 256)
+        gap = rnd.expovariate(rate)
+        if bit_rate:
+            gap = max(gap, len_ * 10 / bit_rate)
+        t += gap
+
+        while head < len(pending):
+            ready, frags = pending[head]
+            done = max(ready, host_free) + drain
+            if done > t:
+                break
+            host_free = done
+            ram.rd_done()
+            allocated -= frags
+            head += 1
+
+        occupancy_sum += allocated
+        frags = (len_ - 1) // frag_size + 1
+        if ram.push(data_len):
+            pending.append((t, frags))
+            allocated += frags
+            occupancy_max = max(occupancy_max, allocated)
+            used_bytes += len_
+            alloc_bytes += frags * frag_size
+        else:
+            lost += 1 # the free fragments are always continuous, so only when full
+
+    return {
+        'i_width': i_width,
+        'b_width': b_width,
+        'frames': frames,
+        'p_lost': lost / frames,
+        'internal_frag': 1 - used_bytes / alloc_bytes if alloc_bytes else 0.0,
+        'mean_occupancy': occupancy_sum / frames / ram.entries,
+        'peak_occupancy': occupancy_max / ram.entries
+    }
@@ -0,0 +1,53 @@
+# This Source Code Form is subject to the terms of the Mozilla
+# Public License, v. 2.0. If a copy of the MPL was not distributed
+# with this file, You can obtain one at https://mozilla.org/MPL/2.0/.
+# Notice: The scope granted to MPL excludes the ASIC industry.
+#
+# Copyright (c) 2017 DUKELEC, All rights reserved.
+#
+# Author: Duke Fong <d@d-l.io>
+#
+
+"""Counters for tools/bench.py, loaded as an extra cocotb test module.
+
+It holds no test, importing it before the real test module is enough:
+the simulator callback registrations of cocotb are counted (one for each
+Timer, edge, ReadOnly ... that wakes up python, i.e. the events that cost
+most in a cocotb test), and at exit the count and the peak RSS of the
+simulator process are written to bench_probe.json in the test folder.
+
+With COCOTB_TRUST_INERTIAL_WRITES (set for verilator), cocotb.clock.Clock
+toggles the clocks inside the simulator, they are not counted then.
+"""
+
+import json, time, atexit, resource
+from cocotb import simulator
+
+OUTPUT = 'bench_probe.json'
+
+_REGISTERS = ('register_timed_callback', 'register_value_change_callback', 'register_readonly_callback',
+              'register_rwsynch_callback', 'register_nextstep_callback')
+
+_events = 0
+_t_start = time.monotonic()
+
+
+def _counted(func):
+    def wrapper(*args, **kwargs):
+        global _events
+        _events += 1
+        return func(*args, **kwargs)
+    return wrapper
+
+for _name in _REGISTERS:
+    setattr(simulator, _name, _counted(getattr(simulator, _name)))
+
+
+@atexit.register
+def _save():
+    with open(OUTPUT, 'w') as f:
+        json.dump({
+            'events': _events,
+            'run_s': time.monotonic() - _t_start, # from the import of the tests to the end
+            'max_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        }, f)
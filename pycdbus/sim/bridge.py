@@ -0,0 +1,181 @@
+# This Source Code Form is subject to the terms of the Mozilla
+# Public License, v. 2.0. If a copy of the MPL was not distributed
+# with this file, You can obtain one at https://mozilla.org/MPL/2.0/.
+# Notice: The scope granted to MPL excludes the ASIC industry.
+#
+# Copyright (c) 2017 DUKELEC, All rights reserved.
+#
+# Author: Duke Fong <d@d-l.io>
+#
+
+"""The simulation side of pycdbus.bridge: the hosts and CSR ports of a test
+wrapper on a Unix socket, for host software outside of the test.
+
+  server = BridgeServer('/tmp/cdbus.sock')
+  server.add_host('spi', SpiHost(dut))          # pycdbus.sim.host BFMs
+  server.add_csr('m0', CsrPort(node(dut, 0)))  # read(addr, len_) / write(addr, data)
+  server.add_irq('int_n', dut.int_n)
+  await server.serve()                          # until the clients are gone
+
+The calls run one after the other in the order they come, each one is one
+transfer of the BFM (or one burst of the CSR port). While none is pending,
+the simulation runs on by step ps between two polls of the socket: the RTL
+goes on while the host software thinks, as a board would. Before the first
+client the simulation waits for it, up to timeout seconds of wall time.
+An irq line is sent to the clients at each change of its level.
+"""
+
+import os, json, struct, socket, select, time
+from collections import deque
+import cocotb
+from cocotb.triggers import Timer
+from ..bridge import (HDR, pack, OP_HELLO, OP_TRANSFER, OP_WRITE, OP_WRITE_READ, OP_READ, OP_WRITE_REG, OP_IRQ,
+                      OP_ERROR)
+
+
+class BridgeServer:
+    def __init__(self, path, step=1000000):
+        self.path = path
+        self.step = Timer(step)
+        self.targets = [] # [name, kind, object]
+        self.irqs = []    # [name, signal, active value]
+        self.levels = []
+        self.clients = {} # socket: received bytes
+        self.calls = deque()
+        self.sock = None
+        self.stat = {'clients': 0, 'requests': 0, 'rx': 0, 'tx': 0, 'irqs': 0, 'steps': 0}
+
+    def add_host(self, name, host):
+        """A SpiHost / QspiHost (transfer) or an I2cHost (write, write_read)."""
+        self.targets.append((name, 'i2c' if hasattr(host, 'write_read') else 'transfer', host))
+
+    def add_csr(self, name, port):
+        """port: read(addr, len_) a burst of len_ reads of addr, write(addr,
+        data) a burst of writes, e.g. CsrPort of tests/common.py."""
+        self.targets.append((name, 'csr', port))
+
+    def add_irq(self, name, signal, active_low=True):
+        self.irqs.append((name, signal, '0' if active_low else '1'))
+        self.levels.append(None)
+
+    async def serve(self, timeout=30):
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.bind(self.path)
+        self.sock.listen()
+        watchers = [cocotb.start_soon(self._watch(idx)) for idx in range(len(self.irqs))]
+        end = time.monotonic() + timeout
+        try:
+            while not self.stat['clients']:
+                if time.monotonic() > end:
+                    raise TimeoutError(f'bridge: no client on {self.path}')
+                self._poll(0.1)
+            while self.clients or self.calls:
+                self._poll(0)
+                if self.calls:
+                    await self._run(*self.calls.popleft())
+                else:
+                    await self.step
+                    self.stat['steps'] += 1
+        finally:
+            for task in watchers:
+                task.cancel()
+            self.close()
+
+    def close(self):
+        for conn in list(self.clients):
+            self._drop(conn)
+        if self.sock:
+            self.sock.close()
+            self.sock = None
+            os.unlink(self.path)
+
+    def _poll(self, timeout):
+        ready, _, _ = select.select([self.sock, *self.clients], [], [], timeout)
+        for sock in ready:
+            if sock is self.sock:
+                self._accept()
+                continue
+            try:
+                data = sock.recv(65536)
+            except OSError: # e.g. ECONNRESET of a client killed mid-request
+                data = b''
+            if not data:
+                self._drop(sock)
+                continue
+            self.stat['rx'] += len(data)
+            buf = self.clients[sock]
+            buf += data
+            pos = 0
+            while len(buf) - pos >= HDR.size:
+                len_, seq, op, target = HDR.unpack_from(buf, pos)
+                if len(buf) - pos - HDR.size < len_:
+                    break
+                body = bytes(buf[pos + HDR.size:pos + HDR.size + len_])
+                self.calls.append((sock, seq, op, target, body))
+                pos += HDR.size + len_
+            del buf[:pos]
+
+    def _accept(self):
+        conn, _ = self.sock.accept()
+        self.clients[conn] = bytearray()
+        self.stat['clients'] += 1
+        hello = {'targets': [[name, kind] for name, kind, _ in self.targets],
+                 'irqs': [name for name, _, _ in self.irqs]}
+        msgs = [pack(0, OP_HELLO, 0, json.dumps(hello).encode())]
+        msgs += [pack(0, OP_IRQ, idx, bytes([level])) for idx, level in enumerate(self.levels) if level is not None]
+        self._send(conn, b''.join(msgs))
+
+    def _drop(self, conn):
+        del self.clients[conn]
+        conn.close()
+
+    def _send(self, conn, msg):
+        if conn not in self.clients:
+            return
+        try:
+            conn.sendall(msg)
+            self.stat['tx'] += len(msg)
+        except OSError:
+            self._drop(conn)
+
+    async def _run(self, conn, seq, op, target, body):
+        self.stat['requests'] += 1
+        try:
+            msg = pack(seq, op, target, await self._call(op, target, body))
+        except Exception as err:
+            code = (err.errno or 0) if isinstance(err, OSError) else 0
+            msg = pack(seq, OP_ERROR, target, struct.pack('<H', code) + str(err).encode())
+        self._send(conn, msg)
+
+    async def _call(self, op, target, body):
+        obj = self.targets[target][2]
+        if op == OP_TRANSFER:
+            rx_len, dummy = struct.unpack_from('<HH', body)
+            return await obj.transfer(body[4:], rx_len, dummy)
+        if op == OP_WRITE:
+            await obj.write(body[0], body[1:])
+            return b''
+        if op == OP_WRITE_READ:
+            dev, rx_len = struct.unpack_from('<BH', body)
+            return await obj.write_read(dev, body[3:], rx_len)
+        if op == OP_READ:
+            addr, len_ = struct.unpack_from('<BH', body)
+            return bytes(await obj.read(addr, len_))
+        if op == OP_WRITE_REG:
+            await obj.write(body[0], body[1:])
+            return b''
+        raise ValueError(f'bridge: unknown op {op}')
+
+    async def _watch(self, idx):
+        _, signal, active = self.irqs[idx]
+        while True:
+            level = str(signal.value) == active
+            if level != self.levels[idx]:
+                self.levels[idx] = level
+                self.stat['irqs'] += 1
+                msg = pack(0, OP_IRQ, idx, bytes([level]))
+                for conn in list(self.clients):
+                    self._send(conn, msg)
+            await signal.value_change
@@ -0,0 +1,117 @@
+# This Source Code Form is subject to the terms of the Mozilla
+# Public License, v. 2.0. If a copy of the MPL was not distributed
+# with this file, You can obtain one at https://mozilla.org/MPL/2.0/.
+# Notice: The scope granted to MPL excludes the ASIC industry.
+#
+# Copyright (c) 2017 DUKELEC, All rights reserved.
+#
+# Author: Duke Fong <d@d-l.io>
+#
+
+"""Drive the bus of a test wrapper as an external node.
+
+A frame is turned into a run-length edge schedule first: a list of
+(level, duration_ps), level is 0, 1 or 'z' (bus released). The driver then
+awaits once per level change instead of once per bit, e.g. 0x00 or 0xff
+bytes cost two timers instead of ten.
+
+The wrapper must provide the ext_tx and ext_tx_en inputs.
+"""
+
+from cocotb.triggers import Timer
+from ..crc import modbus_crc
+
+# release time before each speed segment, same as the old per-bit driver
+SEG_GAP = 1000
+
+# default idle time between frames of send_frames(), in low speed bits,
+# a bit longer than the reset value of IDLE_WAIT_LEN (10)
+IDLE_BITS = 12
+
+
+def _bit_levels(bytes_, high):
+    for byte in bytes_:
+        yield 0 # start bit
+        for i in range(8):
+            yield high if (byte >> i) & 1 else 0
+        yield high # stop bit
+
+
+class _Schedule:
+    """Accumulate levels on absolute time, round only at the edges,
+    so a fractional bit time does not drift over a long frame."""
+
+    def __init__(self):
+        self.runs = [] # [level, end time in ps]
+        self.t = 0.0
+
+    def put(self, level, duration):
+        self.t += duration
+        if self.runs and self.runs[-1][0] == level:
+            self.runs[-1][1] = self.t
+        else:
+            self.runs.append([level, self.t])
+
+    def put_frame(self, frame, clk_period, factor_l, factor_h):
+        # first byte in open-drain mode at low speed, the rest in push-pull mode at high speed
+        for bytes_, factor, high in ((frame[0:1], factor_l, 'z'), (frame[1:], factor_h, 1)):
+            self.put('z', SEG_GAP)
+            bit_time = (factor + 1) * clk_period
+            for level in _bit_levels(bytes_, high):
+                self.put(level, bit_time)
+        self.put('z', 0)
+
+    def edges(self):
+        ret = []
+        last = 0
+        for level, end in self.runs:
+            end = round(end)
+            if end > last:
+                ret.append((level, end - last))
+                last = end
+        return ret
+
+
+def frame_edges(frame, sys_clk, factor_l, factor_h):
+    """Edge schedule of one frame: src, dst, len, payload and crc, as sent on the wire."""
+    sch = _Schedule()
+    sch.put_frame(frame, 1e12 / sys_clk, factor_l, factor_h)
+    return sch.edges()
+
+
+def frames_edges(frames, sys_clk, factor_l, factor_h, idle=IDLE_BITS):
+    """Edge schedule of back-to-back frames, separated by idle low speed bits."""
+    clk_period = 1e12 / sys_clk
+    sch = _Schedule()
+    for i, frame in enumerate(frames):
+        if i:
+            sch.put('z', idle * (factor_l + 1) * clk_period)
+        sch.put_frame(frame, clk_period, factor_l, factor_h)
+    return sch.edges()
+
+
+async def drive_edges(dut, edges):
+    ext_tx = dut.ext_tx
+    ext_tx_en = dut.ext_tx_en
+    for level, duration in edges:
+        if level == 'z':
+            ext_tx_en.value = 0
+        else:
+            ext_tx.value = level
+            ext_tx_en.value = 1
+        await Timer(duration, unit='ps')
+    ext_tx_en.value = 0
+
+
+async def send_frame(dut, frame, sys_clk, factor_l, factor_h, crc=True):
+    """Inject one frame. crc: append its MODBUS crc, else the frame carries
+    one already (maybe a wrong one on purpose)."""
+    await drive_edges(dut, frame_edges(frame + modbus_crc(frame) if crc else frame, sys_clk, factor_l, factor_h))
+
+
+async def send_frames(dut, frames, sys_clk, factor_l, factor_h, idle=IDLE_BITS, crc=True):
+    """Inject a stream of frames, separated by idle low speed bits, the whole
+    schedule is computed before the first edge. crc: as send_frame()."""
+    if crc:
+        frames = [f + modbus_crc(f) for f in frames]
+    await drive_edges(dut, frames_edges(frames, sys_clk, factor_l, factor_h, idle))
@@ -0,0 +1,208 @@
+# This Source Code Form is subject to the terms of the Mozilla
+# Public License, v. 2.0. If a copy of the MPL was not distributed
+# with this file, You can obtain one at https://mozilla.org/MPL/2.0/.
+# Notice: The scope granted to MPL excludes the ASIC industry.
+#
+# Copyright (c) 2017 DUKELEC, All rights reserved.
+#
+# Author: Duke Fong <d@d-l.io>
+#
+
+"""Functional coverage of the cdbus instances, loaded as an extra cocotb test
+module by run_tests.py --coverage (like bench_probe.py).
+
+No test changes and no clock sampling: a few signals of each instance get a
+value change callback of the simulator, and the coverpoints are sampled once
+at the end of the time step (read-only phase) of such an event:
+  cd_csr_m.int_flag        int_flag:      bits seen set
+                           int_flag_pair: two bits seen set at the same time
+  cd_tx_ser_m.state        tx_state:      <mode>.<state> entered
+  rx_pend_len              rx_pend_len:   unread rx pages
+  cd_rx_bytes_m.byte_cnt   filter:        how the src / dst bytes hit the filter
+  cd_rx_bytes_m.finish     rx_frame:      <mode>.<ok|error|filtered>
+                           setting:       setting bits on while a frame ends
+
+At exit the count of every bin (0 if unhit) is written to coverage.json in
+the test folder, tools/coverage_report.py merges the files of many runs and
+lists the unhit bins.
+"""
+
+import json, atexit
+from itertools import combinations
+import cocotb
+from cocotb import simulator
+
+OUTPUT = 'coverage.json'
+
+MODES = ('traditional', 'arbitration', 'bs', 'full_duplex') # mode_sel
+
+FLAGS = ('rx_pending', 'rx_break', 'rx_lost', 'rx_error', 'tx_buf_free', 'tx_buf_clean', 'tx_cd', 'tx_error')
+
+TX_STATES = {0b0001: 'WAIT', 0b0010: 'BS_PRE', 0b0100: 'TX_PRE', 0b1000: 'DATA'} # cd_tx_ser.v
+
+# states a mode can reach, arbitration goes from WAIT to DATA directly
+_TX_LEGAL = {
+    'traditional': ('WAIT', 'TX_PRE', 'DATA'),
+    'arbitration': ('WAIT', 'DATA'),
+    'bs': ('WAIT', 'BS_PRE', 'TX_PRE', 'DATA'),
+    'full_duplex': ('WAIT', 'TX_PRE', 'DATA')
+}
+
+PEND_BINS = ((0, 0), (1, 1), (2, 2), (3, 4), (5, 8), (9, 16), (17, 32), (33, 63))
+
+FILTER_BINS = ('src_drop', 'unicast', 'broadcast', 'multicast0', 'multicast1', 'promiscuous', 'miss')
+
+SETTINGS = ('not_drop', 'user_crc', 'tx_invert', 'rx_invert', 'tx_push_pull')
+
+COVERPOINTS = {
+    'int_flag': list(FLAGS),
+    'int_flag_pair': [f'{a}&{b}' for a, b in combinations(FLAGS, 2)],
+    'tx_state': [f'{m}.{s}' for m in MODES for s in _TX_LEGAL[m]],
+    'rx_pend_len': [f'{lo}' if lo == hi else f'{lo}-{hi}' for lo, hi in PEND_BINS],
+    'filter': list(FILTER_BINS),
+    'rx_frame': [f'{m}.{r}' for m in MODES for r in ('ok', 'error', 'filtered')],
+    'setting': list(SETTINGS)
+}
+
+
+def empty():
+    return {cp: {b: 0 for b in bins} for cp, bins in COVERPOINTS.items()}
+
+
+def pend_bin(value):
+    for lo, hi in PEND_BINS:
+        if lo <= value <= hi:
+            return f'{lo}' if lo == hi else f'{lo}-{hi}'
+    return f'{value}'
+
+
+class _Instance:
+    """The handles of one cdbus instance and its state between events."""
+
+    def __init__(self, core):
+        csr = core.cd_csr_m
+        rx = core.cd_rx_bytes_m
+        h = lambda sig: sig._handle
+        self.int_flag = h(csr.int_flag)
+        self.mode_sel = h(csr.mode_sel)
+        self.settings = [h(getattr(csr, s)) for s in SETTINGS]
+        self.filter = [h(getattr(csr, s)) for s in ('filter', 'filter_m0', 'filter_m1', 'filter_msk0', 'filter_msk1')]
+        self.tx_state = h(core.cd_tx_ser_m.state)
+        self.rx_pend_len = h(core.rx_pend_len)
+        self.byte_cnt = h(rx.byte_cnt)
+        self.des_data = h(rx.des_data)
+        self.drop_flag = h(rx.drop_flag)
+        self.finish = h(rx.finish)
+        self.error = h(rx.error)
+        self.ram_switch = h(rx.ram_switch)
+        self.src_drop = False
+
+    def mode(self):
+        return MODES[self.mode_sel.get_signal_val_long()]
+
+
+class Collector:
+    """Value change callbacks on the instances, the counts are in self.cov."""
+
+    def __init__(self, cores):
+        self.cov = empty()
+        self.pending = set() # (instance, sampler) of this time step
+        self.armed = False
+        self.instances = [_Instance(core) for core in cores]
+        for inst in self.instances:
+            for sig, sampler, edge in ((inst.int_flag, self.s_int_flag, simulator.VALUE_CHANGE),
+                                       (inst.tx_state, self.s_tx_state, simulator.VALUE_CHANGE),
+                                       (inst.rx_pend_len, self.s_rx_pend_len, simulator.VALUE_CHANGE),
+                                       (inst.byte_cnt, self.s_byte_cnt, simulator.VALUE_CHANGE),
+                                       (inst.finish, self.s_finish, simulator.RISING)):
+                self._watch(sig, edge, inst, sampler)
+
+    def _watch(self, sig, edge, inst, sampler):
+        def changed():
+            self.pending.add((inst, sampler))
+            if not self.armed:
+                self.armed = True
+                simulator.register_readonly_callback(self._sample)
+            simulator.register_value_change_callback(sig, changed, edge) # callbacks are one-shot
+        simulator.register_value_change_callback(sig, changed, edge)
+
+    def _sample(self):
+        self.armed = False
+        pending, self.pending = self.pending, set()
+        for inst, sampler in pending:
+            sampler(inst)
+
+    def hit(self, cp, b):
+        bins = self.cov[cp]
+        bins[b] = bins.get(b, 0) + 1
+
+    def s_int_flag(self, inst):
+        value = inst.int_flag.get_signal_val_long()
+        on = [name for i, name in enumerate(FLAGS) if value >> i & 1]
+        for name in on:
+            self.hit('int_flag', name)
+        for a, b in combinations(on, 2):
+            self.hit('int_flag_pair', f'{a}&{b}')
+
+    def s_tx_state(self, inst):
+        state = TX_STATES.get(inst.tx_state.get_signal_val_long(), 'unknown')
+        self.hit('tx_state', f'{inst.mode()}.{state}')
+
+    def s_rx_pend_len(self, inst):
+        self.hit('rx_pend_len', pend_bin(inst.rx_pend_len.get_signal_val_long()))
+
+    def s_byte_cnt(self, inst):
+        # the drop_flag of a byte is updated with the byte_cnt, des_data still holds the byte
+        cnt = inst.byte_cnt.get_signal_val_long()
+        if cnt == 1:
+            inst.src_drop = bool(inst.drop_flag.get_signal_val_long())
+            if inst.src_drop:
+                self.hit('filter', 'src_drop')
+        elif cnt == 2 and not inst.src_drop:
+            flt, m0, m1, msk0, msk1 = (s.get_signal_val_long() for s in inst.filter)
+            dst = inst.des_data.get_signal_val_long()
+            if flt == 0xff:
+                b = 'promiscuous'
+            elif dst == flt:
+                b = 'unicast'
+            elif dst == 0xff:
+                b = 'broadcast'
+            elif dst & msk0 == m0:
+                b = 'multicast0'
+            elif dst & msk1 == m1:
+                b = 'multicast1'
+            else:
+                b = 'miss'
+            self.hit('filter', b)
+
+    def s_finish(self, inst):
+        if inst.error.get_signal_val_long():
+            result = 'error'
+        elif inst.ram_switch.get_signal_val_long():
+            result = 'ok'
+        else:
+            result = 'filtered'
+        self.hit('rx_frame', f'{inst.mode()}.{result}')
+        if result != 'filtered':
+            for name, sig in zip(SETTINGS, inst.settings):
+                if sig.get_signal_val_long():
+                    self.hit('setting', name)
+
+    def save(self, path=OUTPUT):
+        with open(path, 'w') as f:
+            json.dump(self.cov, f, indent=1)
+
+
+def cores(top):
+    """The cdbus instances of a test wrapper: cdbus_m<i> of tests/, cdctl_*_m.cdbus_m of example/tests/."""
+    ret = []
+    while hasattr(top, f'cdbus_m{len(ret)}'):
+        ret.append(getattr(top, f'cdbus_m{len(ret)}'))
+    for name in ('cdctl_spi_m', 'cdctl_qspi_m', 'cdctl_i2c_m'):
+        if hasattr(top, name):
+            ret.append(getattr(top, name).cdbus_m)
+    return ret
+
+
+collector = Collector(cores(cocotb.top))
+atexit.register(collector.save)
@@ -0,0 +1,310 @@
+# This Source Code Form is subject to the terms of the Mozilla
+# Public License, v. 2.0. If a copy of the MPL was not distributed
+# with this file, You can obtain one at https://mozilla.org/MPL/2.0/.
+# Notice: The scope granted to MPL excludes the ASIC industry.
+#
+# Copyright (c) 2017 DUKELEC, All rights reserved.
+#
+# Author: Duke Fong <d@d-l.io>
+#
+
+"""Hosts of pycdbus.cdctl driving the pins of the example/tests wrappers,
+so the RTL tests run the same driver as a board:
+
+  cdctl = Cdctl(Spi(SpiHost(dut)))      # cdctl_spi_wrapper
+  cdctl = Cdctl(Qspi(QspiHost(dut)))    # cdctl_qspi_wrapper
+  cdctl = Cdctl(I2c(I2cHost(dut)))      # cdctl_i2c_wrapper
+  rx = RxEngine(cdctl, SimIrq(dut.int_n))
+
+They are bus functional models of the host side, the register semantics
+(the one read of INT_FLAG_L + RX_LEN + INT_FLAG_H, the TX page submitted and
+the RX page released at the end of a REG_DAT burst) are Cdctl's, on top.
+
+freq: sck frequency (I2cHost: the mode), clk_period: of the CDCTL core clock
+in ps. into: the read data goes into this writable buffer of rx_len bytes
+(e.g. a FrameBuf.resize() view) instead of a new bytes, and it is returned.
+The chip select stays high for GAP core clocks after a transfer: the TX page
+is submitted and the RX page released a few clocks after it goes high, a
+status read any sooner would still see the old page.
+"""
+
+import errno
+from itertools import groupby
+from cocotb.clock import Clock
+from cocotb.triggers import Timer
+from cocotb.simtime import get_sim_time
+
+GAP = 8
+
+# the sck cycles of a byte, precomputed: its bits (SPI) or nibbles (QSPI), msb first
+_BITS = [bytes(b >> i & 1 for i in range(7, -1, -1)) for b in range(256)]
+_NIBBLES = [bytes((b >> 4, b & 0xf)) for b in range(256)]
+
+
+def _runs(levels):
+    """(level, sck cycles) of each run of the same level."""
+    return [(level, sum(1 for _ in run)) for level, run in groupby(levels)]
+
+
+class _Bfm:
+    """stat: transfers, tx / rx / dummy bytes and the time (ps) from the start
+    of a transfer to the end of its gap, rate() is the bytes/s of the host
+    side, ideal_rate() the one of the clock without any gap."""
+
+    SCK_PER_BYTE = 8
+
+    def __init__(self, dut, freq, clk_period):
+        self.dut = dut
+        self.freq = freq
+        self.half = round(1000000000000 / freq / 2) # ps
+        self.clk_period = clk_period
+        self._half = Timer(self.half)
+        self._timers = {}
+        self.reset_stat()
+
+    def _cycles(self, count):
+        timer = self._timers.get(count)
+        if timer is None:
+            timer = self._timers[count] = Timer(count * 2 * self.half)
+        return timer
+
+    async def _stop_clock(self):
+        """At a falling edge of sck: stop its clock within the low half, the
+        transfer ends a half period after that edge, as the one of a host."""
+        quarter = self.half // 2
+        await Timer(quarter)
+        self._clock.stop()
+        await Timer(self.half - quarter)
+
+    def reset_stat(self):
+        self.stat = {'transfers': 0, 'tx': 0, 'rx': 0, 'dummy': 0, 'time': 0}
+
+    def _account(self, t0, tx_len, rx_len, dummy=0):
+        stat = self.stat
+        stat['transfers'] += 1
+        stat['tx'] += tx_len
+        stat['rx'] += rx_len
+        stat['dummy'] += dummy
+        stat['time'] += get_sim_time('ps') - t0
+
+    def rate(self):
+        """tx and rx bytes per second of the transfers since reset_stat()."""
+        stat = self.stat
+        return (stat['tx'] + stat['rx']) * 1000000000000 / stat['time'] if stat['time'] else 0
+
+    def ideal_rate(self):
+        return self.freq / self.SCK_PER_BYTE
+
+
+class SpiHost(_Bfm):
+    """Mode 0, msb first: sdi is set while sck is low, sdo is sampled at the
+    rising edge. Pins: sck, nss, sdi, sdo (z when released, read as 0).
+
+    A transfer is one burst: sck is a cocotb Clock running through it without
+    pauses between the bytes, the data out is a run-length list of sdi levels,
+    one Timer per level change, and sdo is sampled at the rising edges of the
+    read bytes only."""
+
+    def __init__(self, dut, freq=32000000, clk_period=25000):
+        super().__init__(dut, freq, clk_period)
+        self._gap = Timer(self.half + GAP * clk_period)
+        self._clock = Clock(dut.sck, 2 * self.half, 'ps')
+        dut.nss.value = 1
+        dut.sck.value = 0
+
+    async def transfer(self, tx, rx_len=0, dummy=0, into=None):
+        dut = self.dut
+        sdi, sdo, half, period = dut.sdi, dut.sdo, self._half, self._cycles(1)
+        t0 = get_sim_time('ps')
+        dut.nss.value = 0
+        await half
+        self._clock.start(start_high=False) # the first rising edge a half period later
+        for level, count in _runs(b''.join(_BITS[byte] for byte in tx)):
+            sdi.value = level
+            await self._cycles(count)
+        sdi.value = 0
+        ret = bytearray(rx_len) if into is None else into
+        if dummy or rx_len:
+            await half # the first rising edge
+            for i in range(-dummy, rx_len):
+                byte = 0
+                for bit in range(8):
+                    if bit or i > -dummy:
+                        await period # no rising edge after the last sample
+                    v = sdo.value
+                    byte = byte << 1 | (int(v) if v.is_resolvable else 0)
+                if i >= 0:
+                    ret[i] = byte
+            await half
+        await self._stop_clock()
+        dut.nss.value = 1
+        await self._gap
+        self._account(t0, len(tx), rx_len, dummy)
+        return bytes(ret) if into is None else into
+
+
+class QspiHost(_Bfm):
+    """4 bits per sck, high nibble first. Pins: sck, nss, sdio (line levels),
+    sdio_drv / sdio_drv_en (the host side of the lines). Bursts as SpiHost."""
+
+    SCK_PER_BYTE = 2
+
+    def __init__(self, dut, freq=32000000, clk_period=25000):
+        super().__init__(dut, freq, clk_period)
+        self._gap = Timer(self.half + GAP * clk_period)
+        self._clock = Clock(dut.sck, 2 * self.half, 'ps')
+        dut.nss.value = 1
+        dut.sck.value = 0
+        dut.sdio_drv_en.value = 0
+
+    async def transfer(self, tx, rx_len=0, dummy=0, into=None):
+        dut = self.dut
+        drv, sdio, half, period = dut.sdio_drv, dut.sdio, self._half, self._cycles(1)
+        t0 = get_sim_time('ps')
+        dut.nss.value = 0
+        dut.sdio_drv_en.value = 1
+        await half
+        self._clock.start(start_high=False)
+        for level, count in _runs(b''.join(_NIBBLES[byte] for byte in tx)):
+            drv.value = level
+            await self._cycles(count)
+        ret = bytearray(rx_len) if into is None else into
+        if dummy or rx_len:
+            dut.sdio_drv_en.value = 0 # turnaround, the slave drives from the next byte
+            await half # the first rising edge
+            for i in range(-dummy, rx_len):
+                byte = 0
+                for nibble in range(2):
+                    if nibble or i > -dummy:
+                        await period # no rising edge after the last sample
+                    v = sdio.value
+                    byte = byte << 4 | (int(v) if v.is_resolvable else 0)
+                if i >= 0:
+                    ret[i] = byte
+            await half
+        await self._stop_clock()
+        dut.nss.value = 1
+        dut.sdio_drv_en.value = 0
+        await self._gap
+        self._account(t0, len(tx), rx_len, dummy)
+        return bytes(ret) if into is None else into
+
+
+# minimum timings of the modes in ns (I2C-bus specification, UM10204), the
+# high time of scl is the rest of the period
+I2C_MODES = {
+    'standard':  {'freq': 100000, 'low': 4700, 'su_sta': 4700, 'hd_sta': 4000, 'su_sto': 4000, 'buf': 4700},
+    'fast':      {'freq': 400000, 'low': 1300, 'su_sta': 600, 'hd_sta': 600, 'su_sto': 600, 'buf': 1300},
+    'fast_plus': {'freq': 1000000, 'low': 500, 'su_sta': 260, 'hd_sta': 260, 'su_sto': 260, 'buf': 500}
+}
+
+
+class I2cHost(_Bfm):
+    """I2C master of the timings of mode (I2C_MODES), sda changes a quarter of
+    the low time after scl falls. Pins: scl, sda_low (the host pulls sda low),
+    sda (line level, pulled up). A missing ack ends the transfer by a stop
+    and raises OSError, as i2c-dev does."""
+
+    SCK_PER_BYTE = 9
+
+    def __init__(self, dut, mode='fast_plus', clk_period=25000):
+        t = I2C_MODES[mode]
+        super().__init__(dut, t['freq'], clk_period)
+        self.mode = mode
+        period = round(1000000000 / t['freq']) # ns
+        hd_dat = t['low'] // 4
+        self._t = {k: Timer(v, unit='ns') for k, v in (
+            ('hd_dat', hd_dat), ('su_dat', t['low'] - hd_dat), ('high', period - t['low']),
+            ('su_sta', t['su_sta']), ('hd_sta', t['hd_sta']), ('su_sto', t['su_sto']), ('buf', t['buf']))}
+        dut.scl.value = 1
+        dut.sda_low.value = 0
+
+    async def _bit(self, bit):
+        """One scl cycle from scl low, returns the sda level at the end of the high time."""
+        dut, t = self.dut, self._t
+        await t['hd_dat']
+        dut.sda_low.value = not bit
+        await t['su_dat']
+        dut.scl.value = 1
+        await t['high']
+        v = dut.sda.value
+        dut.scl.value = 0
+        return int(v) if v.is_resolvable else 1
+
+    async def _write_byte(self, byte):
+        for bit in _BITS[byte]:
+            await self._bit(bit)
+        return not await self._bit(1) # ack
+
+    async def _read_byte(self, ack):
+        byte = 0
+        for _ in range(8):
+            byte = byte << 1 | await self._bit(1)
+        await self._bit(not ack)
+        return byte
+
+    async def _start(self, repeated=False):
+        dut, t = self.dut, self._t
+        if repeated:
+            await t['hd_dat']
+            dut.sda_low.value = 0
+            await t['su_dat']
+            dut.scl.value = 1
+            await t['su_sta']
+        dut.sda_low.value = 1
+        await t['hd_sta']
+        dut.scl.value = 0
+
+    async def _stop(self):
+        dut, t = self.dut, self._t
+        await t['hd_dat']
+        dut.sda_low.value = 1
+        await t['su_dat']
+        dut.scl.value = 1
+        await t['su_sto']
+        dut.sda_low.value = 0
+        await t['buf']
+
+    async def _write_bytes(self, data, t0):
+        """data: the address byte then the data, stop on a nack."""
+        for i, byte in enumerate(data):
+            if not await self._write_byte(byte):
+                await self._stop()
+                self._account(t0, i + 1, 0)
+                raise OSError(errno.EREMOTEIO if i else errno.ENXIO, f'i2c: no ack of byte {i}: 0x{byte:02x}')
+
+    async def write(self, dev, data):
+        t0 = get_sim_time('ps')
+        tx = bytes([dev << 1]) + bytes(data)
+        await self._start()
+        await self._write_bytes(tx, t0)
+        await self._stop()
+        self._account(t0, len(tx), 0)
+
+    async def write_read(self, dev, data, rx_len, into=None):
+        t0 = get_sim_time('ps')
+        tx = bytes([dev << 1]) + bytes(data)
+        await self._start()
+        await self._write_bytes(tx, t0)
+        await self._start(True)
+        await self._write_bytes(bytes([dev << 1 | 1]), t0)
+        ret = bytearray(rx_len) if into is None else into
+        for i in range(rx_len):
+            ret[i] = await self._read_byte(i < rx_len - 1) # nack the last byte
+        await self._stop()
+        self._account(t0, len(tx) + 1, rx_len)
+        return bytes(ret) if into is None else into
+
+
+class SimIrq:
+    """The irq line of cdctl.RxEngine on a signal, int_n of the wrappers is
+    open drain: 0 or z."""
+
+    def __init__(self, signal, active_low=True):
+        self.signal = signal
+        self.active = '0' if active_low else '1'
+
+    async def wait(self):
+        """Return once the line is active, at once if it is."""
+        while str(self.signal.value) != self.active:
+            await self.signal.value_change
@@ -0,0 +1,222 @@
+# This Source Code Form is subject to the terms of the Mozilla
+# Public License, v. 2.0. If a copy of the MPL was not distributed
+# with this file, You can obtain one at https://mozilla.org/MPL/2.0/.
+# Notice: The scope granted to MPL excludes the ASIC industry.
+#
+# Copyright (c) 2017 DUKELEC, All rights reserved.
+#
+# Author: Duke Fong <d@d-l.io>
+#
+
+"""Frame latency probes of the cdbus instances of a test wrapper.
+
+Each frame is time stamped at:
+  submit:    the host starts write_tx()
+  queued:    write_tx() returns, the frame is in the tx page
+  first_bit: the tx_ser of the sender leaves WAIT / BS_PRE for the winning
+             attempt (TX_PRE in the non-arbitration modes, DATA otherwise)
+  crc_end:   rx_ram_switch of the receiver, the crc is checked
+  irq:       the irq pin of the receiver is high (crc_end if it was already)
+  read:      the host has read the rx page
+
+and the stages between them are:
+  write = queued - submit        host csr writes
+  access = first_bit - queued    wait for the bus: idle, tx permit, the
+                                 other tx page and the lost arbitrations
+  wire = crc_end - first_bit     on the bus
+  irq = irq - crc_end
+  read = read - irq              host irq latency and csr reads
+  total = read - submit
+
+The host loops go through LatencyProbe.write_tx() and read_rx(), the rest is
+sampled from the signals. Frames are matched by content and by the time the
+sender finished them at the receiver, a broadcast frame gives one sample for
+each receiver. Frames sent but never read are counted as lost.
+"""
+
+import math
+import cocotb
+from cocotb.triggers import RisingEdge
+from cocotb.simtime import get_sim_time
+
+STAGES = ('write', 'access', 'wire', 'irq', 'read', 'total')
+
+_STAMPS = ('submit', 'queued', 'first_bit', 'crc_end', 'irq', 'read')
+
+# cd_tx_ser.v state
+_TX_IDLE = (0b0001, 0b0010) # WAIT, BS_PRE
+_TX_BUSY = (0b0100, 0b1000) # TX_PRE, DATA
+
+
+def percentile(values, p):
+    """Nearest-rank percentile of sorted values."""
+    if not values:
+        return 0
+    k = max(0, min(len(values) - 1, math.ceil(p * len(values) / 100) - 1))
+    return values[k]
+
+
+def stats(values):
+    values = sorted(values)
+    return {
+        'count': len(values),
+        'min': values[0] if values else 0,
+        'p50': percentile(values, 50),
+        'p99': percentile(values, 99),
+        'max': values[-1] if values else 0,
+        'mean': sum(values) / len(values) if values else 0
+    }
+
+
+def histogram(values, bins=8):
+    """[(lo, hi, count)] of log spaced bins from the min to the max value."""
+    values = [v for v in values if v > 0]
+    if not values:
+        return []
+    lo, hi = min(values), max(values)
+    if hi <= lo:
+        return [(lo, hi, len(values))]
+    ratio = (hi / lo) ** (1 / bins)
+    edges = [lo * ratio ** i for i in range(bins)] + [hi]
+    counts = [0] * bins
+    for v in values:
+        i = 0
+        while i < bins - 1 and v >= edges[i + 1]:
+            i += 1
+        counts[i] += 1
+    return [(edges[i], edges[i + 1], counts[i]) for i in range(bins)]
+
+
+class LatencyProbe:
+    """Time stamp the frames of some cdbus instances.
+
+    core: the cdbus instance, e.g. dut.cdbus_m0, irq: its irq pin, the
+    receivers must have BIT_FLAG_RX_PENDING in the irq mask.
+    The mode attribute tags the frames submitted from now on.
+    """
+
+    def __init__(self, mode=''):
+        self.mode = mode
+        self.frames = []    # every submitted frame
+        self._tx = {}       # sender idx: [frames not sent yet], oldest first
+        self._attempts = {} # sender idx: start times of the tx attempts of the oldest frame
+        self._rx = {}       # receiver idx: [(crc_end, irq)] not read yet
+        self._tasks = []
+
+    def add_node(self, idx, core, irq):
+        self._tx[idx] = []
+        self._attempts[idx] = []
+        self._rx[idx] = []
+        self._tasks += [cocotb.start_soon(self._tx_state(idx, core.cd_tx_ser_m.state)),
+                        cocotb.start_soon(self._tx_done(idx, core.tx_ram_rd_done)),
+                        cocotb.start_soon(self._rx_done(idx, core.rx_ram_switch, irq))]
+
+    def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        self._tasks = []
+
+    def clear(self):
+        """Forget the frames and the pending stamps, e.g. after a reset of the nodes."""
+        self.frames = []
+        for idx in self._tx:
+            self._tx[idx] = []
+            self._attempts[idx] = []
+            self._rx[idx] = []
+
+    async def write_tx(self, n, bytes_):
+        """n: the CdbusNode of the sender."""
+        frame = {'mode': self.mode, 'src': n.idx, 'data': bytes(bytes_), 'attempts': 0,
+                 'submit': get_sim_time('ns'), 'rx': {}}
+        self.frames.append(frame)
+        await n.write_tx(bytes_)
+        frame['queued'] = get_sim_time('ns')
+        self._tx[n.idx].append(frame)
+
+    async def read_rx(self, n, len_):
+        """Read one rx page of the CdbusNode n and stamp the frame of it."""
+        data = await n.read_rx(len_)
+        t = get_sim_time('ns')
+        if self._rx[n.idx]:
+            crc_end, irq = self._rx[n.idx].pop(0)
+            # the last frame of this content sent before the crc end,
+            # an older one may be lost, e.g. by a collision
+            sent = [f for f in self.frames if 'first_bit' in f and f['data'] == data and n.idx not in f['rx']]
+            frame = max((f for f in sent if f['tx_done'] <= crc_end), key=lambda f: f['tx_done'], default=None)
+            if frame:
+                frame['rx'][n.idx] = {'crc_end': crc_end, 'irq': irq, 'read': t}
+        return data
+
+    async def _tx_state(self, idx, state):
+        last = int(state.value)
+        while True:
+            await state.value_change
+            value = int(state.value)
+            if value in _TX_BUSY and last in _TX_IDLE:
+                self._attempts[idx].append(get_sim_time('ns'))
+            last = value
+
+    async def _tx_done(self, idx, rd_done):
+        while True:
+            await RisingEdge(rd_done)
+            if not self._tx[idx]:
+                continue
+            frame = self._tx[idx].pop(0)
+            frame['tx_done'] = get_sim_time('ns')
+            attempts = self._attempts[idx]
+            if attempts:
+                frame['first_bit'] = attempts[-1]
+                frame['attempts'] = len(attempts)
+            self._attempts[idx] = []
+
+    async def _rx_done(self, idx, switch, irq):
+        while True:
+            await RisingEdge(switch)
+            crc_end = get_sim_time('ns')
+            if not irq.value:
+                await RisingEdge(irq)
+            self._rx[idx].append((crc_end, get_sim_time('ns')))
+
+    def samples(self):
+        """{(mode, src, dst): {stage: [ns]}} of the frames read by a host."""
+        ret = {}
+        for f in self.frames:
+            for dst, rx in f['rx'].items():
+                t = dict(f, **rx)
+                if any(k not in t for k in _STAMPS):
+                    continue
+                group = ret.setdefault((f['mode'], f['src'], dst), {s: [] for s in STAGES + ('attempts',)})
+                for stage, a, b in zip(STAGES, _STAMPS, _STAMPS[1:]):
+                    group[stage].append(t[b] - t[a])
+                group['total'].append(t['read'] - t['submit'])
+                group['attempts'].append(f['attempts'])
+        return ret
+
+    def lost(self, mode, src):
+        """Frames of the sender never read, while a later one was."""
+        frames = [f for f in self.frames if f['mode'] == mode and f['src'] == src and 'tx_done' in f]
+        last = max((i for i, f in enumerate(frames) if f['rx']), default=-1)
+        return sum(1 for f in frames[:last] if not f['rx'])
+
+    def report(self):
+        """{group name: {stage: stats + histogram}}, times in ns."""
+        ret = {}
+        for (mode, src, dst), group in self.samples().items():
+            r = ret[f'{mode} {src}->{dst}'] = {s: dict(stats(v), histogram=histogram(v)) for s, v in group.items()}
+            r['lost'] = self.lost(mode, src)
+        return ret
+
+    def table(self):
+        """Lines of text: p50 / p99 / max of each stage, in us."""
+        samples = self.samples()
+        w = max([len(k[0]) for k in samples] + [4])
+        lines = [f"{'mode':<{w}} {'route':<6} {'stage':<8} {'count':>5} {'p50 us':>9} {'p99 us':>9} {'max us':>9}"]
+        for (mode, src, dst), group in samples.items():
+            for stage in STAGES:
+                s = stats(group[stage])
+                lines.append(f"{mode:<{w}} {f'{src}->{dst}':<6} {stage:<8} {s['count']:5} "
+                             f"{s['p50'] / 1000:9.3f} {s['p99'] / 1000:9.3f} {s['max'] / 1000:9.3f}")
+            retries = sum(a - 1 for a in group['attempts'] if a)
+            lines.append(f"{mode:<{w}} {f'{src}->{dst}':<6} {'retries':<8} {retries:5}")
+            lines.append(f"{mode:<{w}} {f'{src}->{dst}':<6} {'lost':<8} {self.lost(mode, src):5}")
+        return lines
@@ -0,0 +1,127 @@
+# This Source Code Form is subject to the terms of the Mozilla
+# Public License, v. 2.0. If a copy of the MPL was not distributed
+# with this file, You can obtain one at https://mozilla.org/MPL/2.0/.
+# Notice: The scope granted to MPL excludes the ASIC industry.
+#
+# Copyright (c) 2017 DUKELEC, All rights reserved.
+#
+# Author: Duke Fong <d@d-l.io>
+#
+
+"""Passive monitor of a line of a test wrapper, the frames on it are
+published to subscribers while the test runs:
+
+  mon = BusMonitor(dut.bus_a, sys_clk, core=dut.cdbus_m0) # the bit rates of cdbus_m0
+  mon.subscribe(frames.append)
+  ...
+  mon.stop()
+
+No clock is sampled: the line gets a value change callback of the simulator
+(as coverage.py), its edges go into pycdbus.decode.LineDecoder (first byte at
+bit_ls, the rest at bit_hs, break characters), and one timed callback at the
+time the frame would end ends it once the line stays idle. A frame is
+published idle_wait bits after its last stop bit, when cd_rx_des ends it, or
+at its bad bit. Full duplex: one monitor on each tx line.
+
+The frames are pycdbus.decode.Frame (times in ps). The subscribers are
+called inside the simulator callback: they may check, count and keep frames
+but not await or write signals. With core, the monitor follows div_ls,
+div_hs and idle_wait_len of the instance, else the given values.
+"""
+
+from collections import Counter
+from cocotb import simulator
+from cocotb.simtime import get_sim_time, convert
+from ..decode import LineDecoder, KINDS
+
+
+class BusMonitor:
+    def __init__(self, line, sys_clk=40000000, div_ls=346, div_hs=346, idle_wait=10, core=None):
+        self.name = line._name
+        self.clk_period = 1e12 / sys_clk
+        self.div_ls, self.div_hs, self.idle_wait = div_ls, div_hs, idle_wait
+        self.subscribers = []
+        self.stat = Counter({k: 0 for k in KINDS})
+        self.running = True
+        self._timer_at = None
+
+        self.line = line._handle
+        self.dec = LineDecoder(*self._rates(), on_frame=self._publish)
+        self.dec.level = self._level()
+        self.dec.rise = get_sim_time('ps')
+        self._watch(self.line, self._edge)
+        if core is not None:
+            for key, sig in (('div_ls', core.div_ls), ('div_hs', core.div_hs), ('idle_wait', core.idle_wait_len)):
+                self._follow(key, sig._handle)
+
+    def subscribe(self, callback):
+        """callback(frame) for each frame from now on."""
+        self.subscribers.append(callback)
+        return callback
+
+    def unsubscribe(self, callback):
+        self.subscribers.remove(callback)
+
+    def set_rate(self, div_ls=None, div_hs=None, idle_wait=None):
+        """Takes effect from the next byte."""
+        if div_ls is not None:
+            self.div_ls = div_ls
+        if div_hs is not None:
+            self.div_hs = div_hs
+        if idle_wait is not None:
+            self.idle_wait = idle_wait
+        self.dec.set_rate(*self._rates())
+
+    def stop(self):
+        """End the frame in progress, no more callbacks after this."""
+        self.dec.finish(get_sim_time('ps'))
+        self.running = False
+
+    def _rates(self):
+        return (self.div_ls + 1) * self.clk_period, (self.div_hs + 1) * self.clk_period, self.idle_wait
+
+    def _level(self):
+        return self.line.get_signal_val_binstr() != '0' # x / z: pulled up
+
+    def _watch(self, sig, callback):
+        def changed():
+            if self.running:
+                callback()
+                simulator.register_value_change_callback(sig, changed, simulator.VALUE_CHANGE) # one-shot
+        simulator.register_value_change_callback(sig, changed, simulator.VALUE_CHANGE)
+
+    def _follow(self, key, sig):
+        def update():
+            value = sig.get_signal_val_binstr()
+            if value.isdigit(): # no x / z
+                self.set_rate(**{key: int(value, 2)})
+        update()
+        self._watch(sig, update)
+
+    def _edge(self):
+        t = get_sim_time('ps')
+        self.stat['edges'] += 1
+        self.dec.edge(t, self._level())
+        self._arm(t)
+
+    def _arm(self, t):
+        """One timed callback pending at most, at the deadline of the frame
+        or before it (then it is armed again)."""
+        deadline = self.dec.deadline()
+        if deadline is None or self._timer_at is not None:
+            return
+        self._timer_at = deadline
+        steps = max(1, int(convert(deadline - t, 'ps', to='step', round_mode='ceil')))
+        simulator.register_timed_callback(steps, self._timeout)
+
+    def _timeout(self):
+        self._timer_at = None
+        if self.running:
+            t = get_sim_time('ps')
+            self.dec.advance(t)
+            self._arm(t)
+
+    def _publish(self, frame):
+        self.stat[frame.kind] += 1
+        for callback in self.subscribers:
+            callback(frame)
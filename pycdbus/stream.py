@@ -0,0 +1,297 @@
+# This Source Code Form is subject to the terms of the Mozilla
+# Public License, v. 2.0. If a copy of the MPL was not distributed
+# with this file, You can obtain one at https://mozilla.org/MPL/2.0/.
+# Notice: The scope granted to MPL excludes the ASIC industry.
+#
+# Copyright (c) 2017 DUKELEC, All rights reserved.
+#
+# Author: Duke Fong <d@d-l.io>
+#
+
+"""CDBUS frames on a plain byte stream (UART, RS-232, USB virtual serial),
+the byte level of the protocol: [src, dst, len] + data + crc, nothing
+between the frames.
+
+  dec = StreamDecoder()
+  for frame in dec.feed(chunk): # chunks of any size, frames without crc
+      ...
+  dec.idle()                    # the link is quiet, end what is kept
+  port.write(encode(frame))
+
+  frames = decode(capture)      # all the frames of a capture
+
+A frame is taken where its len fits and its crc is right. Else the byte is
+skipped and the next offset tried, the frames after garbage are found again
+by their crc (a random one passes with a chance of 1 / 65536). At most
+MAX_FRAME - 1 bytes are kept from one feed to the next: the frame not
+complete yet. idle() tells there is no more of it (as the idle time of the
+RTL): the bytes kept are searched for frames once more, the rest dropped.
+
+The crc is linear: crc16(frame) = INIT[n] ^ xor of DIST[n - 1 - i][frame[i]],
+DIST[d][b] the crc (init 0) of byte b followed by d zero bytes. So the
+search after garbage runs the crc once over the bytes and checks each
+offset by two of its states. With numpy, a feed of FAST_MIN bytes or more
+checks the frames one after the other (chained by their len bytes) all at
+once: one gather of DIST and one xor.reduceat. Where the chain breaks, the
+next SCAN offsets are all checked at once: the crc states run in lanes of
+LANE offsets side by side (two bytes a step by a 64 K table), then one
+gather of the states and of DIST tests every offset. The frames up to the
+end of the scan are taken from its hits, the chain goes on after it.
+
+pool: a pycdbus.framebuf.FramePool, the frames are FrameBuf filled in
+place (release() each one), bytes without it.
+"""
+
+from bisect import bisect_left
+from .crc import crc16, modbus_crc, CRC_INIT, CRC_TABLE
+from .framebuf import MAX_FRAME
+
+FAST_MIN = 4096     # bytes of a feed for the fast path
+CHAIN_MIN = 512     # bytes of the first chain after a scan, doubled while all are right
+BULK = 1 << 20      # bytes checked at once, at most
+SCAN = 1 << 16      # offsets of a scan
+LANE = 256          # offsets of a lane of the scan
+
+_tables = {}
+
+
+def encode(frame):
+    """frame (without crc) + crc"""
+    if not 3 <= len(frame) <= 256 or len(frame) != frame[2] + 3:
+        raise ValueError(f'bad frame length: {len(frame)}')
+    return bytes(frame) + modbus_crc(frame)
+
+
+def _numpy():
+    try:
+        import numpy as np
+    except ImportError:
+        return None
+    return np
+
+
+def crc_tables(np=None):
+    """DIST and INIT, as numpy arrays if np (DIST flat: [d * 256 + b])."""
+    if 'dist' not in _tables:
+        table = CRC_TABLE
+        dist = [table]
+        for d in range(1, MAX_FRAME):
+            dist.append([(c >> 8) ^ table[c & 0xff] for c in dist[-1]])
+        init = [CRC_INIT]
+        for n in range(MAX_FRAME):
+            c = init[-1]
+            init.append((c >> 8) ^ table[c & 0xff])
+        _tables['dist'], _tables['init'] = dist, init
+    if np is None:
+        return _tables['dist'], _tables['init']
+    if 'np' not in _tables:
+        _tables['np'] = (np.array(_tables['dist'], dtype=np.uint16).reshape(-1),
+                         np.array(_tables['init'], dtype=np.uint16))
+    return _tables['np']
+
+
+def _pair_tables(np):
+    """CRC_TABLE and PAIR as numpy arrays, PAIR[w] the crc (init 0) of the
+    bytes w & 0xff, w >> 8: two bytes take all the 16 bits of a state, so
+    the state after them is PAIR[state ^ w]."""
+    if 'pair' not in _tables:
+        table = np.array(CRC_TABLE, dtype=np.uint16)
+        w = np.arange(1 << 16, dtype=np.uint16)
+        c = table[w & 0xff]
+        _tables['pair'] = table, (c >> 8) ^ table[((w >> 8) ^ c) & 0xff]
+    return _tables['pair']
+
+
+class StreamDecoder:
+    """max_len: the largest data_len taken, a smaller one resyncs faster.
+    fast: the numpy path if numpy is there."""
+
+    def __init__(self, max_len=253, pool=None, fast=True):
+        self.max_len = max_len
+        self.pool = pool
+        self.np = _numpy() if fast else None
+        self.tail = b''
+        self.stat = {'bytes': 0, 'frames': 0, 'skipped': 0, 'resyncs': 0}
+
+    def feed(self, data):
+        """The frames completed by data."""
+        self.stat['bytes'] += len(data)
+        buf = self.tail + bytes(data) if self.tail else bytes(data)
+        frames = []
+        self.tail = buf[self._decode(buf, frames, False):]
+        return frames
+
+    def idle(self):
+        """The frames left in the bytes kept, the other bytes are dropped."""
+        buf, self.tail = self.tail, b''
+        frames = []
+        self._decode(buf, frames, True)
+        return frames
+
+    def _decode(self, buf, frames, final):
+        """Frames of buf into frames, return where the bytes kept start."""
+        i, n = 0, len(buf)
+        arr = None
+        scan_end, hits, ends = 0, [], [] # the offsets before scan_end are scanned, frames start at hits only
+        gap = None   # start of the bytes skipped so far
+        while i < n:
+            if i < scan_end:
+                k = bisect_left(hits, i)
+                if k == len(hits):
+                    gap = i if gap is None else gap
+                    i = scan_end
+                    continue
+                j, end = hits[k], ends[k]
+                if end > n:
+                    end = None
+            elif self.np is not None and n - i >= FAST_MIN:
+                if arr is None:
+                    arr = self.np.frombuffer(buf, dtype=self.np.uint8)
+                if gap is None: # no chain in garbage
+                    i = self._chain(buf, arr, i, frames)
+                    if n - i < FAST_MIN:
+                        continue
+                scan_end, hits, ends = self._scan(arr, i, final)
+                continue
+            else:
+                j, end = self._search(buf, i, final)
+            start = i if gap is None else gap
+            gap = None
+            if j > start:
+                self.stat['skipped'] += j - start
+                self.stat['resyncs'] += 1
+            if end is None: # wait for more bytes, or nothing more at idle
+                return j
+            self._emit(buf, frames, ((j, end),))
+            i = end
+        return i
+
+    def _emit(self, buf, frames, spans):
+        if self.pool is None:
+            frames += [buf[s:e - 2] for s, e in spans]
+        else:
+            view = memoryview(buf)
+            for s, e in spans:
+                frame = self.pool.get()
+                frame.resize(e - s - 2)[:] = view[s:e - 2]
+                frames.append(frame)
+        self.stat['frames'] += len(spans)
+
+    def _search(self, buf, i, final):
+        """(start, end) of the first frame from i on, or (start, None) of the
+        one to wait for (final: (len(buf), None) if there is none)."""
+        dist, init = crc_tables()
+        table = CRC_TABLE
+        n = len(buf)
+        max_len = self.max_len
+        start = i
+        state = [0] # state[k]: crc of buf[start:start + k], from any init
+        while n - i >= 5:
+            len_ = buf[i + 2]
+            if len_ <= max_len:
+                size = len_ + 5
+                end = i + size
+                if end > n:
+                    if not final:
+                        return i, None
+                elif i == start: # mostly a frame right away
+                    if not crc16(buf[i:end]):
+                        return i, end
+                else:
+                    if end - start >= len(state):
+                        c = state[-1]
+                        for byte in buf[start + len(state) - 1:end]:
+                            c = (c >> 8) ^ table[(c ^ byte) & 0xff]
+                            state.append(c)
+                    # crc16(buf[i:end]): INIT[size] ^ state at end ^ state at i on by size bytes
+                    c = state[i - start]
+                    if init[size] == state[end - start] ^ dist[size - 1][c & 0xff] ^ dist[size - 2][c >> 8]:
+                        return i, end
+            i += 1
+        return (n if final else i), None
+
+    def _chain(self, buf, arr, i, frames):
+        """The frames one after the other from i on, up to a bad one or
+        one not complete, return where it starts."""
+        np = self.np
+        dist, init = crc_tables(np)
+        n = len(buf)
+        max_len = self.max_len
+        size = CHAIN_MIN # grows while all are right, garbage wastes less
+        while True:
+            starts = []
+            p = i
+            limit = min(n, i + size)
+            size = min(size * 2, BULK)
+            while p + 5 <= limit:
+                len_ = buf[p + 2]
+                end = p + len_ + 5
+                if len_ > max_len or end > n:
+                    break
+                starts.append(p)
+                p = end
+            if not starts:
+                return i
+            s = np.array(starts) - i # from i, int32 is enough for BULK
+            lens = arr[s + i + 2].astype(np.int32) + 5
+            idx = np.repeat((s + lens - 1).astype(np.int32), lens)
+            idx -= np.arange(p - i, dtype=np.int32) # distance to the last byte
+            idx <<= 8
+            idx |= arr[i:p]
+            bad = np.flatnonzero(np.bitwise_xor.reduceat(dist[idx], s) ^ init[lens])
+            good = int(bad[0]) if bad.size else len(starts)
+            self._emit(buf, frames, list(zip(starts[:good], (s + lens + i)[:good].tolist())))
+            if good < len(starts):
+                return starts[good]
+            i = p
+
+    def _scan(self, arr, i, final):
+        """Check the offsets from i on (SCAN of them) at once, return (end of
+        them, the offsets a frame starts at, the end of each frame), an end
+        past the bytes for a frame not complete (only if not final)."""
+        np = self.np
+        dist, init = crc_tables(np)
+        table, pair = _pair_tables(np)
+        n = len(arr)
+        count = min(n - 4, i + SCAN) - i
+        lanes = -(-count // LANE)
+        rows = LANE + MAX_FRAME # the bytes a lane runs the crc over, even
+        size = min(n - i, count + MAX_FRAME)
+        pad = np.zeros(lanes * LANE + rows, dtype=np.uint8)
+        pad[:size] = arr[i:i + size]
+        win = np.lib.stride_tricks.as_strided(pad, (rows, lanes), (1, LANE)) # [byte, lane]
+        words = win[1::2].astype(np.uint16)
+        words <<= 8
+        words |= win[0::2]
+        even = np.empty((rows // 2 + 1, lanes), dtype=np.uint16)
+        even[0] = 0
+        for t in range(rows // 2):
+            np.take(pair, even[t] ^ words[t], out=even[t + 1])
+        state = np.empty((rows + 1, lanes), dtype=np.uint16) # [k, lane]: crc of its first k bytes
+        state[0::2] = even
+        state[1::2] = (even[:-1] >> 8) ^ table[(even[:-1] ^ win[0::2]) & 0xff]
+        # offset lane * LANE + r: its state at [r, lane], the one of its end len + 5 rows on
+        start = state[:LANE].T.reshape(-1)[:count]
+        at = np.arange(LANE, dtype=np.intp) * lanes + (np.arange(lanes, dtype=np.intp) + 5 * lanes)[:, None]
+        raw = arr[i + 2:i + count + 2]
+        fit = raw <= self.max_len
+        lens = np.minimum(np.arange(256), self.max_len) # a len byte to one in the tables
+        hi = (lens << 8)[raw]
+        ok = state.reshape(-1)[at.reshape(-1)[:count] + (lens * lanes)[raw]]
+        ok ^= dist[4 << 8:][hi | start & 0xff]
+        ok ^= dist[3 << 8:][hi | start >> 8]
+        ok = ok == init[5:][lens][raw]
+        ok &= fit
+        tail = max(0, n - i - MAX_FRAME) # the offsets a frame may not be complete from
+        part = np.arange(tail, count) + raw[tail:] + 5 > n - i
+        ok[tail:] &= ~part
+        if not final:
+            ok[tail:] |= part & fit[tail:]
+        hits = np.flatnonzero(ok)
+        return i + count, (hits + i).tolist(), (hits + raw[hits] + (i + 5)).tolist()
+
+
+def decode(data, max_len=253, fast=True):
+    """All the frames (without crc) of a capture, the end is idle."""
+    dec = StreamDecoder(max_len, fast=fast)
+    return dec.feed(data) + dec.idle()
@@ -0,0 +1,197 @@
+# This Source Code Form is subject to the terms of the Mozilla
+# Public License, v. 2.0. If a copy of the MPL was not distributed
+# with this file, You can obtain one at https://mozilla.org/MPL/2.0/.
+# Notice: The scope granted to MPL excludes the ASIC industry.
+#
+# Copyright (c) 2017 DUKELEC, All rights reserved.
+#
+# Author: Duke Fong <d@d-l.io>
+#
+
+"""Constrained-random traffic and a scoreboard for a bus of nodes.
+
+A Traffic object draws everything from one seed, so a failing run is
+replayed by its seed:
+  filters():  the filter registers of each node, a unique unicast address
+              (also the src of its frames) and two multicast groups
+  rounds():   [(time us, [(sender idx, frame)])], the senders of a round
+              write their frame at the same time
+
+The distributions are weight dicts, {value: weight}:
+  dst:        'unicast', 'multicast', 'broadcast' or 'nobody' (an address
+              no node takes)
+  concurrent: number of senders of a round
+  size:       (min, max) data_len ranges
+  gap:        (min, max) us ranges from one round to the next
+
+accepts() is the receive filter of hdl/cd_rx_bytes.v (and of the model),
+the Scoreboard uses it for the receivers of each frame and checks that every
+receiver gets the frames of each sender once and in order.
+"""
+
+import random
+from .regs import *
+
+DST_KINDS = ('unicast', 'multicast', 'broadcast', 'nobody')
+
+DEFAULT = {
+    'dst': {'unicast': 6, 'multicast': 3, 'broadcast': 2, 'nobody': 1},
+    'concurrent': {1: 6, 2: 3, 3: 1},
+    'size': {(0, 8): 6, (9, 64): 3, (65, 253): 1},
+    'gap': {(0, 0): 2, (1, 20): 4, (20, 200): 1}
+}
+
+MASKS = (0xf0, 0xf8, 0xfc, 0xfe, 0xff)
+
+
+def multicast(flt, addr):
+    return (addr & flt['msk0']) == flt['m0'] or (addr & flt['msk1']) == flt['m1']
+
+
+def accepts(flt, data):
+    """The frame (src, dst, ...) passes the filter registers of a node,
+    flt: {'filter', 'm0', 'm1', 'msk0', 'msk1'}, filter 0xff receives all."""
+    if flt['filter'] == 0xff:
+        return True
+    if data[0] == flt['filter']:
+        return False # own frame
+    return data[1] in (flt['filter'], 0xff) or multicast(flt, data[1])
+
+
+def filter_regs(flt):
+    """[(register, value)] of the filter of a node."""
+    return [(REG_FILTER, flt['filter']), (REG_FILTER_M0, flt['m0']), (REG_FILTER_M1, flt['m1']),
+            (REG_FILTER_MSK0, flt['msk0']), (REG_FILTER_MSK1, flt['msk1'])]
+
+
+class Traffic:
+    def __init__(self, nodes, seed=0, **dists):
+        self.nodes = nodes
+        self.seed = seed
+        self.rnd = random.Random(seed)
+        self.dists = dict(DEFAULT, **dists)
+        for k in self.dists:
+            if k not in DEFAULT:
+                raise ValueError(f'unknown distribution: {k}')
+        if not set(self.dists['dst']) <= set(DST_KINDS):
+            raise ValueError(f"unknown dst kind: {set(self.dists['dst']) - set(DST_KINDS)}")
+        self.flt = self.filters()
+
+    def pick(self, name):
+        dist = self.dists[name]
+        return self.rnd.choices(list(dist), list(dist.values()))[0]
+
+    def filters(self):
+        """A filter of each node, the unicast addresses are unique and never 0xff."""
+        rnd = self.rnd
+        addrs = rnd.sample(range(0xff), self.nodes)
+        ret = []
+        for addr in addrs:
+            flt = {'filter': addr}
+            for g in '01':
+                msk = rnd.choice(MASKS)
+                flt[f'msk{g}'] = msk
+                flt[f'm{g}'] = rnd.randrange(0x100) & msk
+            ret.append(flt)
+        return ret
+
+    def dst(self, sender):
+        kind = self.pick('dst')
+        others = [f for i, f in enumerate(self.flt) if i != sender]
+        if kind == 'unicast' and others:
+            return kind, self.rnd.choice(others)['filter']
+        if kind == 'multicast' and others:
+            flt = self.rnd.choice(others)
+            g = self.rnd.choice('01')
+            msk = flt[f'msk{g}']
+            return kind, flt[f'm{g}'] | (self.rnd.randrange(0x100) & ~msk & 0xff)
+        if kind == 'nobody':
+            free = [a for a in range(0xff) if not any(accepts(f, (-1, a)) for f in self.flt)]
+            if free:
+                return kind, self.rnd.choice(free)
+        return 'broadcast', 0xff
+
+    def frame(self, sender):
+        """(dst kind, frame without crc)"""
+        kind, dst = self.dst(sender)
+        lo, hi = self.pick('size')
+        data_len = self.rnd.randint(lo, hi)
+        payload = bytes(self.rnd.randrange(0x100) for _ in range(data_len))
+        return kind, bytes([self.flt[sender]['filter'], dst, data_len]) + payload
+
+    def rounds(self, frames):
+        """Rounds of concurrent senders, frames in total."""
+        ret = []
+        t = 0
+        while frames > 0:
+            lo, hi = self.pick('gap')
+            t += self.rnd.uniform(lo, hi)
+            count = min(self.pick('concurrent'), self.nodes, frames)
+            senders = sorted(self.rnd.sample(range(self.nodes), count))
+            ret.append((t, [(idx, self.frame(idx)) for idx in senders]))
+            frames -= count
+        return ret
+
+
+class Scoreboard:
+    """Expected frames of each receiver, by sender, oldest first.
+
+    sent() when a frame goes into a tx page, received() for each rx page
+    read, and check() at the end for what never arrived.
+    """
+
+    def __init__(self, flt):
+        self.flt = flt
+        self.src_idx = {f['filter']: i for i, f in enumerate(flt)}
+        self.expected = {(rx, tx): [] for rx in range(len(flt)) for tx in range(len(flt))}
+        self.errors = []
+        self.stat = {'sent': 0, 'expected': 0, 'received': 0, 'rounds': 0, 'concurrent': 0,
+                     **{k: 0 for k in DST_KINDS}}
+
+    def receivers(self, data):
+        return [i for i, f in enumerate(self.flt) if accepts(f, data)]
+
+    def sent(self, tx, data, kind=None):
+        self.stat['sent'] += 1
+        if kind:
+            self.stat[kind] += 1
+        for rx in self.receivers(data):
+            if rx != tx: # a promiscuous sender does not get its own frame
+                self.expected[(rx, tx)].append(bytes(data))
+                self.stat['expected'] += 1
+
+    def received(self, rx, data):
+        """data: bytes or a FrameBuf, compared in place, not kept."""
+        self.stat['received'] += 1
+        tx = self.src_idx.get(data[0]) if len(data) else None
+        queue = self.expected.get((rx, tx))
+        if not queue:
+            self.errors.append(f'idx{rx}: unexpected {data.hex()}')
+        elif queue[0] != data:
+            self.errors.append(f'idx{rx}: from idx{tx}: expected {queue[0].hex()}, got {data.hex()}')
+            data = bytes(data)
+            if data in queue: # frames skipped
+                del queue[:queue.index(data) + 1]
+        else:
+            queue.pop(0)
+
+    def flags(self, idx, flags):
+        """Error flags read from a node."""
+        for bit, name in ((BIT_FLAG_RX_LOST, 'rx lost'), (BIT_FLAG_RX_ERROR, 'rx error'),
+                          (BIT_FLAG_TX_ERROR, 'tx error')):
+            if flags & bit:
+                self.errors.append(f'idx{idx}: {name}')
+
+    def pending(self):
+        return sum(len(q) for q in self.expected.values())
+
+    def check(self):
+        """Errors, including the frames never received."""
+        errors = list(self.errors)
+        for (rx, tx), queue in self.expected.items():
+            for data in queue:
+                errors.append(f'idx{rx}: from idx{tx}: missing {data.hex()}')
+        return errors
+
+    def summary(self):
+        return ', '.join(f'{k}: {v}' for k, v in self.stat.items())
@@ -0,0 +1,134 @@
+# This Source Code Form is subject to the terms of the Mozilla
+# Public License, v. 2.0. If a copy of the MPL was not distributed
+# with this file, You can obtain one at https://mozilla.org/MPL/2.0/.
+# Notice: The scope granted to MPL excludes the ASIC industry.
+#
+# Copyright (c) 2017 DUKELEC, All rights reserved.
+#
+# Author: Duke Fong <d@d-l.io>
+#
+
+# Frame latency benchmark, not part of the regression (not named test_*):
+#   ./test_all.sh --sim verilator bench_latency.py
+#
+# Nodes 0 and 1 send BENCH_FRAMES frames each to node 2, every sender writes
+# its next frame when a tx page is free and BENCH_GAP us later. The irq driven
+# host of node 2 reads every rx page. The frames are time stamped by
+# pycdbus/sim/latency.py, the stages are:
+#   write   host csr writes of the tx page
+#   access  wait for the bus (idle, tx permit, own other page, lost arbitrations)
+#   wire    first bit to the end of the crc at the receiver
+#   irq     end of crc to the rx irq
+#   read    rx irq to the end of the host read (includes the host being busy)
+#   total   write_tx start to the end of the read
+#
+# Sweep by environment variables (comma separated lists), besides the
+# BENCH_DIV, BENCH_PAYLOAD, BENCH_IDLE_WAIT and BENCH_TX_PERMIT of
+# bench_throughput.py:
+#   BENCH_MODE       traditional, arbitration, bs
+#   BENCH_SENDERS    number of sending nodes (1 or 2), default: 1,2
+#   BENCH_GAP        us between the frames of a sender, 0: keep the tx pages full
+#
+# The p50 / p99 / max table is logged, the statistics and the histograms of
+# every point are written to latency.json in the test folder.
+
+import os, json, itertools
+from common import *
+from cocotb.triggers import Event, ClockCycles, SimTimeoutError, with_timeout
+from pycdbus.sim.latency import LatencyProbe
+from bench_throughput import SYS_CLK, env_list, div_pair, configure, expected_period
+
+
+async def sender(probe, n, irq, frame, count, gap):
+    for _ in range(count):
+        while True:
+            if not irq.value:
+                await RisingEdge(irq)
+            if int(await n.read_int_flag()) & BIT_FLAG_TX_BUF_FREE:
+                break
+            await n.clk_edge
+        await probe.write_tx(n, frame)
+        await ClockCycles(n.clk, 3) # the page is sent to the tx after the chip select goes low
+        if gap:
+            await Timer(gap, unit='us')
+
+
+async def receiver(probe, n, irq, count, done):
+    for _ in range(count):
+        while True:
+            if not irq.value:
+                await RisingEdge(irq)
+            if int(await n.read_int_flag()) & BIT_FLAG_RX_PENDING:
+                break
+            await n.clk_edge
+        len_ = int(await n.read_rx_len()) # user data length
+        await probe.read_rx(n, len_ + 3)
+        await ClockCycles(n.clk, 3) # the page is released after the chip select goes low
+    done.set()
+
+
+def configs():
+    for mode, senders, div, payload, idle_wait, tx_permit, gap in itertools.product(
+            env_list('BENCH_MODE', 'traditional,arbitration,bs', str), env_list('BENCH_SENDERS', '1,2'),
+            env_list('BENCH_DIV', '39:2', div_pair), env_list('BENCH_PAYLOAD', '0,32,253'),
+            env_list('BENCH_IDLE_WAIT', '10'), env_list('BENCH_TX_PERMIT', '20'), env_list('BENCH_GAP', '0,100')):
+        if senders > 1 and mode == 'traditional':
+            continue # no arbitration, the frames would collide
+        yield {'mode': mode, 'senders': senders, 'div_ls': div[0], 'div_hs': div[1], 'payload': payload,
+               'idle_wait': idle_wait, 'tx_permit': tx_permit, 'gap': gap}
+
+
+@cocotb.test()
+async def bench_latency(dut):
+    clk_period = 1000000000000 / SYS_CLK
+    idx_list = range(3)
+    for idx in idx_list:
+        cocotb.start_soon(Clock(getattr(dut, f'clk{idx}'), clk_period).start())
+        await reset(dut, idx)
+        await check_version(dut, idx)
+
+    count = int(os.environ.get('BENCH_FRAMES', 10))
+    probe = LatencyProbe()
+    for idx in idx_list:
+        probe.add_node(idx, getattr(dut, f'cdbus_m{idx}'), getattr(dut, f'irq{idx}'))
+
+    points = {}
+    stalled = False
+    for cfg in configs():
+        routes = [(idx, 2, 3) for idx in range(cfg['senders'])]
+        await configure(dut, cfg, routes, idx_list)
+        probe.clear()
+        probe.mode = f"{cfg['mode']} tx{cfg['senders']} len{cfg['payload']} gap{cfg['gap']}"
+        if len(env_list('BENCH_DIV', '39:2', div_pair)) > 1:
+            probe.mode += f" div{cfg['div_ls']}:{cfg['div_hs']}"
+
+        done = Event()
+        n2 = node(dut, 2)
+        tasks = [cocotb.start_soon(receiver(probe, n2, dut.irq2, count * cfg['senders'], done))]
+        for idx, _, filter_ in routes:
+            frame = bytes([idx + 1, filter_, cfg['payload']]) + bytes(range(cfg['payload']))
+            n = node(dut, idx)
+            tasks.append(cocotb.start_soon(sender(probe, n, getattr(dut, f'irq{idx}'), frame, count, cfg['gap'])))
+
+        timeout = count * cfg['senders'] * (expected_period(cfg) * 4 + cfg['gap'] * 1e-6) + 200e-6
+        try:
+            await with_timeout(done.wait(), round(timeout * 1e9), 'ns')
+        except SimTimeoutError:
+            dut._log.error(f'bench_latency: {probe.mode} stalled')
+            stalled = True
+        for task in tasks:
+            task.cancel()
+        for idx in idx_list: # release a csr access left half way
+            n = node(dut, idx)
+            n.cs.value = n.read.value = n.write.value = 0
+
+        for line in probe.table()[0 if not points else 1:]:
+            dut._log.info(line)
+        points.update(probe.report())
+
+    probe.stop()
+    with open('latency.json', 'w') as f:
+        json.dump(points, f, indent=1)
+    if stalled or not points:
+        await exit_err()
+    await exit_ok()
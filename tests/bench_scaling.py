@@ -0,0 +1,150 @@
+# This Source Code Form is subject to the terms of the Mozilla
+# Public License, v. 2.0. If a copy of the MPL was not distributed
+# with this file, You can obtain one at https://mozilla.org/MPL/2.0/.
+# Notice: The scope granted to MPL excludes the ASIC industry.
+#
+# Copyright (c) 2017 DUKELEC, All rights reserved.
+#
+# Author: Duke Fong <d@d-l.io>
+#
+
+# Throughput and fairness as the node count grows, not part of the regression
+# (not named test_*). Runs on any wrapper, the N-node ones are generated
+# (tools/gen_wrapper.py):
+#   ./test_all.sh --sim verilator --wrapper cdbus_wrapper_n16 bench_scaling.py
+#   ./test_all.sh --sim verilator --wrapper cdbus_wrapper_n64 bench_scaling.py
+#
+# The last node receives, the senders keep both tx pages full. After
+# BENCH_WARMUP frames, BENCH_FRAMES frames are counted at the receiver and
+# split by sender. In the bs mode the senders get the tx permit slots of
+# bench_throughput.py, in the arbitration mode they share the same tx permit.
+# Their clocks are spread over +-BENCH_PPM.
+#
+# Sweep by environment variables (comma separated lists), besides the
+# BENCH_DIV, BENCH_PAYLOAD, BENCH_IDLE_WAIT and BENCH_TX_PERMIT of
+# bench_throughput.py:
+#   BENCH_MODE       arbitration, bs
+#   BENCH_SENDERS    number of sending nodes, default: all but the receiver
+#
+# Reported: frames/s, Jain's fairness index of the frames per sender
+# (1: equal shares, 1/senders: one sender takes all), the least and the most
+# frames of a sender, the sender with the most (top), and the number of nodes
+# with collision (cd) or error flags.
+# The table is also written to scaling.csv in the test folder.
+
+import os, itertools
+from common import *
+from cocotb.triggers import Event, SimTimeoutError, with_timeout
+from cocotb.simtime import get_sim_time
+from bench_throughput import SYS_CLK, MODES, BS_SLOT, env_list, div_pair, expected_period, host
+
+
+def jain(counts):
+    total = sum(counts)
+    squares = sum(c * c for c in counts)
+    return total * total / (len(counts) * squares) if squares else 0
+
+
+async def count_tx(rd_done, times):
+    while True:
+        await RisingEdge(rd_done)
+        times.append(get_sim_time('ns'))
+
+
+async def count_rx(switch, times, count, done):
+    while True:
+        await RisingEdge(switch)
+        times.append(get_sim_time('ns'))
+        if len(times) >= count:
+            done.set()
+
+
+async def measure(dut, arr, cfg, warmup, frames):
+    rx_idx = len(arr) - 1
+    senders = list(range(cfg['senders']))
+    await arr.reset()
+
+    async def setup(n):
+        await n.csr_write(REG_SETTING, MODES[cfg['mode']] << 4 | BIT_SETTING_TX_PUSH_PULL)
+        await n.set_div(cfg['div_ls'], cfg['div_hs'])
+        await n.csr_write(REG_IDLE_WAIT_LEN, cfg['idle_wait'])
+        slot = BS_SLOT if cfg['mode'] == 'bs' else 0 # the same permit for all, the arbitration decides
+        await n.set_tx_permit_len(cfg['tx_permit'] + (n.idx * slot if n.idx in senders else 0))
+        await n.csr_write(REG_FILTER, n.idx + 1)
+        await n.csr_write(REG_INT_MASK_L, BIT_FLAG_RX_PENDING if n.idx == rx_idx else BIT_FLAG_TX_BUF_FREE)
+    await arr.each(setup, [arr[idx] for idx in senders + [rx_idx]])
+
+    rx_times = []
+    tx_times = {idx: [] for idx in senders}
+    stat = {idx: 0 for idx in senders + [rx_idx]}
+    done = Event()
+    tasks = [cocotb.start_soon(count_rx(arr.core(rx_idx).rx_ram_switch, rx_times, warmup + frames, done)),
+             cocotb.start_soon(host(dut, rx_idx, b'', False, True, stat))]
+    for idx in senders:
+        frame = bytes([idx + 1, rx_idx + 1, cfg['payload']]) + bytes(range(cfg['payload']))
+        tasks += [cocotb.start_soon(count_tx(arr.core(idx).tx_ram_rd_done, tx_times[idx])),
+                  cocotb.start_soon(host(dut, idx, frame, True, False, stat))]
+
+    timeout = (warmup + frames + 4) * expected_period(dict(cfg, senders=1)) * 4 + 200e-6
+    try:
+        await with_timeout(done.wait(), round(timeout * 1e9), 'ns')
+        ok = True
+    except SimTimeoutError:
+        ok = False
+    for task in tasks:
+        task.cancel()
+    for n in arr: # release a csr access left half way
+        n.cs.value = n.read.value = n.write.value = 0
+    # the starved senders never get a tx irq, collect their flags here
+    for idx, flags in zip(senders, await arr.each(lambda n: n.read_int_flag(), [arr[idx] for idx in senders])):
+        stat[idx] |= int(flags)
+
+    ret = dict(cfg, nodes=len(arr), frames=0, fps=0.0, fairness=0.0, min=0, max=0, top=-1,
+               cd=sum(1 for idx in senders if stat[idx] & BIT_FLAG_TX_CD),
+               err=sum(1 for v in stat.values() if v & (BIT_FLAG_TX_ERROR | BIT_FLAG_RX_ERROR | BIT_FLAG_RX_LOST)))
+    if not ok or len(rx_times) < warmup + 2:
+        return ret
+    t0, t1 = rx_times[max(warmup - 1, 0)], rx_times[-1]
+    counts = [sum(1 for t in tx_times[idx] if t0 < t <= t1 + 1000) for idx in senders]
+    ret.update(frames=len(rx_times) - max(warmup, 1), fps=round((len(rx_times) - max(warmup, 1)) / (t1 - t0) * 1e9, 1),
+               fairness=round(jain(counts), 3), min=min(counts), max=max(counts), top=counts.index(max(counts)))
+    return ret
+
+
+@cocotb.test()
+async def bench_scaling(dut):
+    arr = NodeArray(dut)
+    ppm = int(os.environ.get('BENCH_PPM', 200))
+    # spread evenly over -ppm ~ +ppm
+    arr.start_clocks(SYS_CLK, [round(-ppm + 2 * ppm * idx / max(len(arr) - 1, 1)) for idx in range(len(arr))])
+    await arr.reset()
+    await arr.check_version()
+
+    warmup = int(os.environ.get('BENCH_WARMUP', 2))
+    frames = int(os.environ.get('BENCH_FRAMES', 50))
+    rows = []
+    dut._log.info(f"{'mode':<12} nodes  tx  div_ls div_hs  len idle permit   frames/s  fairness  min  max  top  cd err")
+    for mode, senders, div, payload, idle_wait, tx_permit in itertools.product(
+            env_list('BENCH_MODE', 'arbitration,bs', str), env_list('BENCH_SENDERS', str(len(arr) - 1)),
+            env_list('BENCH_DIV', '39:2', div_pair), env_list('BENCH_PAYLOAD', '0,32'),
+            env_list('BENCH_IDLE_WAIT', '10'), env_list('BENCH_TX_PERMIT', '20')):
+        if not 0 < senders < len(arr):
+            continue
+        cfg = {'mode': mode, 'senders': senders, 'div_ls': div[0], 'div_hs': div[1],
+               'payload': payload, 'idle_wait': idle_wait, 'tx_permit': tx_permit}
+        r = await measure(dut, arr, cfg, warmup, frames)
+        rows.append(r)
+        dut._log.info(f"{r['mode']:<12} {r['nodes']:5} {r['senders']:3}  {r['div_ls']:6} {r['div_hs']:6}  "
+                      f"{r['payload']:3} {r['idle_wait']:4} {r['tx_permit']:6} {r['fps']:10.1f} {r['fairness']:9.3f} "
+                      f"{r['min']:4} {r['max']:4} {r['top']:4} {r['cd']:3} {r['err']:3}")
+
+    with open('scaling.csv', 'w') as f:
+        keys = ['mode', 'nodes', 'senders', 'div_ls', 'div_hs', 'payload', 'idle_wait', 'tx_permit',
+                'frames', 'fps', 'fairness', 'min', 'max', 'top', 'cd', 'err']
+        f.write(','.join(keys) + '\n')
+        for r in rows:
+            f.write(','.join(str(r[k]) for k in keys) + '\n')
+    if not rows or any(r['frames'] == 0 for r in rows):
+        dut._log.error('bench_scaling: some points stalled')
+        await exit_err()
+    await exit_ok()
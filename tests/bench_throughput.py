@@ -0,0 +1,220 @@
+# This Source Code Form is subject to the terms of the Mozilla
+# Public License, v. 2.0. If a copy of the MPL was not distributed
+# with this file, You can obtain one at https://mozilla.org/MPL/2.0/.
+# Notice: The scope granted to MPL excludes the ASIC industry.
+#
+# Copyright (c) 2017 DUKELEC, All rights reserved.
+#
+# Author: Duke Fong <d@d-l.io>
+#
+
+# Bus throughput benchmark, not part of the regression (not named test_*):
+#   ./test_all.sh --sim verilator bench_throughput.py bench_throughput_full_duplex.py
+#
+# The senders keep both tx pages full and the receiver host clears each rx
+# page as soon as it is pending, so the bus is the only limit. Each point of
+# the sweep resets the nodes, waits for BENCH_WARMUP frames, then measures
+# BENCH_FRAMES frames at the receiver (rx_ram_switch of cdbus.v).
+#
+# Sweep by environment variables (comma separated lists):
+#   BENCH_MODE       traditional, arbitration, bs, full_duplex
+#   BENCH_SENDERS    number of sending nodes (1 or 2)
+#   BENCH_DIV        DIV_LS:DIV_HS pairs
+#   BENCH_PAYLOAD    user data length 0 ~ 253
+#   BENCH_IDLE_WAIT  IDLE_WAIT_LEN
+#   BENCH_TX_PERMIT  TX_PERMIT_LEN
+#
+# The time of each frame period is split into: the first byte at low speed
+# (the arbitration field in arbitration mode), the TX_PRE bits, dst + len,
+# payload data bits, the start / stop bits of the payload, crc, and the gap
+# between two frames (idle wait + tx permit + synchronization), per wire.
+# frames/s and goodput count all receivers. The table is also written to
+# throughput.csv in the test folder.
+
+import os, itertools
+from common import *
+from cocotb.triggers import Event, ClockCycles, SimTimeoutError, with_timeout
+from cocotb.simtime import get_sim_time
+from pycdbus.regs import MODE_TRADITIONAL, MODE_ARBITRATION, MODE_BREAK_SYNC, MODE_FULL_DUPLEX
+
+SYS_CLK = 40000000
+
+MODES = {
+    'traditional': MODE_TRADITIONAL,
+    'arbitration': MODE_ARBITRATION,
+    'bs': MODE_BREAK_SYNC,
+    'full_duplex': MODE_FULL_DUPLEX
+}
+
+BS_SLOT = 3 # low speed bits between the tx permit slots of the senders in the bs mode
+
+SHARES = ('first_byte', 'pre', 'header', 'data', 'framing', 'crc', 'gap')
+
+
+def env_list(name, default, conv=int):
+    return [conv(v) for v in os.environ.get(name, default).split(',') if v]
+
+def div_pair(s):
+    div_ls, div_hs = s.split(':')
+    return int(div_ls), int(div_hs)
+
+
+def frame_shares(cfg, period):
+    """Split one frame period (s) into its parts, as shares of the period."""
+    bit_ls = (cfg['div_ls'] + 1) / SYS_CLK
+    bit_hs = (cfg['div_hs'] + 1) / SYS_CLK
+    pre = 0 if cfg['mode'] == 'arbitration' else 1 # TX_PRE_LEN reset value
+    t = {
+        'first_byte': 10 * bit_ls,
+        'pre': pre * bit_ls,
+        'header': 20 * bit_hs,
+        'data': 8 * cfg['payload'] * bit_hs,
+        'framing': 2 * cfg['payload'] * bit_hs,
+        'crc': 20 * bit_hs
+    }
+    t['gap'] = period - sum(t.values())
+    return {k: v / period for k, v in t.items()}
+
+
+def expected_period(cfg):
+    bit_ls = (cfg['div_ls'] + 1) / SYS_CLK
+    bit_hs = (cfg['div_hs'] + 1) / SYS_CLK
+    return (12 + cfg['idle_wait'] + cfg['tx_permit'] + cfg['senders']) * bit_ls + (cfg['payload'] + 4) * 10 * bit_hs
+
+
+async def host(dut, idx, frame, send, recv, stat):
+    """Host of one node: keep the tx pages full, clear the rx pages."""
+    n = node(dut, idx)
+    irq = getattr(dut, f'irq{idx}')
+    while True:
+        if not irq.value:
+            await RisingEdge(irq)
+        flags = int(await n.read_int_flag())
+        stat[idx] |= flags & (BIT_FLAG_TX_ERROR | BIT_FLAG_TX_CD | BIT_FLAG_RX_ERROR | BIT_FLAG_RX_LOST)
+        if recv and flags & BIT_FLAG_RX_PENDING:
+            await n.csr_write(REG_CTRL, BIT_RX_CLR_PENDING)
+        if send and flags & BIT_FLAG_TX_BUF_FREE:
+            await n.write_tx(frame)
+        await ClockCycles(n.clk, 3) # let the flags settle, the pages are switched after the chip select goes low
+
+
+async def monitor(switch, times, count, done):
+    while True:
+        await RisingEdge(switch)
+        times.append(get_sim_time('ns') / 1e9)
+        if len(times) >= count:
+            done.set()
+
+
+async def configure(dut, cfg, routes, idx_list):
+    """Reset all nodes and set up the ones of the routes: [(sender idx, receiver idx, receiver filter)]."""
+    used = sorted(set(i for r in routes for i in r[:2]))
+    senders = [r[0] for r in routes]
+    receivers = sorted(set(r[1] for r in routes))
+    for idx in idx_list: # also the unused ones, they may hold frames of the last point
+        await reset(dut, idx)
+    for idx in used:
+        n = node(dut, idx)
+        await n.csr_write(REG_SETTING, MODES[cfg['mode']] << 4 | BIT_SETTING_TX_PUSH_PULL)
+        await n.set_div(cfg['div_ls'], cfg['div_hs'])
+        await n.csr_write(REG_IDLE_WAIT_LEN, cfg['idle_wait'])
+        # the break sync mode needs a distinct tx permit slot for each node, the next slot
+        # has to start after the TX_PRE bit and the start bit of the one before
+        slot = BS_SLOT if cfg['mode'] == 'bs' else 1
+        await n.set_tx_permit_len(cfg['tx_permit'] + (senders.index(idx) * slot if idx in senders else 0))
+        await n.csr_write(REG_FILTER, idx + 1)
+        mask = (BIT_FLAG_TX_BUF_FREE if idx in senders else 0) | (BIT_FLAG_RX_PENDING if idx in receivers else 0)
+        await n.csr_write(REG_INT_MASK_L, mask)
+    return used, receivers
+
+
+async def measure(dut, cfg, routes, warmup, frames, idx_list):
+    used, receivers = await configure(dut, cfg, routes, idx_list)
+    times = []
+    done = Event()
+    stat = {idx: 0 for idx in used}
+    tasks = [cocotb.start_soon(monitor(getattr(dut, f'cdbus_m{idx}').rx_ram_switch, times, warmup + frames, done))
+             for idx in receivers]
+    for idx in used:
+        route = next((r for r in routes if r[0] == idx), None)
+        frame = bytes([idx + 1, route[2], cfg['payload']]) + bytes(range(cfg['payload'])) if route else b''
+        tasks.append(cocotb.start_soon(host(dut, idx, frame, bool(route), idx in receivers, stat)))
+
+    timeout = (warmup + frames + 4) * expected_period(cfg) * 4 + 100e-6
+    try:
+        await with_timeout(done.wait(), round(timeout * 1e9), 'ns')
+        ok = True
+    except SimTimeoutError:
+        ok = False
+    for task in tasks:
+        task.cancel()
+    for idx in used: # release a csr access left half way
+        n = node(dut, idx)
+        n.cs.value = n.read.value = n.write.value = 0
+
+    ret = dict(cfg, frames=0, fps=0.0, goodput=0.0, flags=' '.join(f'{stat[i]:02x}' for i in used))
+    times = times[max(warmup - 1, 0):]
+    if not ok or len(times) < 2:
+        return ret
+    period = (times[-1] - times[0]) / (len(times) - 1)
+    ret.update(frames=len(times) - 1, fps=round(1 / period, 1), goodput=round(cfg['payload'] * 8 / period))
+    # each receiver of the full-duplex wrapper has its own wire
+    shares = frame_shares(cfg, period * len(receivers))
+    ret.update({k: round(v, 4) for k, v in shares.items()})
+    return ret
+
+
+def configs(modes, senders_list):
+    for mode, senders, div, payload, idle_wait, tx_permit in itertools.product(
+            modes, senders_list, env_list('BENCH_DIV', '39:2', div_pair), env_list('BENCH_PAYLOAD', '0,32,253'),
+            env_list('BENCH_IDLE_WAIT', '10'), env_list('BENCH_TX_PERMIT', '20')):
+        yield {'mode': mode, 'senders': senders, 'div_ls': div[0], 'div_hs': div[1],
+               'payload': payload, 'idle_wait': idle_wait, 'tx_permit': tx_permit}
+
+
+async def sweep(dut, modes, routes_of, idx_list):
+    clk_period = 1000000000000 / SYS_CLK
+    for idx in idx_list:
+        cocotb.start_soon(Clock(getattr(dut, f'clk{idx}'), clk_period).start())
+        await reset(dut, idx)
+        await check_version(dut, idx)
+
+    warmup = int(os.environ.get('BENCH_WARMUP', 2))
+    frames = int(os.environ.get('BENCH_FRAMES', 10))
+    rows = []
+    dut._log.info(f"{'mode':<12} tx  div_ls div_hs  len idle permit   frames/s  goodput kbps  "
+                  f"first  pre  head  data frame  crc   gap  flags")
+    for cfg in configs(modes, env_list('BENCH_SENDERS', '1')):
+        routes = routes_of(cfg)
+        if routes is None:
+            continue
+        r = await measure(dut, cfg, routes, warmup, frames, idx_list)
+        rows.append(r)
+        shares = ' '.join(f'{r[k] * 100:4.1f}' if k in r else '   -' for k in SHARES)
+        dut._log.info(f"{r['mode']:<12} {r['senders']:2}  {r['div_ls']:6} {r['div_hs']:6}  {r['payload']:3} "
+                      f"{r['idle_wait']:4} {r['tx_permit']:6} {r['fps']:10.1f} {r['goodput'] / 1000:13.1f}  "
+                      f"{shares}  {r['flags']}")
+
+    with open('throughput.csv', 'w') as f:
+        keys = ['mode', 'senders', 'div_ls', 'div_hs', 'payload', 'idle_wait', 'tx_permit',
+                'frames', 'fps', 'goodput'] + list(SHARES) + ['flags']
+        f.write(','.join(keys) + '\n')
+        for r in rows:
+            f.write(','.join(str(r.get(k, '')) for k in keys) + '\n')
+    return rows
+
+
+@cocotb.test()
+async def bench_throughput(dut):
+    def routes_of(cfg):
+        if cfg['mode'] == 'full_duplex':
+            return None # bench_throughput_full_duplex.py
+        if cfg['senders'] > 1 and cfg['mode'] == 'traditional':
+            return None # no arbitration, the frames would collide
+        return [(idx, 2, 3) for idx in range(min(cfg['senders'], 2))]
+
+    rows = await sweep(dut, env_list('BENCH_MODE', 'traditional,arbitration,bs', str), routes_of, range(3))
+    if not rows or any(r['frames'] == 0 for r in rows):
+        dut._log.error('bench_throughput: some points stalled')
+        await exit_err()
+    await exit_ok()
@@ -0,0 +1,26 @@
+# This Source Code Form is subject to the terms of the Mozilla
+# Public License, v. 2.0. If a copy of the MPL was not distributed
+# with this file, You can obtain one at https://mozilla.org/MPL/2.0/.
+# Notice: The scope granted to MPL excludes the ASIC industry.
+#
+# Copyright (c) 2017 DUKELEC, All rights reserved.
+#
+# Author: Duke Fong <d@d-l.io>
+#
+
+# Full-duplex part of bench_throughput.py (cdbus_wrapper_fduplex):
+# node 0 sends to node 1, with BENCH_SENDERS=2 node 1 sends back at the same time.
+
+from common import *
+from bench_throughput import sweep # not *, the test of that module would run here too
+
+@cocotb.test()
+async def bench_throughput_full_duplex(dut):
+    def routes_of(cfg):
+        return [(0, 1, 2), (1, 0, 1)][:min(cfg['senders'], 2)]
+
+    rows = await sweep(dut, ['full_duplex'], routes_of, range(2))
+    if not rows or any(r['frames'] == 0 for r in rows):
+        dut._log.error('bench_throughput_full_duplex: some points stalled')
+        await exit_err()
+    await exit_ok()
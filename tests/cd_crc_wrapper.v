@@ -0,0 +1,34 @@
+/*
+ * This Source Code Form is subject to the terms of the Mozilla
+ * Public License, v. 2.0. If a copy of the MPL was not distributed
+ * with this file, You can obtain one at https://mozilla.org/MPL/2.0/.
+ * Notice: The scope granted to MPL excludes the ASIC industry.
+ *
+ * Copyright (c) 2017 DUKELEC, All rights reserved.
+ *
+ * Author: Duke Fong <d@d-l.io>
+ */
+
+`timescale 1 ns / 1 ps
+
+module cd_crc_wrapper(
+        input       clk,
+        input       clean,
+        input       data_clk,
+        input       data_in,
+        output      [15:0] crc_out
+    );
+
+cd_crc cd_crc_m(
+    .clk(clk),
+    .clean(clean),
+    .data_clk(data_clk),
+    .data_in(data_in),
+    .crc_out(crc_out)
+);
+
+`ifdef CD_DUMP
+cd_dump cd_dump_m(.clk(clk));
+`endif
+
+endmodule
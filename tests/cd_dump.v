@@ -0,0 +1,74 @@
+/*
+ * This Source Code Form is subject to the terms of the Mozilla
+ * Public License, v. 2.0. If a copy of the MPL was not distributed
+ * with this file, You can obtain one at https://mozilla.org/MPL/2.0/.
+ * Notice: The scope granted to MPL excludes the ASIC industry.
+ *
+ * Copyright (c) 2017 DUKELEC, All rights reserved.
+ *
+ * Author: Duke Fong <d@d-l.io>
+ */
+
+/*
+ * Waveform dumping of the test wrappers, built in only if CD_DUMP is defined,
+ * see tools/run_tests.py --wave.
+ *
+ * Defines:
+ *   CD_DUMP_FILE:    e.g. "cdbus.vcd" (the format is chosen by the simulator options)
+ *   CD_DUMP_SCOPE:   hierarchy list for $dumpvars, default: everything
+ *   CD_DUMP_TRIGGER: optional signal, its first rising edge is reported in the log
+ *
+ * Plusargs:
+ *   +dump_off:       do not dump (report the trigger only)
+ *   +dump_from=N:    start dumping at N ns
+ *   +dump_to=N:      finish the simulation at N ns
+ *
+ * Dumping starts by a late $dumpvars call instead of $dumpoff / $dumpon,
+ * which verilator ignores. The window resolution is one clk period.
+ */
+
+`timescale 1 ns / 1 ps
+
+module cd_dump(
+        input       clk
+    );
+
+reg [63:0] dump_from = 0;
+reg [63:0] dump_to = 64'hffffffffffffffff;
+reg dump_off = 0;
+reg dumping = 0;
+
+initial begin
+    dump_off = $test$plusargs("dump_off");
+    if ($value$plusargs("dump_from=%d", dump_from)) ;
+    if ($value$plusargs("dump_to=%d", dump_to)) ;
+end
+
+always @(posedge clk) begin
+    if (!dump_off && !dumping && $time >= dump_from) begin
+        $dumpfile(`CD_DUMP_FILE);
+`ifdef CD_DUMP_SCOPE
+        $dumpvars(0, `CD_DUMP_SCOPE);
+`else
+        $dumpvars;
+`endif
+        dumping <= 1;
+    end
+    if ($time >= dump_to) begin
+        $dumpflush;
+        $display("cd_dump: window end at %0d ns", $time);
+        $finish;
+    end
+end
+
+`ifdef CD_DUMP_TRIGGER
+reg triggered = 0;
+
+always @(posedge `CD_DUMP_TRIGGER) begin
+    if (!triggered)
+        $display("cd_dump: trigger at %0d ns", $time);
+    triggered <= 1;
+end
+`endif
+
+endmodule
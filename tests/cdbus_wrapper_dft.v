@@ -46,45 +46,30 @@ module cdbus_wrapper_dft(
         output      irq1,
         output      irq2,
 
-        inout       bus_a,
+        output      bus_a,      // bus level, high when released
+        input       ext_tx,     // external node driven by the testbench
+        input       ext_tx_en,
 
         input       dbg0,
         input       dbg1
     );
 
-wire tx0;
-wire tx1;
-wire tx2;
-wire tx_en0;
-wire tx_en1;
-wire tx_en2;
-
-wire rx0 = tx_en0 === 1 ? tx0 : (bus_a === 1'bx ? 1'bx : (bus_a !== 0));
-wire rx1 = tx_en1 === 1 ? tx1 : (bus_a === 1'bx ? 1'bx : (bus_a !== 0));
-wire rx2 = tx_en2 === 1 ? tx2 : (bus_a === 1'bx ? 1'bx : (bus_a !== 0));
-
-wire b0_is0 = tx_en0 === 1 && tx0 === 0;
-wire b1_is0 = tx_en1 === 1 && tx1 === 0;
-wire b2_is0 = tx_en2 === 1 && tx2 === 0;
-wire b0_is1 = tx_en0 === 1 && tx0 === 1;
-wire b1_is1 = tx_en1 === 1 && tx1 === 1;
-wire b2_is1 = tx_en2 === 1 && tx2 === 1;
-
-wire [2:0] is0_cnt = b0_is0 + b1_is0 + b2_is0;
-wire [2:0] is1_cnt = b0_is1 + b1_is1 + b2_is1;
-
-reg bus_reg;
-assign bus_a = bus_reg;
-
-always @(*)
-    if (is0_cnt == 0 && is1_cnt != 0)
-        bus_reg = 1;
-    else if (is0_cnt != 0 && is1_cnt == 0)
-        bus_reg = 0;
-    else if (is0_cnt == 0 && is1_cnt == 0)
-        bus_reg = 1'bz;
-    else
-        bus_reg = 1'bx;
+tri1 tx0; // released output is seen as recessive
+tri1 tx1;
+tri1 tx2;
+tri0 tx_en0;
+tri0 tx_en1;
+tri0 tx_en2;
+tri0 ext_en = ext_tx_en;
+
+// 2-state open-drain bus: every enabled driver pulls the bus towards its level,
+// a released bus stays high, and 0 is dominant when drivers disagree.
+assign bus_a = (tx_en0 ? tx0 : 1'b1) & (tx_en1 ? tx1 : 1'b1) & (tx_en2 ? tx2 : 1'b1)
+               & (ext_en ? ext_tx : 1'b1);
+
+wire rx0 = tx_en0 ? tx0 : bus_a;
+wire rx1 = tx_en1 ? tx1 : bus_a;
+wire rx2 = tx_en2 ? tx2 : bus_a;
 
 
 cdbus cdbus_m0(
@@ -138,9 +123,8 @@ cdbus cdbus_m2(
           .tx_en(tx_en2)
       );
 
-initial begin
-    $dumpfile("cdbus.vcd");
-    $dumpvars();
-end
+`ifdef CD_DUMP
+cd_dump cd_dump_m(.clk(clk0));
+`endif
 
 endmodule
@@ -96,9 +96,8 @@ cdbus cdbus_m1(
           .tx_en(tx_en1)
       );
 
-initial begin
-    $dumpfile("cdbus.vcd");
-    $dumpvars();
-end
+`ifdef CD_DUMP
+cd_dump cd_dump_m(.clk(clk0));
+`endif
 
 endmodule
@@ -12,181 +12,260 @@ import cocotb
 from cocotb.types import Logic, LogicArray
 from cocotb.triggers import RisingEdge, FallingEdge, ReadOnly, Timer
 from cocotb.clock import Clock
+from pycdbus.sim.bus import send_frame, send_frames
+from pycdbus.sim.host import GAP
+from pycdbus.regs import *
+from pycdbus.crc import modbus_crc
+from pycdbus.framebuf import FrameBuf, FramePool, payload
 
-# pip3 install pythoncrc
-from PyCRC.CRC16 import CRC16
+IS_32BITS           = False
 
-def modbus_crc(data):
-    return CRC16(modbus_flag=True).calculate(data).to_bytes(2, byteorder='little')
 
-IS_32BITS           = False
-DFT_VERSION         = 0x0f
-
-REG_VERSION         = 0x00
-REG_SETTING         = 0x02
-REG_IDLE_WAIT_LEN   = 0x04
-REG_TX_PERMIT_LEN_L = 0x05
-REG_TX_PERMIT_LEN_H = 0x06
-REG_MAX_IDLE_LEN_L  = 0x07
-REG_MAX_IDLE_LEN_H  = 0x08
-REG_TX_PRE_LEN      = 0x09
-REG_FILTER          = 0x0b
-REG_DIV_LS_L        = 0x0c
-REG_DIV_LS_H        = 0x0d
-REG_DIV_HS_L        = 0x0e
-REG_DIV_HS_H        = 0x0f
-REG_INT_MASK_L      = 0x10
-REG_INT_MASK_H      = 0x11
-REG_INT_FLAG_L      = 0x12
-REG_INT_FLAG_H      = 0x13
-REG_RX_LEN          = 0x14
-REG_DAT             = 0x15
-REG_CTRL            = 0x16
-REG_FILTER_M0       = 0x1a
-REG_FILTER_M1       = 0x1b
-REG_FILTER_MSK0     = 0x1c
-REG_FILTER_MSK1     = 0x1d
-
-BIT_SETTING_RX_INVERT       = 1 << 6
-BIT_SETTING_NO_DROP         = 1 << 3
-BIT_SETTING_USER_CRC        = 1 << 2
-BIT_SETTING_TX_INVERT       = 1 << 1
-BIT_SETTING_TX_PUSH_PULL    = 1 << 0
-
-BIT_FLAG_TX_ERROR           = 1 << 7
-BIT_FLAG_TX_CD              = 1 << 6
-BIT_FLAG_TX_BUF_CLEAN       = 1 << 5
-BIT_FLAG_TX_BUF_FREE        = 1 << 4
-BIT_FLAG_RX_ERROR           = 1 << 3
-BIT_FLAG_RX_LOST            = 1 << 2
-BIT_FLAG_RX_BREAK           = 1 << 1
-BIT_FLAG_RX_PENDING         = 1 << 0
-
-BIT_RX_RST                  = 1 << 7
-BIT_RX_CLR_PENDING          = 1 << 4
-BIT_TX_ABORT                = 1 << 3
-BIT_TX_DROP                 = 1 << 2
-BIT_TX_SEND_BREAK           = 1 << 1
-BIT_TX_START                = 1 << 0
-
-
-async def _send_bytes(dut, bytes_, sys_clk, factor, is_z=True):
-    clk_period = 1000000000000 / sys_clk
-    await Timer(1000)
-    factor += 1
-    for byte in bytes_:
-        dut.bus_a.value = 0
-        await Timer(factor * clk_period)
-        for i in range(0, 8):
-            if byte & 0x01 == 0:
-                dut.bus_a.value = 0
-            else:
-                dut.bus_a.value = Logic('z') if is_z else 1
-            await Timer(factor * clk_period)
-            byte = byte >> 1
-        dut.bus_a.value = Logic('z') if is_z else 1
-        await Timer(factor * clk_period)
-        dut.bus_a.value = Logic('z')
-
-# Pass in a frame of data from the outside of the dut.
-async def send_frame(dut, bytes_, sys_clk, factor_l, factor_h):
-    await _send_bytes(dut, bytes_[0:1], sys_clk, factor_l)
-    await _send_bytes(dut, bytes_[1:], sys_clk, factor_h, False)
-    await _send_bytes(dut, modbus_crc(bytes_), sys_clk, factor_h, False)
+class CdbusNode:
+    """CSR access of one cdbus instance of the wrapper.
+
+    The handles and the X-fill values are resolved once, the per byte loops
+    only assign signals and await clock edges.
+    """
+    __slots__ = ('dut', 'idx', 'clk', 'reset_n', 'cs', 'addr', 'read', 'rdata', 'write', 'wdata',
+                 'addr_x', 'wdata_x', 'clk_edge', 'read_only')
+
+    def __init__(self, dut, idx):
+        self.dut = dut
+        self.idx = idx
+        self.clk = getattr(dut, f'clk{idx}')
+        self.reset_n = getattr(dut, f'reset{idx}')
+        self.cs = getattr(dut, f'cs{idx}')
+        self.addr = getattr(dut, f'csr_addr{idx}')
+        self.read = getattr(dut, f'csr_read{idx}')
+        self.rdata = getattr(dut, f'csr_rdata{idx}')
+        self.write = getattr(dut, f'csr_write{idx}')
+        self.wdata = getattr(dut, f'csr_wdata{idx}')
+        self.addr_x = LogicArray('x' * len(self.addr))
+        self.wdata_x = LogicArray('x' * len(self.wdata))
+        self.clk_edge = RisingEdge(self.clk)
+        self.read_only = ReadOnly()
+
+    async def reset(self, duration=10000):
+        self.dut._log.debug(f'idx{self.idx}: resetting')
+        self.reset_n.value = 0
+        await Timer(duration)
+        await self.clk_edge
+        self.reset_n.value = 1
+        self.dut._log.debug(f'idx{self.idx}: out of reset')
+        self.cs.value = 0
+
+    async def csr_read(self, address, burst=False):
+        await self.clk_edge
+        self.cs.value = 1
+        self.addr.value = address
+        self.read.value = 1
+        await self.read_only
+        data = self.rdata.value
+        if not burst:
+            await self.clk_edge
+            self.read.value = 0
+            self.addr.value = self.addr_x
+            self.cs.value = 0
+        return data
+
+    async def csr_write(self, address, data, burst=False):
+        await self.clk_edge
+        self.cs.value = 1
+        self.addr.value = address
+        self.wdata.value = data
+        self.write.value = 1
+        if not burst:
+            await self.clk_edge
+            self.write.value = 0
+            self.addr.value = self.addr_x
+            self.wdata.value = self.wdata_x
+            self.cs.value = 0
+
+    async def write_tx(self, bytes_):
+        last = len(bytes_) - 1
+        for i, byte in enumerate(bytes_):
+            await self.csr_write(REG_DAT, byte, i < last)
+
+    async def read_rx(self, len_, into=None):
+        # into: a FrameBuf (e.g. of a FramePool) filled in place and returned
+        ret = bytearray(len_) if into is None else into.resize(len_)
+        if len_ != 0:
+            await self.clk_edge
+            self.cs.value = 1
+            await self.clk_edge
+            for i in range(len_):
+                val = await self.csr_read(REG_DAT, i < len_ - 1)
+                ret[i] = int(val)
+        return bytes(ret) if into is None else into
+
+    async def read_rx_len(self):
+        return await self.csr_read(REG_RX_LEN)
+
+    async def read_int_flag(self):
+        return await self.csr_read(REG_INT_FLAG_L)
+
+    async def read_int_flag3(self):
+        val0 = await self.csr_read(REG_INT_FLAG_L, True)
+        val1 = await self.csr_read(REG_INT_FLAG_L, True)
+        val2 = await self.csr_read(REG_INT_FLAG_L, False)
+        return val0, val1, val2
+
+    async def check_version(self):
+        value = await self.csr_read(REG_VERSION)
+        self.dut._log.info(f'idx{self.idx}: REG_VERSION: 0x%02x' % int(value))
+        if value != DFT_VERSION:
+            self.dut._log.error(f'idx{self.idx}: version mismatch')
+            exit(-1)
+
+    async def set_div(self, div_ls, div_hs):
+        await self.csr_write(REG_DIV_LS_H, div_ls >> 8, True)
+        await self.csr_write(REG_DIV_LS_L, div_ls & 0xff, True)
+        await self.csr_write(REG_DIV_HS_H, div_hs >> 8, True)
+        await self.csr_write(REG_DIV_HS_L, div_hs & 0xff, False)
+
+    async def set_max_idle_len(self, max_idle_len):
+        await self.csr_write(REG_MAX_IDLE_LEN_H, max_idle_len >> 8, True)
+        await self.csr_write(REG_MAX_IDLE_LEN_L, max_idle_len & 0xff, False)
+
+    async def set_tx_permit_len(self, tx_permit_len):
+        await self.csr_write(REG_TX_PERMIT_LEN_H, tx_permit_len >> 8, True)
+        await self.csr_write(REG_TX_PERMIT_LEN_L, tx_permit_len & 0xff, False)
+
+
+class CsrPort:
+    """A transport of pycdbus.cdctl.Cdctl on the CSR port of a CdbusNode:
+    len_ reads (or the writes) of one address in a burst, as a REG_DAT
+    burst of the SPI slave. The page of a REG_DAT burst is released (or
+    submitted) a few clocks after it, GAP clocks are waited as SpiHost does."""
+
+    def __init__(self, node):
+        self.node = node
+
+    async def read(self, address, len_=1, into=None):
+        # into: a writable buffer of len_ bytes filled in place
+        n = self.node
+        ret = bytearray(len_) if into is None else into
+        if address == REG_DAT and len_:
+            await n.clk_edge
+            n.cs.value = 1
+            await n.clk_edge
+        for i in range(len_):
+            ret[i] = int(await n.csr_read(address, i < len_ - 1))
+        if address == REG_DAT:
+            await self._gap()
+        return bytes(ret) if into is None else into
+
+    async def write(self, address, data):
+        last = len(data) - 1
+        for i, byte in enumerate(data):
+            await self.node.csr_write(address, byte, i < last)
+        if address == REG_DAT:
+            await self._gap()
+
+    async def _gap(self):
+        for _ in range(GAP):
+            await self.node.clk_edge
+
+
+_nodes = {}
+
+# The node object of dut.xxx{idx}, created on first use.
+def node(dut, idx):
+    n = _nodes.get((id(dut), idx))
+    if n is None or n.dut is not dut:
+        n = _nodes[(id(dut), idx)] = CdbusNode(dut, idx)
+    return n
+
+
+class NodeArray:
+    """All cdbus instances of a wrapper, e.g. the 3 of cdbus_wrapper_dft or the N of
+    a generated cdbus_wrapper_n<N> (tools/gen_wrapper.py).
+
+    nodes[i] is the CdbusNode of cdbus_m<i>. each() runs a coroutine on some
+    nodes at the same time, each node has its own csr port.
+    """
+
+    def __init__(self, dut):
+        self.dut = dut
+        count = 0
+        while hasattr(dut, f'clk{count}'):
+            count += 1
+        self.nodes = [node(dut, idx) for idx in range(count)]
+        self.periods = []
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def __getitem__(self, idx):
+        return self.nodes[idx]
+
+    def __iter__(self):
+        return iter(self.nodes)
+
+    def irq(self, idx):
+        return getattr(self.dut, f'irq{idx}')
+
+    def core(self, idx):
+        return getattr(self.dut, f'cdbus_m{idx}')
+
+    def start_clocks(self, sys_clk=40000000, ppm=None):
+        """ppm: clock error of each node, e.g. [0, 100, -150, ...], the periods are
+        rounded to 2 ps for an even duty cycle (80 ppm at 40 MHz)."""
+        ppm = ppm or [0] * len(self)
+        self.periods = [2 * round(500000000000 / (sys_clk * (1 + ppm[n.idx] / 1000000))) for n in self]
+        for n, period in zip(self, self.periods):
+            cocotb.start_soon(Clock(n.clk, period).start())
+        return self.periods
+
+    async def each(self, func, nodes=None):
+        """Run func(node) for the nodes (default: all) at the same time, return their results."""
+        tasks = [cocotb.start_soon(func(n)) for n in (self if nodes is None else nodes)]
+        return [await task for task in tasks]
+
+    async def reset(self, duration=10000):
+        await self.each(lambda n: n.reset(duration))
+
+    async def check_version(self):
+        await self.each(lambda n: n.check_version())
 
 
 async def reset(dut, idx, duration=10000):
-    dut._log.debug(f'idx{idx}: resetting')
-    getattr(dut, f'reset{idx}').value = 0
-    await Timer(duration)
-    await RisingEdge(getattr(dut, f'clk{idx}'))
-    getattr(dut, f'reset{idx}').value = 1
-    dut._log.debug(f'idx{idx}: out of reset')
-    getattr(dut, f'cs{idx}').value = 0
+    await node(dut, idx).reset(duration)
 
 async def csr_read(dut, idx, address, burst=False):
-    addr_len = len(getattr(dut, f'csr_addr{idx}'))
-    
-    await RisingEdge(getattr(dut, f'clk{idx}'))
-    getattr(dut, f'cs{idx}').value = 1
-    getattr(dut, f'csr_addr{idx}').value = address
-    getattr(dut, f'csr_read{idx}').value = 1
-    await ReadOnly()
-    data = getattr(dut, f'csr_rdata{idx}').value
-    if not burst:
-        await RisingEdge(getattr(dut, f'clk{idx}'))
-        getattr(dut, f'csr_read{idx}').value = 0
-        getattr(dut, f'csr_addr{idx}').value = LogicArray('x' * addr_len)
-        getattr(dut, f'cs{idx}').value = 0
-    return data
+    return await node(dut, idx).csr_read(address, burst)
 
 async def csr_write(dut, idx, address, data, burst=False):
-    addr_len = len(getattr(dut, f'csr_addr{idx}'))
-    wdata_len = len(getattr(dut, f'csr_wdata{idx}'))
-    
-    await RisingEdge(getattr(dut, f'clk{idx}'))
-    getattr(dut, f'cs{idx}').value = 1
-    getattr(dut, f'csr_addr{idx}').value = address
-    getattr(dut, f'csr_wdata{idx}').value = data
-    getattr(dut, f'csr_write{idx}').value = 1
-    if not burst:
-        await RisingEdge(getattr(dut, f'clk{idx}'))
-        getattr(dut, f'csr_write{idx}').value = 0
-        getattr(dut, f'csr_addr{idx}').value = LogicArray('x' * addr_len)
-        getattr(dut, f'csr_wdata{idx}').value = LogicArray('x' * wdata_len)
-        getattr(dut, f'cs{idx}').value = 0
+    await node(dut, idx).csr_write(address, data, burst)
 
 
 async def check_version(dut, idx):
-    value = await csr_read(dut, idx, REG_VERSION)
-    dut._log.info(f'idx{idx}: REG_VERSION: 0x%02x' % int(value))
-    if value != DFT_VERSION:
-        dut._log.error(f'idx{idx}: version mismatch')
-        exit(-1)
+    await node(dut, idx).check_version()
 
 async def set_div(dut, idx, div_ls, div_hs):
-    await csr_write(dut, idx, REG_DIV_LS_H, div_ls >> 8, True)
-    await csr_write(dut, idx, REG_DIV_LS_L, div_ls & 0xff, True)
-    await csr_write(dut, idx, REG_DIV_HS_H, div_hs >> 8, True)
-    await csr_write(dut, idx, REG_DIV_HS_L, div_hs & 0xff, False)
+    await node(dut, idx).set_div(div_ls, div_hs)
 
 async def set_max_idle_len(dut, idx, max_idle_len):
-    await csr_write(dut, idx, REG_MAX_IDLE_LEN_H, max_idle_len >> 8, True)
-    await csr_write(dut, idx, REG_MAX_IDLE_LEN_L, max_idle_len & 0xff, False)
+    await node(dut, idx).set_max_idle_len(max_idle_len)
 
 async def set_tx_permit_len(dut, idx, tx_permit_len):
-    await csr_write(dut, idx, REG_TX_PERMIT_LEN_H, tx_permit_len >> 8, True)
-    await csr_write(dut, idx, REG_TX_PERMIT_LEN_L, tx_permit_len & 0xff, False)
+    await node(dut, idx).set_tx_permit_len(tx_permit_len)
 
 async def write_tx(dut, idx, bytes_):
-    if len(bytes_) == 0:
-        return
-    for i in range(len(bytes_)):
-        await csr_write(dut, idx, REG_DAT, bytes_[i], i < len(bytes_) - 1)
-
-async def read_rx(dut, idx, len_):
-    ret = b''
-    if len_ == 0:
-        return ret
-    await RisingEdge(getattr(dut, f'clk{idx}'))
-    getattr(dut, f'cs{idx}').value = 1
-    await RisingEdge(getattr(dut, f'clk{idx}'))
-    for i in range(len_):
-        val = await csr_read(dut, idx, REG_DAT, i < len_ - 1)
-        ret += bytes([int(val)])
-    return ret
+    await node(dut, idx).write_tx(bytes_)
+
+async def read_rx(dut, idx, len_, into=None):
+    return await node(dut, idx).read_rx(len_, into)
 
 async def read_rx_len(dut, idx):
-    return await csr_read(dut, idx, REG_RX_LEN)
+    return await node(dut, idx).read_rx_len()
 
 async def read_int_flag(dut, idx):
-    return await csr_read(dut, idx, REG_INT_FLAG_L)
+    return await node(dut, idx).read_int_flag()
 
 async def read_int_flag3(dut, idx):
-    val0 = await csr_read(dut, idx, REG_INT_FLAG_L, True)
-    val1 = await csr_read(dut, idx, REG_INT_FLAG_L, True)
-    val2 = await csr_read(dut, idx, REG_INT_FLAG_L, False)
-    return val0, val1, val2
+    return await node(dut, idx).read_int_flag3()
 
 
 async def exit_err():
@@ -0,0 +1,98 @@
+# This Source Code Form is subject to the terms of the Mozilla
+# Public License, v. 2.0. If a copy of the MPL was not distributed
+# with this file, You can obtain one at https://mozilla.org/MPL/2.0/.
+# Notice: The scope granted to MPL excludes the ASIC industry.
+#
+# Copyright (c) 2017 DUKELEC, All rights reserved.
+#
+# Author: Duke Fong <d@d-l.io>
+#
+
+# 16 nodes on the generated wrapper cdbus_wrapper_n16, clocks within +-200 ppm:
+# nodes 0 ~ 14 start to send at the same time to node 15, in arbitration mode
+# (the first byte decides, lsb first and 0 dominant) and in bs mode (the tx
+# permit slot decides).
+
+from common import *
+from cocotb.triggers import ClockCycles
+
+SENDERS = 15
+RX_IDX = 15
+
+
+def arbitration_key(byte):
+    return int(f'{byte:08b}'[::-1], 2) # lsb is sent first
+
+
+async def receive(arr, count):
+    n = arr[RX_IDX]
+    irq = arr.irq(RX_IDX)
+    frames = []
+    while len(frames) < count:
+        if not irq.value:
+            await RisingEdge(irq)
+        if int(await n.read_int_flag()) & BIT_FLAG_RX_PENDING:
+            len_ = int(await n.read_rx_len()) # user data length
+            frames.append(await n.read_rx(len_ + 3))
+        await ClockCycles(n.clk, 3) # the page is released after the chip select goes low
+    return frames
+
+
+async def send_all(dut, arr, setting, tx_permit_len):
+    await arr.reset()
+
+    async def setup(n):
+        await n.csr_write(REG_SETTING, setting)
+        await n.set_div(39, 2) # 1Mbps, 13.333Mbps
+        await n.set_tx_permit_len(tx_permit_len(n.idx))
+        await n.csr_write(REG_FILTER, n.idx + 1)
+        # the losers of the arbitration get BIT_FLAG_TX_CD and retry, not an error
+        await n.csr_write(REG_INT_MASK_L, BIT_FLAG_TX_ERROR | BIT_FLAG_RX_ERROR |
+                                          (BIT_FLAG_RX_PENDING if n.idx == RX_IDX else 0))
+    await arr.each(setup)
+    await Timer(20, unit='us') # bus idle for every node
+
+    frames = [bytes([idx + 1, RX_IDX + 1, 1, idx]) for idx in range(SENDERS)]
+    rx = cocotb.start_soon(receive(arr, SENDERS))
+    await arr.each(lambda n: n.write_tx(frames[n.idx]), arr[:SENDERS])
+    received = await rx
+
+    for idx in range(SENDERS):
+        if arr.irq(idx).value:
+            val = await arr[idx].read_int_flag()
+            dut._log.error(f'idx{idx}: REG_INT_FLAG: 0x{int(val):02x}')
+            await exit_err()
+    return frames, received
+
+
+@cocotb.test(timeout_time=2, timeout_unit='ms')
+async def test_cdbus(dut):
+    dut._log.info('test_cdbus start.')
+
+    arr = NodeArray(dut)
+    if len(arr) != 16:
+        dut._log.error(f'wrong wrapper, {len(arr)} nodes')
+        await exit_err()
+    ppm = [(idx % 5 - 2) * 100 for idx in range(len(arr))]
+    arr.start_clocks(40000000, ppm)
+    await arr.reset()
+    await arr.check_version()
+
+    dut._log.info('arbitration mode')
+    frames, received = await send_all(dut, arr, 0b00010001, lambda idx: 20)
+    expected = sorted(frames, key=lambda f: arbitration_key(f[0]))
+    dut._log.info(f"idx{RX_IDX}: received: {' '.join(f.hex() for f in received)}")
+    if received != expected:
+        dut._log.error(f'idx{RX_IDX}: arbitration order mismatch')
+        await exit_err()
+
+    dut._log.info('bs mode')
+    # slot of node i: 20 + 3 * i low speed bits, the lowest slot wins each frame
+    frames, received = await send_all(dut, arr, 0b00100001, lambda idx: 20 + 3 * idx)
+    dut._log.info(f"idx{RX_IDX}: received: {' '.join(f.hex() for f in received)}")
+    if received != frames:
+        dut._log.error(f'idx{RX_IDX}: bs order mismatch')
+        await exit_err()
+
+    dut._log.info('test_cdbus done.')
+    await exit_ok()
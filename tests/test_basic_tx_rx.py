@@ -50,9 +50,9 @@ async def test_cdbus(dut):
     val, len_, val1 = await read_int_flag3(dut, 1)
     dut._log.info(f'REG_INT_FLAG2: 0x{int(val):02x}, len: 0x{int(len_):02x}, val1: 0x{int(val1):02x}')
     
-    str_ = (await read_rx(dut, 1, 6)).hex() # read 6 bytes (include crc)
-    dut._log.info(f'idx1: received: {str_}')
-    if str_ != '010201cd601d':
+    ret = await read_rx(dut, 1, 6) # read 6 bytes (include crc)
+    dut._log.info(f'idx1: received: {ret.hex()}')
+    if ret != b'\x01\x02\x01\xcd\x60\x1d':
         dut._log.error(f'idx1: receive mismatch')
         await exit_err()
     
@@ -62,11 +62,8 @@ async def test_cdbus(dut):
     
     # test spram read and write conflict
     
-    payload = b''
-    for x in range(64):
-        payload += bytes([x])
-    dut._log.info(f'payload len: {len(payload)}')
-    tx_pkt = b'\x01\x02' + bytes([len(payload)]) + payload
+    tx_pkt = b'\x01\x02' + bytes([64]) + payload(64)
+    dut._log.info(f'payload len: {len(tx_pkt) - 3}')
     
     await Timer(10, unit='us')
     await write_tx(dut, 0, tx_pkt) # node 0x01 send to 0x02
@@ -82,9 +79,9 @@ async def test_cdbus(dut):
     val = await read_int_flag(dut, 1)
     dut._log.info(f'REG_INT_FLAG: 0x{int(val):02x}, len: 0x{int(len_):02x}')
     
-    str_ = (await read_rx(dut, 1, 64+5)).hex()
+    ret = await read_rx(dut, 1, 64+5, FrameBuf())
     dut._log.info(f'idx1: sent:     {tx_pkt.hex()}')
-    dut._log.info(f'idx1: received: {str_} (not equal for spram)')
+    dut._log.info(f'idx1: received: {ret.hex()} (not equal for spram)')
     
     dut._log.info('test_cdbus done.')
     await exit_ok()
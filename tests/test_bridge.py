@@ -0,0 +1,95 @@
+# This Source Code Form is subject to the terms of the Mozilla
+# Public License, v. 2.0. If a copy of the MPL was not distributed
+# with this file, You can obtain one at https://mozilla.org/MPL/2.0/.
+# Notice: The scope granted to MPL excludes the ASIC industry.
+#
+# Copyright (c) 2017 DUKELEC, All rights reserved.
+#
+# Author: Duke Fong <d@d-l.io>
+#
+
+# pycdbus.bridge: host software in a thread of its own, with its own asyncio
+# loop, drives the CSR ports of cdbus_m0 and cdbus_m1 through the socket of
+# pycdbus.sim.bridge.BridgeServer: pycdbus.cdctl sends on m0, an RxEngine on
+# the irq of m1 receives.
+
+import random, asyncio, tempfile, threading
+from pathlib import Path
+from common import *
+from pycdbus.cdctl import Cdctl, RxEngine
+from pycdbus.bridge import Bridge
+from pycdbus.sim.bridge import BridgeServer
+
+
+async def host(path, frames):
+    bridge = await Bridge.connect(path)
+    m0, m1 = Cdctl(bridge.csr('m0')), Cdctl(bridge.csr('m1'))
+    for idx, cdctl in enumerate((m0, m1)):
+        await cdctl.check_version()
+        await cdctl.setup(idx + 1)
+        await cdctl.set_div(39, 2) # 1Mbps, 13.333Mbps
+    rx = RxEngine(m1, bridge.irq('irq1'))
+    await rx.start()
+
+    async def send():
+        for frame in frames:
+            await m0.send(frame)
+
+    async def recv():
+        ret = []
+        async for frame in rx:
+            ret.append(frame)
+            if len(ret) == len(frames):
+                return ret
+
+    _, ret = await asyncio.wait_for(asyncio.gather(send(), recv()), 60)
+    await bridge.close()
+    return ret, bridge.stat, rx.stat
+
+
+@cocotb.test(timeout_time=100000, timeout_unit='us')
+async def test_cdbus(dut):
+    dut._log.info('test_cdbus start.')
+    random.seed(4)
+
+    sys_clk = 40000000
+    clk_period = 1000000000000 / sys_clk
+
+    cocotb.start_soon(Clock(dut.clk0, clk_period).start())
+    cocotb.start_soon(Clock(dut.clk1, clk_period).start())
+    await reset(dut, 0)
+    await reset(dut, 1)
+
+    path = str(Path(tempfile.mkdtemp()) / 'cdbus.sock')
+    server = BridgeServer(path)
+    server.add_csr('m0', CsrPort(node(dut, 0)))
+    server.add_csr('m1', CsrPort(node(dut, 1)))
+    server.add_irq('irq1', dut.irq1, active_low=False)
+
+    frames = [bytes([1, 2, size]) + random.randbytes(size) for size in (0, 1, 253, 64, 8, 128)]
+    result = {}
+
+    def run():
+        try:
+            result['frames'], result['bridge'], result['rx'] = asyncio.run(host(path, frames))
+        except Exception as err:
+            result['error'] = repr(err)
+
+    thread = threading.Thread(target=run)
+    thread.start()
+    await server.serve()
+    thread.join()
+
+    dut._log.info(f'server: {server.stat}, result: {result.get("bridge")}, rx: {result.get("rx")}')
+    if 'error' in result:
+        dut._log.error(f'host: {result["error"]}')
+        await exit_err()
+    if result['frames'] != frames:
+        dut._log.error(f'frames mismatch: {[(len(f), f[:4].hex()) for f in result["frames"]]}')
+        await exit_err()
+    if not server.stat['irqs'] or result['rx']['wakeups'] > len(frames):
+        dut._log.error(f'irq of m1 not followed')
+        await exit_err()
+
+    dut._log.info('test_cdbus done.')
+    await exit_ok()
@@ -65,9 +65,9 @@ async def test_cdbus(dut):
         dut._log.error(f'idx2: not receive break')
         await exit_err()
     
-    str_ = (await read_rx(dut, 2, 4)).hex() # read 4 bytes
-    dut._log.info(f'idx2: received: {str_}')
-    if str_ != '550301c5':
+    ret = await read_rx(dut, 2, 4) # read 4 bytes
+    dut._log.info(f'idx2: received: {ret.hex()}')
+    if ret != b'\x55\x03\x01\xc5':
         dut._log.error(f'idx2: receive mismatch first frame')
         await exit_err()
     
@@ -78,9 +78,9 @@ async def test_cdbus(dut):
     val = await read_int_flag(dut, 2)
     dut._log.info(f'REG_INT_FLAG: 0x{int(val):02x}')
     
-    str_ = (await read_rx(dut, 2, 4)).hex() # read 4 bytes
-    dut._log.info(f'idx2: received: {str_}')
-    if str_ != 'a50301ca':
+    ret = await read_rx(dut, 2, 4) # read 4 bytes
+    dut._log.info(f'idx2: received: {ret.hex()}')
+    if ret != b'\xa5\x03\x01\xca':
         dut._log.error(f'idx2: receive mismatch second frame')
         await exit_err()
     
@@ -103,9 +103,9 @@ async def test_cdbus(dut):
         dut._log.error(f'idx2: not receive break')
         await exit_err()
     
-    str_ = (await read_rx(dut, 2, 4)).hex() # read 4 bytes
-    dut._log.info(f'idx2: received: {str_}')
-    if str_ != 'a50301ca':
+    ret = await read_rx(dut, 2, 4) # read 4 bytes
+    dut._log.info(f'idx2: received: {ret.hex()}')
+    if ret != b'\xa5\x03\x01\xca':
         dut._log.error(f'idx2: receive mismatch first frame')
         await exit_err()
     
@@ -116,9 +116,9 @@ async def test_cdbus(dut):
     val = await read_int_flag(dut, 2)
     dut._log.info(f'REG_INT_FLAG: 0x{int(val):02x}')
     
-    str_ = (await read_rx(dut, 2, 4)).hex() # read 4 bytes
-    dut._log.info(f'idx2: received: {str_}')
-    if str_ != '550301c5':
+    ret = await read_rx(dut, 2, 4) # read 4 bytes
+    dut._log.info(f'idx2: received: {ret.hex()}')
+    if ret != b'\x55\x03\x01\xc5':
         dut._log.error(f'idx2: receive mismatch second frame')
         await exit_err()
     
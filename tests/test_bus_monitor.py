@@ -0,0 +1,104 @@
+# This Source Code Form is subject to the terms of the Mozilla
+# Public License, v. 2.0. If a copy of the MPL was not distributed
+# with this file, You can obtain one at https://mozilla.org/MPL/2.0/.
+# Notice: The scope granted to MPL excludes the ASIC industry.
+#
+# Copyright (c) 2017 DUKELEC, All rights reserved.
+#
+# Author: Duke Fong <d@d-l.io>
+#
+
+# pycdbus.sim.monitor.BusMonitor on bus_a: two subscribers, a scoreboard of
+# the frames in the order they win the bus and a wire latency probe, with
+# colliding senders in arbitration mode, then break characters in BS mode.
+
+import random
+from common import *
+from cocotb.triggers import Combine
+from cocotb.simtime import get_sim_time
+from pycdbus.sim.monitor import BusMonitor
+from pycdbus.sim.latency import stats
+
+@cocotb.test(timeout_time=3000, timeout_unit='us')
+async def test_cdbus(dut):
+    dut._log.info('test_cdbus start.')
+    random.seed(2)
+
+    sys_clk = 40000000
+    clk_period = 1000000000000 / sys_clk
+
+    cocotb.start_soon(Clock(dut.clk0, clk_period).start())
+    cocotb.start_soon(Clock(dut.clk1, clk_period).start())
+    cocotb.start_soon(Clock(dut.clk2, clk_period).start())
+    for idx in range(3):
+        await reset(dut, idx)
+        await check_version(dut, idx)
+        await csr_write(dut, idx, REG_SETTING, 0b00010001) # arbitration
+        await set_div(dut, idx, 39, 2) # 1Mbps, 13.333Mbps
+        await csr_write(dut, idx, REG_FILTER, idx + 1)
+        await csr_write(dut, idx, REG_INT_MASK_L, BIT_FLAG_TX_BUF_CLEAN)
+
+    mon = BusMonitor(dut.bus_a, sys_clk, core=dut.cdbus_m0)
+    await Timer(20, unit='us') # idle at the new baud rate
+
+    expected = {1: [], 2: []} # by src
+    queued = {}
+    errors = []
+    wire = []
+
+    @mon.subscribe
+    def scoreboard(f):
+        if f.kind == 'break':
+            return
+        queue = expected.get(f.src)
+        if f.kind != 'ok' or not queue or queue[0] != f.data[:-2]:
+            errors.append(f'unexpected {f.kind} frame: {f.data.hex()}')
+        else:
+            queue.pop(0)
+
+    @mon.subscribe
+    def latency(f):
+        if f.kind == 'ok':
+            wire.append((f.start - queued.pop(bytes(f.data[:-2]))) / 1000000)
+
+    async def send(idx, frame):
+        expected[idx + 1].append(frame)
+        await write_tx(dut, idx, frame)
+        queued[frame] = get_sim_time('ps')
+
+    for i in range(8):
+        size = random.choice([0, 1, 31, 60, 128, 253, random.randint(0, 253)])
+        data = bytes(random.getrandbits(8) for _ in range(size))
+        tx0 = bytes([1, 3, size]) + data
+        tx1 = bytes([2, 3, len(data) // 2]) + data[:len(data) // 2]
+        cocotb.start_soon(send(0, tx0))
+        cocotb.start_soon(send(1, tx1))
+        await Combine(RisingEdge(dut.irq0), RisingEdge(dut.irq1))
+
+    # the last frame comes out of the timed callback, without any more edges
+    await Timer(20, unit='us')
+    pending = sum(len(q) for q in expected.values())
+    dut._log.info(f'monitor: {dict(mon.stat)}, wire latency (us): {stats(wire)}')
+    if errors or pending or mon.stat['ok'] != 16 or len(wire) != 16:
+        dut._log.error(f'monitor: {pending} frames missing, errors: {errors}')
+        await exit_err()
+
+    for idx in range(3):
+        await csr_write(dut, idx, REG_SETTING, 0b00100001) # bs mode
+        await set_max_idle_len(dut, idx, 40)
+        await set_tx_permit_len(dut, idx, 10 + 10 * idx)
+    await Timer(60, unit='us') # exceed max idle
+    cocotb.start_soon(send(0, b'\x01\x03\x01\xc5'))
+    cocotb.start_soon(send(1, b'\x02\x03\x01\xca'))
+    await Combine(RisingEdge(dut.irq0), RisingEdge(dut.irq1))
+    await Timer(20, unit='us')
+
+    pending = sum(len(q) for q in expected.values())
+    dut._log.info(f'monitor: {dict(mon.stat)}')
+    if errors or pending or not mon.stat['break'] or mon.stat['ok'] != 18:
+        dut._log.error(f'monitor: bs mode: {pending} frames missing, errors: {errors}')
+        await exit_err()
+    mon.stop()
+
+    dut._log.info('test_cdbus done.')
+    await exit_ok()
@@ -0,0 +1,63 @@
+# This Source Code Form is subject to the terms of the Mozilla
+# Public License, v. 2.0. If a copy of the MPL was not distributed
+# with this file, You can obtain one at https://mozilla.org/MPL/2.0/.
+# Notice: The scope granted to MPL excludes the ASIC industry.
+#
+# Copyright (c) 2017 DUKELEC, All rights reserved.
+#
+# Author: Duke Fong <d@d-l.io>
+#
+
+import random
+from common import *
+from pycdbus.crc import crc16, crc16_bit, crc16_batch, Crc16
+
+# Cross-check the table-driven CRC against the bit-serial LFSR of hdl/cd_crc.v
+@cocotb.test(timeout_time=2000, timeout_unit='us')
+async def test_cdbus(dut):
+    dut._log.info('test_cdbus start.')
+    random.seed(0)
+    
+    cocotb.start_soon(Clock(dut.clk, 10, unit='ns').start())
+    dut.clean.value = 1
+    dut.data_clk.value = 0
+    dut.data_in.value = 0
+    clk_edge = RisingEdge(dut.clk)
+    await clk_edge
+    
+    frames = [b'', b'\x01\x02\x01\xcd'] + [random.randbytes(random.randint(1, 258)) for _ in range(40)]
+    for frame in frames:
+        await clk_edge
+        dut.clean.value = 0
+        ref = Crc16()
+        bit_crc = 0xffff
+        for byte in frame:
+            for i in range(8): # LSB first, as cd_tx_ser / cd_rx_des feed it
+                bit = (byte >> i) & 1
+                dut.data_in.value = bit
+                dut.data_clk.value = 1
+                await clk_edge
+                bit_crc = crc16_bit(bit_crc, bit)
+            dut.data_clk.value = 0
+            await clk_edge
+            ref.update(bytes([byte]))
+            await ReadOnly()
+            hdl_crc = int(dut.crc_out.value)
+            if hdl_crc != ref.crc or hdl_crc != bit_crc:
+                dut._log.error(f'crc mismatch, hdl: {hdl_crc:04x}, table: {ref.crc:04x}, bit: {bit_crc:04x}')
+                await exit_err()
+            await clk_edge
+        
+        await ReadOnly()
+        if int(dut.crc_out.value) != crc16(frame):
+            dut._log.error(f'frame crc mismatch: {frame.hex()}')
+            await exit_err()
+        await clk_edge
+        dut.clean.value = 1
+    
+    if crc16_batch(frames) != [crc16(f) for f in frames]:
+        dut._log.error(f'batch crc mismatch')
+        await exit_err()
+    
+    dut._log.info('test_cdbus done.')
+    await exit_ok()
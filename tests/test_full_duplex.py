@@ -47,9 +47,9 @@ async def test_cdbus(dut):
     val = await read_int_flag(dut, 1)
     dut._log.info(f'REG_INT_FLAG: 0x{int(val):02x}')
     
-    str_ = (await read_rx(dut, 1, 4)).hex()
-    dut._log.info(f'idx1: received: {str_}')
-    if str_ != '01020112':
+    ret = await read_rx(dut, 1, 4)
+    dut._log.info(f'idx1: received: {ret.hex()}')
+    if ret != b'\x01\x02\x01\x12':
         dut._log.error(f'idx1: receive mismatch')
         await exit_err()
     
@@ -62,9 +62,9 @@ async def test_cdbus(dut):
     val = await read_int_flag(dut, 0)
     dut._log.info(f'REG_INT_FLAG: 0x{int(val):02x}')
     
-    str_ = (await read_rx(dut, 0, 4)).hex()
-    dut._log.info(f'idx1: received: {str_}')
-    if str_ != '02010121':
+    ret = await read_rx(dut, 0, 4)
+    dut._log.info(f'idx1: received: {ret.hex()}')
+    if ret != b'\x02\x01\x01\x21':
         dut._log.error(f'idx0: receive mismatch')
         await exit_err()
     
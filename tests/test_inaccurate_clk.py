@@ -40,26 +40,24 @@ async def test_cdbus(dut):
     await csr_write(dut, 0, REG_FILTER, 0x01) # set local filter to 0x01
     await csr_write(dut, 1, REG_FILTER, 0x02) # set local filter to 0x02
     
-    payload = b''
-    for i in range(253):
-        payload += bytes([i])
-    dut._log.info(f'payload len: {len(payload)}')
+    data = payload(253)
+    dut._log.info(f'payload len: {len(data)}')
     
-    await write_tx(dut, 0, b'\x01\x02' + bytes([len(payload)]) + payload) # node 0x01 send to 0x02
+    await write_tx(dut, 0, b'\x01\x02' + bytes([len(data)]) + data) # node 0x01 send to 0x02
     #await csr_write(dut, 0, REG_CTRL, BIT_TX_START)
     
-    await write_tx(dut, 1, b'\x02\x01' + bytes([len(payload)]) + payload) # node 0x02 send to 0x01
+    await write_tx(dut, 1, b'\x02\x01' + bytes([len(data)]) + data) # node 0x02 send to 0x01
     #await csr_write(dut, 1, REG_CTRL, BIT_TX_START)
 
     await RisingEdge(dut.irq1)
     val = await read_int_flag(dut, 1)
     dut._log.info(f'REG_INT_FLAG: 0x{int(val):02x}')
     
-    ret = await read_rx(dut, 1, 256)
-    str_ = ret[0:3].hex()
+    frame = FrameBuf()
+    ret = await read_rx(dut, 1, 256, frame)
     dut._log.info(f'ret: {ret.hex()}')
-    dut._log.info(f'idx1: received: {str_}, last: 0x{ret[-1]:02x}')
-    if str_ != '0102fd' or ret[-1] != 0xfc:
+    dut._log.info(f'idx1: received: {ret[0:3].hex()}, last: 0x{ret[-1]:02x}')
+    if ret[0:3] != b'\x01\x02\xfd' or ret[-1] != 0xfc:
         dut._log.error(f'idx1: receive mismatch')
         await exit_err()
     
@@ -70,11 +68,10 @@ async def test_cdbus(dut):
     val = await read_int_flag(dut, 0)
     dut._log.info(f'REG_INT_FLAG: 0x{int(val):02x}')
     
-    ret = await read_rx(dut, 0, 256)
-    str_ = ret[0:3].hex()
+    ret = await read_rx(dut, 0, 256, frame)
     dut._log.info(f'ret: {ret.hex()}')
-    dut._log.info(f'idx0: received: {str_}, last: 0x{ret[-1]:02x}')
-    if str_ != '0201fd' or ret[-1] != 0xfc:
+    dut._log.info(f'idx0: received: {ret[0:3].hex()}, last: 0x{ret[-1]:02x}')
+    if ret[0:3] != b'\x02\x01\xfd' or ret[-1] != 0xfc:
         dut._log.error(f'idx0: receive mismatch')
         await exit_err()
     
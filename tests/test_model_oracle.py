@@ -0,0 +1,99 @@
+# This Source Code Form is subject to the terms of the Mozilla
+# Public License, v. 2.0. If a copy of the MPL was not distributed
+# with this file, You can obtain one at https://mozilla.org/MPL/2.0/.
+# Notice: The scope granted to MPL excludes the ASIC industry.
+#
+# Copyright (c) 2017 DUKELEC, All rights reserved.
+#
+# Author: Duke Fong <d@d-l.io>
+#
+
+import random
+from common import *
+from cocotb.triggers import Combine
+from pycdbus.model import Bus, Node
+
+# Run the same traffic on the RTL and on pycdbus.model, without reading the
+# receiver until the end, then compare the rx pages, flags and dirty bitmap.
+@cocotb.test(timeout_time=8000, timeout_unit='us')
+async def test_cdbus(dut):
+    dut._log.info('test_cdbus start.')
+    random.seed(1)
+
+    sys_clk = 40000000
+    clk_period = 1000000000000 / sys_clk
+
+    bus = Bus([Node(idx, sys_clk) for idx in range(3)])
+    try: # a half-duplex bus only
+        bus.nodes[0].write(REG_SETTING, 0b00110001) # full duplex
+        dut._log.error('model: full-duplex mode accepted')
+        await exit_err()
+    except ValueError:
+        pass
+
+    async def csr_write_both(idx, address, data):
+        await csr_write(dut, idx, address, data)
+        bus.nodes[idx].write(address, data)
+
+    cocotb.start_soon(Clock(dut.clk0, clk_period).start())
+    cocotb.start_soon(Clock(dut.clk1, clk_period).start())
+    cocotb.start_soon(Clock(dut.clk2, clk_period).start())
+    for idx in range(3):
+        await reset(dut, idx)
+        await check_version(dut, idx)
+        await csr_write_both(idx, REG_SETTING, 0b00010001)
+        await csr_write_both(idx, REG_DIV_LS_L, 39) # 1Mbps, 13.333Mbps
+        await csr_write_both(idx, REG_DIV_HS_L, 2)
+        await csr_write_both(idx, REG_FILTER, idx + 1)
+        await csr_write_both(idx, REG_INT_MASK_L, BIT_FLAG_TX_BUF_CLEAN)
+
+    for i in range(24):
+        size = random.choice([0, 1, 31, 32, 60, 128, 200, 253, random.randint(0, 253)])
+        payload = bytes(random.getrandbits(8) for _ in range(size))
+        if i % 4 == 3: # both send at the same time, same length
+            tx0 = b'\x01\x03' + bytes([size]) + payload
+            tx1 = b'\x02\x03' + bytes([size]) + bytes(reversed(payload))
+            dut._log.info(f'{i}: collision, size {size}')
+            cocotb.start_soon(write_tx(dut, 0, tx0))
+            cocotb.start_soon(write_tx(dut, 1, tx1))
+            bus.nodes[0].write_burst(REG_DAT, tx0)
+            bus.nodes[1].write_burst(REG_DAT, tx1)
+            await Combine(RisingEdge(dut.irq0), RisingEdge(dut.irq1))
+        else:
+            idx = i % 2
+            tx = bytes([idx + 1, 3, size]) + payload
+            dut._log.info(f'{i}: idx{idx} send, size {size}')
+            await write_tx(dut, idx, tx)
+            bus.nodes[idx].write_burst(REG_DAT, tx)
+            await RisingEdge(getattr(dut, f'irq{idx}'))
+        bus.run()
+
+    await Timer(20, unit='us')
+    model = bus.nodes[2]
+    frame = FrameBuf()
+    dirty = int(dut.cdbus_m2.cd_rx_ram_m.dirty.value)
+    dut._log.info(f'dirty: rtl {dirty:016x}, model {model.rx_ram.dirty:016x}')
+    if dirty != model.rx_ram.dirty:
+        dut._log.error(f'dirty mismatch')
+        await exit_err()
+
+    while True:
+        val, len_, val_h = await read_int_flag3(dut, 2)
+        ref = model.read_burst(REG_INT_FLAG_L, 3)
+        dut._log.info(f'int flag: rtl {int(val):02x} {int(len_)} {int(val_h):02x}, model {ref.hex()}')
+        # bit 15/14 depend on the exact idle timing
+        if bytes([int(val), int(len_), int(val_h) & 0x3f]) != bytes([ref[0], ref[1], ref[2] & 0x3f]):
+            dut._log.error(f'int flag mismatch')
+            await exit_err()
+        if not (int(val) & BIT_FLAG_RX_PENDING):
+            break
+        ret = await read_rx(dut, 2, int(len_) + 5, frame)
+        ref = model.read_burst(REG_DAT, int(len_) + 5)
+        dut._log.info(f'idx2: received: {ret.hex()}')
+        if ret != ref:
+            dut._log.error(f'idx2: receive mismatch, model: {ref.hex()}')
+            await exit_err()
+        await Timer(1, unit='us')
+
+    dut._log.info('test_cdbus done.')
+    await exit_ok()
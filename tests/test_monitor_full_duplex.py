@@ -0,0 +1,58 @@
+# This Source Code Form is subject to the terms of the Mozilla
+# Public License, v. 2.0. If a copy of the MPL was not distributed
+# with this file, You can obtain one at https://mozilla.org/MPL/2.0/.
+# Notice: The scope granted to MPL excludes the ASIC industry.
+#
+# Copyright (c) 2017 DUKELEC, All rights reserved.
+#
+# Author: Duke Fong <d@d-l.io>
+#
+
+# One pycdbus.sim.monitor.BusMonitor on each line of a full duplex link,
+# both nodes send at the same time: the frames overlap on the two lines.
+
+from common import *
+from pycdbus.sim.monitor import BusMonitor
+
+@cocotb.test(timeout_time=500, timeout_unit='us')
+async def test_cdbus(dut):
+    dut._log.info('test_cdbus start.')
+
+    sys_clk = 40000000
+    clk_period = 1000000000000 / sys_clk
+
+    cocotb.start_soon(Clock(dut.clk0, clk_period).start())
+    cocotb.start_soon(Clock(dut.clk1, clk_period).start())
+    for idx in range(2):
+        await reset(dut, idx)
+        await check_version(dut, idx)
+        await csr_write(dut, idx, REG_SETTING, 0b00110001) # full duplex
+        await set_div(dut, idx, 2, 2)
+        await csr_write(dut, idx, REG_FILTER, idx + 1)
+
+    frames = {0: [], 1: []}
+    mons = [BusMonitor(getattr(dut, f'tx{idx}'), sys_clk, core=getattr(dut, f'cdbus_m{idx}')) for idx in range(2)]
+    for idx, mon in enumerate(mons):
+        mon.subscribe(frames[idx].append)
+    await Timer(5, unit='us')
+
+    sent = [b'\x01\x02\x03\x12\x34\x56', b'\x02\x01\x02\x21\x43']
+    cocotb.start_soon(write_tx(dut, 0, sent[0]))
+    await write_tx(dut, 1, sent[1])
+    await Timer(10, unit='us')
+
+    for idx in range(2):
+        got = [(f.kind, f.data[:-2].hex()) for f in frames[idx]]
+        dut._log.info(f'tx{idx}: {got}, {dict(mons[idx].stat)}')
+        if got != [('ok', sent[idx].hex())]:
+            dut._log.error(f'tx{idx}: frames mismatch')
+            await exit_err()
+    f0, f1 = frames[0][0], frames[1][0]
+    if not (f0.start < f1.end and f1.start < f0.end):
+        dut._log.error(f'frames do not overlap: {f0}, {f1}')
+        await exit_err()
+    for mon in mons:
+        mon.stop()
+
+    dut._log.info('test_cdbus done.')
+    await exit_ok()
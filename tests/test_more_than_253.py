@@ -40,15 +40,13 @@ async def test_cdbus(dut):
     await csr_write(dut, 0, REG_FILTER, 0x01) # set local filter to 0x01
     await csr_write(dut, 1, REG_FILTER, 0x02) # set local filter to 0x02
     
-    payload = b''
-    for i in range(253+2):
-        payload += bytes([i])
-    dut._log.info(f'payload len: {len(payload)}')
+    data = payload(253+2)
+    dut._log.info(f'payload len: {len(data)}')
+    tx_pkt = b'\x01\x02' + bytes([len(data)]) + data
     
     await Timer(50, unit='us')
-    await send_frame(dut, b'\x01\x02' + bytes([len(payload)]) + payload, sys_clk, 39, 2)
-    tx_str_ = (b'\x01\x02' + bytes([len(payload)]) + payload).hex()
-    dut._log.info(f'send_frame:   {tx_str_}')
+    await send_frame(dut, tx_pkt, sys_clk, 39, 2)
+    dut._log.info(f'send_frame:   {tx_pkt.hex()}')
 
     await RisingEdge(dut.irq1)
     val = await read_int_flag(dut, 1)
@@ -61,22 +59,23 @@ async def test_cdbus(dut):
         dut._log.error(f'idx1: should not rx pending')
         await exit_err()
     
-    rx_str_ = (await read_rx(dut, 1, 256)).hex() # read 6 bytes (include crc)
-    dut._log.info(f'idx1: rx ram: {rx_str_}  (not received)')
-    if rx_str_ != tx_str_:
+    frame = FrameBuf()
+    ret = await read_rx(dut, 1, 256, frame) # read 6 bytes (include crc)
+    dut._log.info(f'idx1: rx ram: {ret.hex()}  (not received)')
+    if ret != tx_pkt:
         dut._log.info(f'idx1: receive mismatch')
     
     
     
-    await write_tx(dut, 0, b'\x01\x02' + bytes([len(payload)]) + payload) # node 0x01 send to 0x02
+    await write_tx(dut, 0, tx_pkt) # node 0x01 send to 0x02
     #await csr_write(dut, 0, REG_CTRL, BIT_TX_START)
     await Timer(250, unit='us')
     
     if IS_32BITS:
-        rx_str_ = (await read_rx(dut, 1, 5)).hex() # read 5 bytes (include crc)
+        ret = await read_rx(dut, 1, 5, frame) # read 5 bytes (include crc)
     else:
-        rx_str_ = (await read_rx(dut, 1, 256)).hex() # read 256 bytes
-    dut._log.info(f'idx1: rx ram: {rx_str_}  (not received)')
+        ret = await read_rx(dut, 1, 256, frame) # read 256 bytes
+    dut._log.info(f'idx1: rx ram: {ret.hex()}  (not received)')
     
     dut._log.info('test_cdbus done.')
     await exit_ok()
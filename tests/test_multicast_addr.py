@@ -51,9 +51,9 @@ async def test_cdbus(dut):
     val = await read_int_flag(dut, 1)
     dut._log.info(f'REG_INT_FLAG: 0x{int(val):02x}')
     
-    str_ = (await read_rx(dut, 1, 4)).hex()
-    dut._log.info(f'idx1: received: {str_}')
-    if str_ != '01e001cd':
+    ret = await read_rx(dut, 1, 4)
+    dut._log.info(f'idx1: received: {ret.hex()}')
+    if ret != b'\x01\xe0\x01\xcd':
         dut._log.error(f'idx1: receive mismatch')
         await exit_err()
     
@@ -73,9 +73,9 @@ async def test_cdbus(dut):
     val = await read_int_flag(dut, 1)
     dut._log.info(f'REG_INT_FLAG: 0x{int(val):02x}')
     
-    str_ = (await read_rx(dut, 1, 4)).hex()
-    dut._log.info(f'idx1: received: {str_}')
-    if str_ != '01e101cd':
+    ret = await read_rx(dut, 1, 4)
+    dut._log.info(f'idx1: received: {ret.hex()}')
+    if ret != b'\x01\xe1\x01\xcd':
         dut._log.error(f'idx1: receive mismatch')
         await exit_err()
     
@@ -91,9 +91,9 @@ async def test_cdbus(dut):
     val = await read_int_flag(dut, 1)
     dut._log.info(f'REG_INT_FLAG: 0x{int(val):02x}')
     
-    str_ = (await read_rx(dut, 1, 4)).hex()
-    dut._log.info(f'idx1: received: {str_}')
-    if str_ != '01ff01cd':
+    ret = await read_rx(dut, 1, 4)
+    dut._log.info(f'idx1: received: {ret.hex()}')
+    if ret != b'\x01\xff\x01\xcd':
         dut._log.error(f'idx1: receive mismatch')
         await exit_err()
     
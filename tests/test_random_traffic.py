@@ -0,0 +1,113 @@
+# This Source Code Form is subject to the terms of the Mozilla
+# Public License, v. 2.0. If a copy of the MPL was not distributed
+# with this file, You can obtain one at https://mozilla.org/MPL/2.0/.
+# Notice: The scope granted to MPL excludes the ASIC industry.
+#
+# Copyright (c) 2017 DUKELEC, All rights reserved.
+#
+# Author: Duke Fong <d@d-l.io>
+#
+
+# Constrained-random traffic of pycdbus/traffic.py in arbitration mode: random
+# filters and multicast groups for every node, then rounds of concurrent
+# senders with random destinations (unicast, multicast, broadcast or nobody),
+# lengths and gaps. Every node sends and receives, the scoreboard checks each
+# frame reaches exactly the nodes the filters accept, in order per sender.
+#
+# Reproduce or extend a run by environment variables:
+#   TRAFFIC_SEED     default 1, logged at the start
+#   TRAFFIC_FRAMES   default 300
+# Runs on any wrapper, e.g. --wrapper cdbus_wrapper_n8 for more nodes.
+
+import os
+from common import *
+from cocotb.triggers import ClockCycles, First
+from cocotb.simtime import get_sim_time
+from pycdbus.traffic import Traffic, Scoreboard, filter_regs
+
+INT_MASK = BIT_FLAG_TX_ERROR | BIT_FLAG_RX_ERROR | BIT_FLAG_RX_LOST | BIT_FLAG_RX_PENDING
+
+
+async def host(n, irq, queue, sb, t0):
+    """Send the frames of the node when due and read every rx page, queue:
+    [(time us, dst kind, frame)], emptied while sending."""
+    rx_buf = FrameBuf() # every rx page is read into it and checked in place
+    while True:
+        now = get_sim_time('ns') - t0
+        due = queue and now >= queue[0][0] * 1000
+        if not irq.value and not due:
+            if queue:
+                await First(RisingEdge(irq), Timer(round(queue[0][0] * 1000 - now) or 1, unit='ns'))
+            else:
+                await RisingEdge(irq)
+            continue
+        flags = int(await n.read_int_flag())
+        sb.flags(n.idx, flags)
+        if flags & BIT_FLAG_RX_PENDING:
+            len_ = int(await n.read_rx_len()) # user data length
+            sb.received(n.idx, await n.read_rx(len_ + 3, rx_buf))
+        elif due and flags & BIT_FLAG_TX_BUF_FREE:
+            _, kind, frame = queue.pop(0)
+            sb.sent(n.idx, frame, kind)
+            await n.write_tx(frame)
+        elif due: # both tx pages are in use
+            await First(RisingEdge(irq), Timer(2, unit='us'))
+            continue
+        await ClockCycles(n.clk, 3) # the pages switch after the chip select goes low
+
+
+@cocotb.test(timeout_time=50, timeout_unit='ms')
+async def test_cdbus(dut):
+    dut._log.info('test_cdbus start.')
+    seed = int(os.environ.get('TRAFFIC_SEED', 1))
+    frames = int(os.environ.get('TRAFFIC_FRAMES', 300))
+
+    arr = NodeArray(dut)
+    arr.start_clocks(40000000, [round(-100 + 200 * idx / max(len(arr) - 1, 1)) for idx in range(len(arr))])
+    await arr.reset()
+    await arr.check_version()
+
+    traffic = Traffic(len(arr), seed)
+    rounds = traffic.rounds(frames)
+    dut._log.info(f'seed: {seed}, nodes: {len(arr)}, frames: {frames}, rounds: {len(rounds)}')
+    for idx, flt in enumerate(traffic.flt):
+        dut._log.info(f'idx{idx}: ' + ', '.join(f'{k}: 0x{v:02x}' for k, v in flt.items()))
+
+    async def setup(n):
+        await n.csr_write(REG_SETTING, 0b00010001) # arbitration, push pull
+        await n.set_div(39, 2) # 1Mbps, 13.333Mbps
+        for reg, val in filter_regs(traffic.flt[n.idx]):
+            await n.csr_write(reg, val)
+        await n.csr_write(REG_INT_MASK_L, INT_MASK)
+    await arr.each(setup)
+    await Timer(20, unit='us') # bus idle for every node
+
+    sb = Scoreboard(traffic.flt)
+    queues = [[] for _ in arr]
+    for t, frames_ in rounds:
+        sb.stat['rounds'] += 1
+        sb.stat['concurrent'] += len(frames_) > 1
+        for idx, (kind, frame) in frames_:
+            queues[idx].append((t, kind, frame))
+
+    t0 = get_sim_time('ns')
+    tasks = [cocotb.start_soon(host(n, arr.irq(n.idx), queues[n.idx], sb, t0)) for n in arr]
+    idle = 0
+    while (any(queues) or sb.pending()) and not sb.errors and idle < 50: # stop 1 ms after the last frame
+        received = sb.stat['received']
+        await Timer(20, unit='us')
+        idle = 0 if any(queues) or sb.stat['received'] != received else idle + 1
+    await Timer(100, unit='us') # anything not expected
+    for task in tasks:
+        task.cancel()
+
+    dut._log.info(sb.summary())
+    errors = sb.check()
+    for err in errors[:20]:
+        dut._log.error(err)
+    if errors:
+        dut._log.error(f'seed {seed}: {len(errors)} errors')
+        await exit_err()
+
+    dut._log.info('test_cdbus done.')
+    await exit_ok()
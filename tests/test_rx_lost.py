@@ -10,6 +10,7 @@
 
 import math, random
 from common import *
+from pycdbus.rx_ram import RxRam
 
 @cocotb.test(timeout_time=4500, timeout_unit='us')
 async def test_cdbus(dut):
@@ -59,16 +60,17 @@ async def test_cdbus(dut):
     dut._log.info(f'sram size used:  {ram_used}')
     dut._log.info(f'frag amount   :  {frag_amount}, total: {frag_amounts}')
     
-    tx_pkt_strs = []
+    ram = RxRam() # expected state of the receiver's rx ram
+    lost = [i for i in range(len(user_size)) if not ram.push(user_size[i])]
+    dut._log.info(f'expected lost frames: {lost}, dirty: {ram.dirty:016x}')
+    
+    tx_pkts = []
+    frame = FrameBuf()
     
     for i in range(len(user_size)):
-        payload = b''
-        for x in range(user_size[i]):
-            #payload += bytes([random.randint(0,255)])
-            payload += bytes([x])
-        dut._log.info(f'payload len: {len(payload)}')
-        tx_pkt = b'\x01\x02' + bytes([len(payload)]) + payload
-        tx_pkt_strs.append(tx_pkt.hex())
+        dut._log.info(f'payload len: {user_size[i]}')
+        tx_pkt = b'\x01\x02' + bytes([user_size[i]]) + payload(user_size[i])
+        tx_pkts.append(tx_pkt)
         
         dut._log.info(f'send frame: {i}')
         await write_tx(dut, 0, tx_pkt) # node 0x01 send to 0x02
@@ -88,8 +90,8 @@ async def test_cdbus(dut):
     rd_sel = int(dut.cdbus_m1.cd_rx_ram_m.rd_sel.value)
     rx_pend_len = int(dut.cdbus_m1.cd_csr_m.rx_pend_len.value)
     dut._log.info(f'dirty flag: {dirty}, {int(dirty):016x}, w:{wr_sel} r:{rd_sel}, pend_len: {rx_pend_len} (before first read)')
-    if int(dirty) != 0x04b01012f0216035:
-        dut._log.error(f'wrong dirty value')
+    if int(dirty) != ram.dirty or (wr_sel, rd_sel) != (ram.wr_sel, ram.rd_sel):
+        dut._log.error(f'wrong dirty value, expected: {ram.dirty:016x}, w:{ram.wr_sel} r:{ram.rd_sel}')
         await exit_err()
     
     
@@ -107,10 +109,10 @@ async def test_cdbus(dut):
     if not (int(val) & BIT_FLAG_RX_PENDING):
         dut._log.error(f'no rx for read, break')
         await exit_err()
-    str_ = (await read_rx(dut, 1, user_size[0] + 3)).hex()
-    dut._log.info(f'idx1: sent:     {tx_pkt_strs[0]}')
-    dut._log.info(f'idx1: received: {str_}')
-    if str_ != tx_pkt_strs[0]:
+    ret = await read_rx(dut, 1, user_size[0] + 3, frame)
+    dut._log.info(f'idx1: sent:     {tx_pkts[0].hex()}')
+    dut._log.info(f'idx1: received: {ret.hex()}')
+    if ret != tx_pkts[0]:
         dut._log.error(f'idx1: receive mismatch')
         await exit_err()
     #await csr_write(dut, 1, REG_CTRL, BIT_RX_CLR_PENDING)
@@ -125,14 +127,10 @@ async def test_cdbus(dut):
     
     # send one more package:
     
-    payload = b''
     last_send_size = 6*32-5
-    for x in range(last_send_size):
-        #payload += bytes([random.randint(0,255)])
-        payload += bytes([x])
-    dut._log.info(f'payload len: {len(payload)}')
-    tx_pkt = b'\x01\x02' + bytes([len(payload)]) + payload
-    tx_pkt_strs.append(tx_pkt.hex())
+    dut._log.info(f'payload len: {last_send_size}')
+    tx_pkt = b'\x01\x02' + bytes([last_send_size]) + payload(last_send_size)
+    tx_pkts.append(tx_pkt)
     
     dut._log.info(f'send frame: ')
     await write_tx(dut, 0, tx_pkt) # node 0x01 send to 0x02
@@ -145,6 +143,13 @@ async def test_cdbus(dut):
     rx_pend_len = int(dut.cdbus_m1.cd_csr_m.rx_pend_len.value)
     dut._log.info(f'dirty flag: {dirty}, {int(dirty):016x}, w:{wr_sel} r:{rd_sel}, pend_len: {rx_pend_len}')
     
+    await Timer(10, unit='us') # wait for the receiver
+    dirty = dut.cdbus_m1.cd_rx_ram_m.dirty.value
+    ram.rd_done()
+    if not ram.push(last_send_size) or int(dirty) != ram.dirty:
+        dut._log.error(f'wrong dirty value, expected: {ram.dirty:016x}')
+        await exit_err()
+    
     
     # read all packages except last one:
     
@@ -158,10 +163,10 @@ async def test_cdbus(dut):
         if not (int(val) & BIT_FLAG_RX_PENDING):
             dut._log.error(f'no rx for read, break')
             await exit_err()
-        str_ = (await read_rx(dut, 1, user_size[i] + 3)).hex()
-        dut._log.info(f'idx1: sent:     {tx_pkt_strs[i]}')
-        dut._log.info(f'idx1: received: {str_}')
-        if str_ != tx_pkt_strs[i]:
+        ret = await read_rx(dut, 1, user_size[i] + 3, frame)
+        dut._log.info(f'idx1: sent:     {tx_pkts[i].hex()}')
+        dut._log.info(f'idx1: received: {ret.hex()}')
+        if ret != tx_pkts[i]:
             dut._log.error(f'idx1: receive mismatch')
             await exit_err()
         #await csr_write(dut, 1, REG_CTRL, BIT_RX_CLR_PENDING)
@@ -184,10 +189,10 @@ async def test_cdbus(dut):
     if not (int(val) & BIT_FLAG_RX_PENDING):
         dut._log.error(f'no rx for read, break')
         await exit_err()
-    str_ = (await read_rx(dut, 1, last_send_size + 3)).hex()
-    dut._log.info(f'idx1: sent:     {tx_pkt_strs[-1]}')
-    dut._log.info(f'idx1: received: {str_}')
-    if str_ != tx_pkt_strs[-1]:
+    ret = await read_rx(dut, 1, last_send_size + 3, frame)
+    dut._log.info(f'idx1: sent:     {tx_pkts[-1].hex()}')
+    dut._log.info(f'idx1: received: {ret.hex()}')
+    if ret != tx_pkts[-1]:
         dut._log.error(f'idx1: receive mismatch')
         await exit_err()
     #await csr_write(dut, 1, REG_CTRL, BIT_RX_CLR_PENDING)
@@ -212,9 +217,9 @@ async def test_cdbus(dut):
     rx_len = await read_rx_len(dut, 1)
     dut._log.info(f'REG_INT_FLAG: 0x{int(val):02x}, rx len: {int(rx_len)}')
     
-    str_ = (await read_rx(dut, 1, 6)).hex() # read 6 bytes (include crc)
-    dut._log.info(f'idx1: received: {str_}')
-    if str_ != '010201cd601d':
+    ret = await read_rx(dut, 1, 6) # read 6 bytes (include crc)
+    dut._log.info(f'idx1: received: {ret.hex()}')
+    if ret != b'\x01\x02\x01\xcd\x60\x1d':
         dut._log.error(f'idx1: receive mismatch')
         await exit_err()
     
@@ -0,0 +1,117 @@
+# This Source Code Form is subject to the terms of the Mozilla
+# Public License, v. 2.0. If a copy of the MPL was not distributed
+# with this file, You can obtain one at https://mozilla.org/MPL/2.0/.
+# Notice: The scope granted to MPL excludes the ASIC industry.
+#
+# Copyright (c) 2017 DUKELEC, All rights reserved.
+#
+# Author: Duke Fong <d@d-l.io>
+#
+
+# pycdbus.stream against the frames of the RTL: encode() gives the bytes on
+# the wire, the decoder finds them again in a stream with garbage and cut
+# frames, in chunks of any size, on the pure python and the numpy path, and
+# both paths take the same frames (false ones included) out of long garbage.
+
+import time, random
+from common import *
+from pycdbus.crc import crc16
+from pycdbus.stream import StreamDecoder, encode, decode, crc_tables, FAST_MIN, SCAN
+from pycdbus.sim.monitor import BusMonitor
+
+@cocotb.test(timeout_time=3000, timeout_unit='us')
+async def test_cdbus(dut):
+    dut._log.info('test_cdbus start.')
+    random.seed(3)
+
+    sys_clk = 40000000
+    clk_period = 1000000000000 / sys_clk
+
+    cocotb.start_soon(Clock(dut.clk0, clk_period).start())
+    cocotb.start_soon(Clock(dut.clk1, clk_period).start())
+    for idx in range(2):
+        await reset(dut, idx)
+        await check_version(dut, idx)
+        await csr_write(dut, idx, REG_SETTING, 0b00010001) # arbitration
+        await set_div(dut, idx, 39, 2) # 1Mbps, 13.333Mbps
+        await csr_write(dut, idx, REG_FILTER, idx + 1)
+    await csr_write(dut, 0, REG_INT_MASK_L, BIT_FLAG_TX_BUF_CLEAN)
+
+    mon = BusMonitor(dut.bus_a, sys_clk, core=dut.cdbus_m0)
+    wire = []
+    mon.subscribe(lambda f: wire.append(f) if f.kind == 'ok' else None)
+    await Timer(20, unit='us') # idle at the new baud rate
+
+    frames = []
+    for size in [0, 1, 2, 31, 253, 128] + [random.randint(0, 253) for _ in range(6)]:
+        frame = bytes([1, 2, size]) + random.randbytes(size)
+        frames.append(frame)
+        await write_tx(dut, 0, frame)
+        await RisingEdge(dut.irq0)
+    while len(wire) < len(frames):
+        await Timer(20, unit='us')
+    mon.stop()
+
+    wire = [bytes(f.data) for f in wire]
+    if wire != [encode(f) for f in frames]:
+        dut._log.error(f'encode mismatch the wire')
+        await exit_err()
+
+    dist, init = crc_tables()
+    for frame in wire[:4]:
+        c = init[len(frame)]
+        for i, byte in enumerate(frame):
+            c ^= dist[len(frame) - 1 - i][byte]
+        if c != crc16(frame) or c:
+            dut._log.error(f'linear crc mismatch: {frame.hex()}')
+            await exit_err()
+
+    # a stream of the wire frames, with garbage and cut frames between them
+    expected = []
+    stream = bytearray()
+    while len(stream) < 8 * FAST_MIN:
+        idx = random.randrange(len(wire))
+        if random.random() < 0.1:
+            stream += random.choice([random.randbytes(random.randint(1, 40)),
+                                     wire[idx][:random.randint(1, len(wire[idx]) - 1)]])
+        else:
+            expected.append(frames[idx])
+            stream += wire[idx]
+    stream = bytes(stream)
+
+    for fast in (False, True):
+        dec = StreamDecoder(fast=fast)
+        got = []
+        pos = 0
+        while pos < len(stream):
+            size = random.choice([1, 2, 7, 64, 300, 2 * FAST_MIN])
+            got += dec.feed(stream[pos:pos + size])
+            pos += size
+            if len(dec.tail) >= 258:
+                dut._log.error(f'fast {fast}: {len(dec.tail)} bytes kept')
+                await exit_err()
+        got += dec.idle()
+        dut._log.info(f'fast {fast}: {dec.stat}')
+        if got != expected:
+            dut._log.error(f'fast {fast}: {len(got)} frames, {len(expected)} expected')
+            await exit_err()
+        if decode(stream, fast=fast) != expected:
+            dut._log.error(f'fast {fast}: decode mismatch')
+            await exit_err()
+
+    noisy = random.randbytes(SCAN + 1000) + b''.join(random.randbytes(random.randint(1, 40)) + w for w in wire * 20)
+    fast, slow = StreamDecoder(fast=True), StreamDecoder(fast=False)
+    if fast.feed(noisy) + fast.idle() != slow.feed(noisy) + slow.idle() or fast.stat != slow.stat:
+        dut._log.error(f'long garbage: {fast.stat}, pure python: {slow.stat}')
+        await exit_err()
+
+    clean = b''.join(wire) * 200
+    for name, capture in (('clean', clean), ('garbage', stream * 16), ('all garbage', noisy * 8)):
+        for fast in (False, True):
+            start = time.perf_counter()
+            count = len(decode(capture, fast=fast))
+            dut._log.info(f'decode {name}, fast {fast}: {count} frames, '
+                          f'{len(capture) / (time.perf_counter() - start) / 1e6:.1f} MB/s')
+
+    dut._log.info('test_cdbus done.')
+    await exit_ok()
@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+#
+# This Source Code Form is subject to the terms of the Mozilla
+# Public License, v. 2.0. If a copy of the MPL was not distributed
+# with this file, You can obtain one at https://mozilla.org/MPL/2.0/.
+# Notice: The scope granted to MPL excludes the ASIC industry.
+#
+# Copyright (c) 2017 DUKELEC, All rights reserved.
+#
+# Author: Duke Fong <d@d-l.io>
+#
+
+"""Simulation speed benchmark of the cocotb tests.
+
+For every test of tests/ and example/tests (or the given ones) record:
+  wall:      wall time of the test, simulator start included (s)
+  sim:       simulated time (us)
+  ratio:     simulated us per wall second
+  events/s:  simulator callbacks into python per wall second, see pycdbus/sim/bench_probe.py
+  rss:       peak RSS of the simulator process (MB)
+
+The results are written to bench_output.txt (json) at the repository root.
+--save-baseline keeps a copy as the baseline, --baseline compares against
+one: a test is flagged if its wall time grows by more than --tolerance
+(default 10%) or if it fails, and the exit code is 1 then.
+
+Tests run one at a time by default so that they do not disturb each other,
+--repeat N keeps the fastest of N runs. The build cache of run_tests.py is
+shared, the outputs go to sim_out/bench/.
+
+Usage:
+  ./bench.py --sim verilator [--repeat 3] [--save-baseline bench_base.json]
+  ./bench.py --sim verilator --baseline bench_base.json [test_basic_tx_rx.py example/tests/test_cdctl_spi.py ...]
+"""
+
+import os, sys, json, time, platform, argparse
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+
+from run_tests import ROOT, SUITES, build_one, run_one, sim_time_ns
+
+OUTPUT = ROOT / 'bench_output.txt'
+
+
+def collect_tests(names):
+    """[(suite_name, test_case)], a name without folder is searched in all suites."""
+    tests = []
+    if not names:
+        for suite_name, suite in SUITES.items():
+            tests += [(suite_name, p.stem) for p in sorted(suite['dir'].glob('test_*.py'))]
+        return tests
+    for name in names:
+        path = Path(name)
+        found = [(n, path.stem) for n, s in SUITES.items()
+                 if (s['dir'] / f'{path.stem}.py').is_file()
+                 and (path.parent == Path('.') or path.parent.resolve() == s['dir'])]
+        if not found:
+            sys.exit(f'test not found: {name}')
+        tests += found
+    return tests
+
+
+def measure(ret):
+    """Metrics of one run from the run_one() result and the files it left."""
+    work = Path(ret['work'])
+    sim_ns = sim_time_ns(work / 'results.xml') or 0
+    try:
+        with open(work / 'bench_probe.json') as f:
+            probe = json.load(f)
+    except (OSError, ValueError):
+        probe = {'events': 0, 'max_rss_kb': 0}
+    wall = ret['wall']
+    return {
+        'ok': ret['ok'],
+        'wall_s': round(wall, 4),
+        'sim_us': round(sim_ns / 1000, 3),
+        'ratio': round(sim_ns / 1000 / wall, 2),
+        'events': probe['events'],
+        'events_per_s': round(probe['events'] / wall),
+        'max_rss_mb': round(probe['max_rss_kb'] / 1024, 1)
+    }
+
+
+def compare(results, base, tolerance):
+    """{key: (wall change, flagged)}, a missing baseline entry is not flagged."""
+    ret = {}
+    for key, r in results.items():
+        b = base.get(key)
+        if not b:
+            continue
+        change = r['wall_s'] / b['wall_s'] - 1 if b['wall_s'] else 0
+        ret[key] = (change, change > tolerance or (b['ok'] and not r['ok']))
+    return ret
+
+
+def main():
+    parser = argparse.ArgumentParser(description='simulation speed benchmark')
+    parser.add_argument('tests', nargs='*', help='test files, default: all tests of all suites')
+    parser.add_argument('--sim', choices=['icarus', 'verilator'], default=os.environ.get('SIM', 'icarus'))
+    parser.add_argument('--repeat', type=int, default=1, help='keep the fastest of N runs')
+    parser.add_argument('-j', '--jobs', type=int, default=1)
+    parser.add_argument('--baseline', help='compare with this result file')
+    parser.add_argument('--save-baseline', help='also write the results to this file')
+    parser.add_argument('--tolerance', type=float, default=0.1, help='allowed wall time growth, default: 0.1')
+    parser.add_argument('--output', default=str(OUTPUT), help=f'default: {OUTPUT}')
+    args = parser.parse_args()
+
+    tests = collect_tests(args.tests)
+    base = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            base = json.load(f)
+        if base.get('sim') != args.sim:
+            print(f"Warning: the baseline is from {base.get('sim')}")
+
+    print(f'Benchmark {len(tests)} tests with {args.sim}, {args.jobs} jobs, repeat {args.repeat}\n')
+    best = {}
+    with ProcessPoolExecutor(max_workers=args.jobs) as pool:
+        builds = {}
+        for suite_name, test in tests:
+            wrapper = SUITES[suite_name]['wrapper'](test)
+            if (suite_name, wrapper) not in builds:
+                cache = SUITES[suite_name]['dir'] / 'sim_out' / 'cache'
+                builds[suite_name, wrapper] = pool.submit(build_one, suite_name, wrapper, args.sim, cache)
+        builds = {k: f.result() for k, f in builds.items()}
+        for (suite_name, wrapper), b in builds.items():
+            if b['err']:
+                sys.exit(f"Error: build {wrapper}, see {b['dir'] / 'build.log'}, {b['err']}")
+
+        for _ in range(args.repeat):
+            futures = []
+            for suite_name, test in tests:
+                suite = SUITES[suite_name]
+                build = builds[suite_name, suite['wrapper'](test)]
+                out_root = suite['dir'] / 'sim_out' / 'bench'
+                futures.append(((suite_name, test), pool.submit(run_one, suite_name, test, args.sim,
+                                                               out_root, build['dir'], probe=True)))
+            for (suite_name, test), future in futures:
+                key = f'{suite_name}/{test}'
+                m = measure(future.result())
+                if key not in best or m['wall_s'] < best[key]['wall_s']:
+                    best[key] = m
+
+    result = {
+        'date': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'host': platform.node(),
+        'python': platform.python_version(),
+        'sim': args.sim,
+        'repeat': args.repeat,
+        'tests': best,
+        'total_wall_s': round(sum(r['wall_s'] for r in best.values()), 4)
+    }
+    for path in [args.output] + ([args.save_baseline] if args.save_baseline else []):
+        with open(path, 'w') as f:
+            json.dump(result, f, indent=2)
+
+    changes = compare(best, base['tests'], args.tolerance) if base else {}
+    print(f"{'test':<34} {'wall s':>8} {'sim us':>10} {'us/s':>9} {'events/s':>10} {'rss MB':>7}" +
+          ('  vs base' if base else ''))
+    for key, r in best.items():
+        line = (f"{key:<34} {r['wall_s']:8.2f} {r['sim_us']:10.1f} {r['ratio']:9.1f} "
+                f"{r['events_per_s']:10} {r['max_rss_mb']:7.1f}")
+        if key in changes:
+            change, flagged = changes[key]
+            line += f"  {change:+7.1%}" + ('  <-- regression' if flagged else '')
+        if not r['ok']:
+            line += '  FAIL'
+        print(line)
+    print(f"\nTotal wall time: {result['total_wall_s']:.2f} s, written to {args.output}")
+
+    if base:
+        b_total = sum(base['tests'][k]['wall_s'] for k in changes)
+        if b_total:
+            total = sum(best[k]['wall_s'] for k in changes)
+            print(f"Baseline total of the same tests: {b_total:.2f} s ({total / b_total - 1:+.1%})")
+        regressions = [k for k, (_, flagged) in changes.items() if flagged]
+        if regressions:
+            print(f"Regressions: {', '.join(regressions)}")
+            return 1
+    return 0 if all(r['ok'] for r in best.values()) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+#
+# This Source Code Form is subject to the terms of the Mozilla
+# Public License, v. 2.0. If a copy of the MPL was not distributed
+# with this file, You can obtain one at https://mozilla.org/MPL/2.0/.
+# Notice: The scope granted to MPL excludes the ASIC industry.
+#
+# Copyright (c) 2017 DUKELEC, All rights reserved.
+#
+# Author: Duke Fong <d@d-l.io>
+#
+
+"""Frame rate and timing jitter of pycdbus.bs_node, software CDBUS-BS nodes.
+
+The nodes share a pycdbus.bs_node.Hub line (or the two ends of a pty pair
+with --pty), each one sends frames of pycdbus.traffic.Traffic for
+--duration seconds, as fast as it can or at --rate frames/s, and a
+Scoreboard checks that each receiver gets them once and in order.
+Node i has a tx_permit_len of --permit + i * --step bits.
+
+Reported:
+  frames/s:   frames sent (echo checked), and the payload bytes/s
+  ideal:      frames/s of one node alone on the line, by the bit times
+  line:       busy time of the line (hub only)
+  jitter:     how late each transmission starts after its planned time
+              (tx permit, or max idle for a break), min / p50 / p99 / max us
+  errors:     collisions of the hub, tx errors (sent again), crc and
+              incomplete frames, breaks
+
+The jitter has to stay well below the differences of tx_permit_len (in
+bit times), else the nodes collide: try a smaller --step or a higher
+--baud to find the limit of a machine. The exit code is 1 if a frame is
+lost.
+
+Usage:
+  ./bs_node_bench.py [--baud 115200] [--nodes 3] [--permit 100 --step 300] [--size 32]
+  ./bs_node_bench.py --pty --duration 5 --json
+"""
+
+import sys, json, asyncio, argparse
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from pycdbus.bs_node import BsNode, Hub, open_pty
+from pycdbus.traffic import Traffic, Scoreboard
+
+
+def percentiles(values):
+    if not values:
+        return {'min': 0, 'p50': 0, 'p99': 0, 'max': 0}
+    values = sorted(values)
+    pick = lambda p: values[min(len(values) - 1, int(len(values) * p / 100))]
+    return {'min': values[0], 'p50': pick(50), 'p99': pick(99), 'max': values[-1]}
+
+
+async def run(args):
+    loop = asyncio.get_running_loop()
+    nodes = 2 if args.pty else args.nodes
+    traffic = Traffic(nodes, seed=args.seed, size={(args.size, args.size): 1})
+    sb = Scoreboard(traffic.flt)
+    hub = None
+    if args.pty:
+        ports = open_pty()
+    else:
+        hub = Hub(args.baud)
+        ports = [hub.port() for _ in range(nodes)]
+    max_idle = args.max_idle or args.permit + nodes * args.step + 100
+    trace = []
+    bs = []
+    for i, port in enumerate(ports):
+        flt = dict(traffic.flt[i])
+        bs.append(BsNode(port, flt.pop('filter'), args.baud, args.permit + i * args.step, max_idle,
+                         trace=trace, **flt))
+    for node in bs:
+        node.start()
+
+    async def sender(idx):
+        while loop.time() < end:
+            kind, frame = traffic.frame(idx)
+            await bs[idx].send(frame)
+            sb.sent(idx, frame, kind)
+            if args.rate:
+                await asyncio.sleep(1 / args.rate)
+
+    async def receiver(idx):
+        async for frame in bs[idx]:
+            sb.received(idx, frame)
+
+    receivers = [loop.create_task(receiver(i)) for i in range(nodes)]
+    start = loop.time()
+    end = start + args.duration
+    await asyncio.gather(*(sender(i) for i in range(nodes)))
+    try:
+        await asyncio.wait_for(asyncio.gather(*(node.flush() for node in bs)), 2)
+    except asyncio.TimeoutError:
+        pass
+    elapsed = loop.time() - start
+    await asyncio.sleep(max(node.idle_at() for node in bs) - loop.time() + 0.05)
+
+    for task in receivers:
+        task.cancel()
+    for node in bs:
+        node.close()
+    if hub:
+        hub.close()
+
+    bit = 1e6 / args.baud # us
+    frame_bits = (args.size + 5) * 10
+    jitter = [(actual - planned) * 1e6 for kind, planned, actual in trace]
+    tx = sum(node.stat['tx'] for node in bs)
+    result = {
+        'line': 'pty' if args.pty else 'hub',
+        'baud': args.baud,
+        'nodes': nodes,
+        'tx_permit_len': [node.tx_permit_len for node in bs],
+        'max_idle_len': max_idle,
+        'size': args.size,
+        'elapsed': elapsed,
+        'frames/s': tx / elapsed,
+        'bytes/s': tx * args.size / elapsed,
+        'ideal frames/s': 1e6 / ((frame_bits + 10 + args.permit + 1) * bit),
+        'jitter_us': percentiles(jitter),
+        'jitter_break_us': percentiles([j for (kind, _, _), j in zip(trace, jitter) if kind == 'break']),
+        'jitter_bits': percentiles(jitter)['p99'] / bit,
+        'nodes_stat': [node.stat for node in bs],
+        'scoreboard': sb.stat,
+        'errors': sb.check()
+    }
+    if hub:
+        result['line busy'] = hub.stat['bytes'] * 10 / args.baud / elapsed
+        result['collisions'] = hub.stat['collisions']
+    return result
+
+
+def print_result(r):
+    print(f"{r['nodes']} nodes on a {r['line']} at {r['baud']} baud, tx_permit_len {r['tx_permit_len']}, "
+          f"max_idle_len {r['max_idle_len']}, data_len {r['size']}, {r['elapsed']:.2f} s")
+    print(f"frames/s: {r['frames/s']:.1f} ({r['bytes/s']:.0f} payload bytes/s), "
+          f"ideal for one node: {r['ideal frames/s']:.1f}")
+    if 'line busy' in r:
+        print(f"line busy: {r['line busy'] * 100:.1f} %, collisions: {r['collisions']}")
+    j = r['jitter_us']
+    print(f"jitter (us): min {j['min']:.0f}, p50 {j['p50']:.0f}, p99 {j['p99']:.0f}, max {j['max']:.0f}"
+          f" (p99: {r['jitter_bits']:.1f} bits)")
+    for i, stat in enumerate(r['nodes_stat']):
+        print(f"  node {i}: " + ', '.join(f'{k}: {v}' for k, v in stat.items()))
+    print(f"scoreboard: {', '.join(f'{k}: {v}' for k, v in r['scoreboard'].items())}")
+    for err in r['errors'][:10]:
+        print(f'  {err}')
+    if len(r['errors']) > 10:
+        print(f"  ... {len(r['errors'])} errors")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--baud', type=int, default=115200)
+    parser.add_argument('--nodes', type=int, default=3, help='nodes on the hub')
+    parser.add_argument('--pty', action='store_true', help='two nodes on a pty pair instead of the hub')
+    parser.add_argument('--permit', type=int, default=100, help='tx_permit_len of node 0 (bits)')
+    parser.add_argument('--step', type=int, default=300, help='tx_permit_len difference of the nodes (bits)')
+    parser.add_argument('--max-idle', type=int, default=0, help='max_idle_len (bits), default: above the last permit')
+    parser.add_argument('--size', type=int, default=32, help='data_len of the frames')
+    parser.add_argument('--rate', type=float, default=0, help='frames/s of each node, 0: as fast as it can')
+    parser.add_argument('--duration', type=float, default=3, help='seconds of traffic')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--json', action='store_true', help='print the result as json')
+    args = parser.parse_args()
+
+    result = asyncio.run(run(args))
+    if args.json:
+        print(json.dumps(result, indent=2))
+    else:
+        print_result(result)
+    return 1 if result['errors'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
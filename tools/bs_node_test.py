@@ -0,0 +1,223 @@
+#!/usr/bin/env python3
+#
+# This Source Code Form is subject to the terms of the Mozilla
+# Public License, v. 2.0. If a copy of the MPL was not distributed
+# with this file, You can obtain one at https://mozilla.org/MPL/2.0/.
+# Notice: The scope granted to MPL excludes the ASIC industry.
+#
+# Copyright (c) 2017 DUKELEC, All rights reserved.
+#
+# Author: Duke Fong <d@d-l.io>
+#
+
+"""Regression test of pycdbus.bs_node on its stand-in lines, no simulator.
+
+The nodes run in an asyncio loop of virtual time: a wait jumps to its end
+once no fd is ready, so the tx permit and break times are exact. Checked:
+  Unescape    markers split between reads, at every offset
+  pty         a crc error, a filtered frame and a break, written in pieces
+  Hub         the tx permit of two nodes and the back-off of the later one,
+              a break after max idle and the frame at the tx permit after
+              it, a frame collided by a raw port sent again
+
+Usage:
+  ./bs_node_test.py      (exit code 1 on an error)
+"""
+
+import os, sys, asyncio, logging, selectors
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from pycdbus.crc import modbus_crc
+from pycdbus.bs_node import BsNode, Hub, Unescape, open_pty, BREAK, ERROR
+
+SETTLE = 0.005 # real s a wait first polls the fds, the bytes of a pty are moved by a kernel worker
+
+
+class VirtualSelector(selectors.DefaultSelector):
+    """The time of the loop, advanced by the timeout of a wait with no fd
+    ready, a wait of no timeout (nothing scheduled) polls in real time."""
+
+    def __init__(self):
+        super().__init__()
+        self.now = 1.0
+
+    def select(self, timeout=None):
+        events = super().select(0)
+        if events or timeout == 0:
+            return events
+        events = super().select(SETTLE if timeout is not None else 1)
+        if not events and timeout is not None:
+            self.now += timeout
+        return events
+
+
+class VirtualLoop(asyncio.SelectorEventLoop):
+    def __init__(self):
+        super().__init__(VirtualSelector())
+
+    def time(self):
+        return self._selector.now
+
+
+def runs(symbols):
+    """Join the runs of bytes, a marker ends a run."""
+    ret = []
+    for s in symbols:
+        if isinstance(s, str) or not ret or isinstance(ret[-1], str):
+            ret.append(s if isinstance(s, str) else bytes(s))
+        else:
+            ret[-1] += s
+    return ret
+
+
+def unescape_test(log):
+    wire = b'\x01\xff\xff\x02\xff\x00\x00\x03\xff\x00\x41\xff\xff\xff\x00\x00'
+    expected = [b'\x01\xff\x02', BREAK, b'\x03', ERROR, b'\xff', BREAK]
+    if runs(Unescape().feed(wire)) != expected:
+        log.error(f'unescape: {Unescape().feed(wire)}')
+        return False
+    for cut in range(1, len(wire)):
+        unescape = Unescape()
+        ret = runs(unescape.feed(wire[:cut]) + unescape.feed(wire[cut:]))
+        if ret != expected or unescape.rest:
+            log.error(f'unescape cut at {cut}: {ret}')
+            return False
+    unescape = Unescape()
+    ret = runs([s for i in range(len(wire)) for s in unescape.feed(wire[i:i + 1])])
+    if ret != expected:
+        log.error(f'unescape byte by byte: {ret}')
+        return False
+    return True
+
+
+async def pty_test(log):
+    """A raw end of the pty writes the frames in pieces, the node on the
+    other end filters them."""
+    loop = asyncio.get_running_loop()
+    a, b = open_pty()
+    node = BsNode(b, filter_=0x02)
+    node.start()
+    good = bytes([0x01, 0x02, 4, 0xff, 0x00, 0xff, 0xff])
+    other = bytes([0x01, 0x03, 1, 0xcd])
+    bad = bytes([0x01, 0x02, 1, 0xcd])
+    wire = bytearray()
+    for frame, crc in ((other, modbus_crc(other)), (bad, b'\x00\x00'), (good, modbus_crc(good))):
+        wire += (frame + crc).replace(b'\xff', b'\xff\xff')
+    wire += b'\xff\x00\x00'
+    for i in range(0, len(wire), 5): # the markers are cut
+        await a.write_raw(wire[i:i + 5])
+        await asyncio.sleep(0.0001)
+    frame = await asyncio.wait_for(node.recv(), 1)
+    await asyncio.sleep(node.idle_at() - loop.time() + 0.01)
+    node.close()
+    a.close()
+    stat = node.stat
+    log.info(f'pty: {stat}')
+    if frame != good:
+        log.error(f'pty: frame {frame.hex()}')
+        return False
+    if (stat['rx'], stat['rx_filtered'], stat['rx_crc'], stat['rx_break'], stat['rx_error']) != (1, 1, 1, 1, 0):
+        log.error('pty: wrong stat')
+        return False
+    return True
+
+
+async def hub_test(log):
+    """Nodes 1 and 2 of different tx permit, node 1 also sends after a long
+    idle (a break first), and a raw port of the hub collides with a frame."""
+    loop = asyncio.get_running_loop()
+    baud, idle_wait, max_idle = 115200, 10, 200
+    bit = 1 / baud
+    hub = Hub(baud)
+    x = hub.port()
+    traces = [[], []]
+    nodes = [BsNode(hub.port(), filter_=idx + 1, baud=baud, tx_permit_len=20 + idx * 20, max_idle_len=max_idle,
+                    idle_wait=idle_wait, trace=traces[idx]) for idx in range(2)]
+    t0 = loop.time()
+    for node in nodes:
+        node.start()
+    ok = True
+
+    def check(name, value, expected):
+        nonlocal ok
+        if abs(value - expected) > 1e-9:
+            log.error(f'{name}: {(value - t0) / bit:.3f} bits, expected {(expected - t0) / bit:.3f}')
+            ok = False
+
+    frames = [bytes([1, 2, 2, 0x11, 0x22]), bytes([2, 1, 3, 0x33, 0x44, 0x55])]
+    await nodes[0].send(frames[0])
+    await nodes[1].send(frames[1])
+    got = [await asyncio.wait_for(nodes[1].recv(), 1), await asyncio.wait_for(nodes[0].recv(), 1)]
+    if got != frames:
+        log.error(f'hub: frames {got}')
+        ok = False
+    # node 1 at its tx permit, node 2 backs off and takes its tx permit after the frame of node 1
+    check('tx 1', traces[0][0][1], t0 + (idle_wait + 21) * bit)
+    end_1 = traces[0][0][1] + (len(frames[0]) + 2) * 10 * bit
+    check('tx 2', traces[1][0][1], end_1 + (idle_wait + 41) * bit)
+    end_2 = traces[1][0][1] + (len(frames[1]) + 2) * 10 * bit
+    await asyncio.sleep(end_2 + 0.01 - loop.time()) # well after max idle
+
+    # the tx permit is missed: a break now, the frame at the tx permit after it
+    t1 = loop.time()
+    await nodes[0].send(frames[0])
+    await asyncio.wait_for(nodes[1].recv(), 1)
+    kinds = [k for k, _, _ in traces[0]]
+    if kinds != ['data', 'break', 'data']:
+        log.error(f'hub: transmissions {kinds}')
+        ok = False
+    else:
+        check('break', traces[0][1][1], t1)
+        check('tx after break', traces[0][2][1], t1 + 10 * bit + (idle_wait + 21) * bit)
+    end_3 = traces[0][2][1] + (len(frames[0]) + 2) * 10 * bit
+
+    # a break again, x writes zeros over bytes 3 and 4 of the frame: node 2 sees a
+    # crc error, node 1 a different echo and sends it again at the next tx permit
+    await asyncio.sleep(end_3 + 0.01 - loop.time())
+    t2 = loop.time()
+    start = t2 + 10 * bit + (idle_wait + 21) * bit
+    loop.call_at(start + 3.5 * 10 * bit, os.write, x.fd, b'\x00\x00')
+    await nodes[0].send(frames[0])
+    if await asyncio.wait_for(nodes[1].recv(), 1) != frames[0]:
+        log.error('hub: frame after the collision')
+        ok = False
+    await nodes[0].flush()
+    await asyncio.sleep(0.01)
+    kinds = [k for k, _, _ in traces[0][3:]]
+    if kinds != ['break', 'data', 'data']:
+        log.error(f'hub: transmissions {kinds}')
+        ok = False
+    else:
+        check('tx collided', traces[0][4][1], start)
+        resend = start + (len(frames[0]) + 2) * 10 * bit + (idle_wait + 21) * bit
+        check('tx again', traces[0][5][1], resend)
+
+    for node in nodes:
+        node.close()
+    x.close()
+    hub.close()
+    log.info(f'hub: {hub.stat}, node 1: {nodes[0].stat}, node 2: {nodes[1].stat}')
+    if hub.stat['collisions'] != 1 or nodes[0].stat['tx'] != 3 or nodes[0].stat['tx_err'] != 1 or \
+            nodes[1].stat['rx_crc'] != 1 or nodes[1].stat['rx'] != 3 or nodes[1].rx:
+        log.error('hub: wrong stat')
+        ok = False
+    return ok
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(levelname)s %(message)s')
+    log = logging.getLogger('bs_node_test')
+    ok = unescape_test(log)
+    loop = VirtualLoop()
+    try:
+        for scenario in (pty_test, hub_test):
+            ok = loop.run_until_complete(scenario(log)) and ok
+    finally:
+        loop.close()
+    log.info('pass' if ok else 'FAIL')
+    return 0 if ok else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
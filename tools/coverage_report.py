@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+#
+# This Source Code Form is subject to the terms of the Mozilla
+# Public License, v. 2.0. If a copy of the MPL was not distributed
+# with this file, You can obtain one at https://mozilla.org/MPL/2.0/.
+# Notice: The scope granted to MPL excludes the ASIC industry.
+#
+# Copyright (c) 2017 DUKELEC, All rights reserved.
+#
+# Author: Duke Fong <d@d-l.io>
+#
+
+"""Merge the functional coverage of many runs and list the unhit bins.
+
+The inputs are the coverage.json files written by pycdbus/sim/coverage.py
+(run_tests.py --coverage) or merged files of earlier runs, e.g. of other
+seeds, so a random regression can be steered to the bins never hit.
+
+Usage:
+  ./coverage_report.py ../tests/sim_out/*/coverage.json [-o merged.json]
+  ./coverage_report.py merged.json ../tests/sim_out/*/coverage.json --hits
+"""
+
+import sys, json, argparse
+
+
+def merge(dst, src):
+    """Add the counts of src to dst."""
+    for cp, bins in src.items():
+        d = dst.setdefault(cp, {})
+        for b, count in bins.items():
+            d[b] = d.get(b, 0) + count
+    return dst
+
+
+def load(paths):
+    cov = {}
+    for path in paths:
+        with open(path) as f:
+            merge(cov, json.load(f))
+    return cov
+
+
+def report(cov, hits=False):
+    """Lines of text: hit / total bins of each coverpoint and the unhit bins."""
+    lines = []
+    total = hit = 0
+    for cp, bins in cov.items():
+        n = sum(1 for count in bins.values() if count)
+        total += len(bins)
+        hit += n
+        lines.append(f'{cp:<16} {n:4} / {len(bins):<4} {100 * n / max(len(bins), 1):6.1f} %')
+        for b, count in bins.items():
+            if not count:
+                lines.append(f'    unhit  {b}')
+            elif hits:
+                lines.append(f'    {count:<6} {b}')
+    lines.append(f"{'total':<16} {hit:4} / {total:<4} {100 * hit / max(total, 1):6.1f} %")
+    return lines
+
+
+def main():
+    parser = argparse.ArgumentParser(description='merge coverage.json files and list the unhit bins')
+    parser.add_argument('inputs', nargs='+', help='coverage.json files')
+    parser.add_argument('-o', '--output', help='write the merged coverage')
+    parser.add_argument('--hits', action='store_true', help='also list the counts of the hit bins')
+    args = parser.parse_args()
+    cov = load(args.inputs)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(cov, f, indent=1)
+    print('\n'.join(report(cov, args.hits)))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+#
+# This Source Code Form is subject to the terms of the Mozilla
+# Public License, v. 2.0. If a copy of the MPL was not distributed
+# with this file, You can obtain one at https://mozilla.org/MPL/2.0/.
+# Notice: The scope granted to MPL excludes the ASIC industry.
+#
+# Copyright (c) 2017 DUKELEC, All rights reserved.
+#
+# Author: Duke Fong <d@d-l.io>
+#
+
+"""Generate the N-node test wrapper cdbus_wrapper_n<N>.
+
+Same ports and bus as tests/cdbus_wrapper_dft.v, for N cdbus instances:
+clk<i>, reset<i>, cs<i>, csr_*<i> and irq<i> of each node cdbus_m<i> on one
+open-drain bus, plus bus_a, the external node ext_tx / ext_tx_en and dbg0 /
+dbg1. Each node has its own clock input, so the clock frequency of every
+node can be set from the test (see NodeArray of tests/common.py).
+
+run_tests.py generates the wrapper into sim_out/gen/ when a test asks for
+it: test_xxx_n<N>.py, or --wrapper cdbus_wrapper_n<N> for any test.
+
+Usage:
+  ./gen_wrapper.py 16 [-o cdbus_wrapper_n16.v]
+"""
+
+import sys, argparse
+
+MAX_NODES = 256
+
+HEADER = """\
+/*
+ * This Source Code Form is subject to the terms of the Mozilla
+ * Public License, v. 2.0. If a copy of the MPL was not distributed
+ * with this file, You can obtain one at https://mozilla.org/MPL/2.0/.
+ * Notice: The scope granted to MPL excludes the ASIC industry.
+ *
+ * Copyright (c) 2017 DUKELEC, All rights reserved.
+ *
+ * Author: Duke Fong <d@d-l.io>
+ */
+
+// Generated by tools/gen_wrapper.py, do not edit.
+
+`timescale 1 ns / 1 ps
+`define CD_CHIP_SELECT
+`define CD_CSR_NO_LATENCY
+"""
+
+INSTANCE = """
+cdbus cdbus_m{i}(
+          .clk(clk{i}),
+          .reset_n(reset{i}),
+          .chip_select(cs{i}),
+          .irq(irq{i}),
+
+          .csr_address(csr_addr{i}),
+          .csr_read(csr_read{i}),
+          .csr_readdata(csr_rdata{i}),
+          .csr_write(csr_write{i}),
+          .csr_writedata(csr_wdata{i}),
+
+          .rx(rx{i}),
+          .tx(tx{i}),
+          .tx_en(tx_en{i})
+      );
+"""
+
+
+def name(n):
+    return f'cdbus_wrapper_n{n}'
+
+
+def generate(n):
+    """Verilog source of the wrapper with n nodes."""
+    if not 1 <= n <= MAX_NODES:
+        raise ValueError(f'node count out of range: {n}')
+    r = range(n)
+    ports = [f'        input       {p}{i},' for p in ('clk', 'reset', 'cs') for i in r]
+    for i in r:
+        ports += ['',
+                  f'        input       [4:0] csr_addr{i},',
+                  f'        input       csr_read{i},',
+                  f'        output      [7:0] csr_rdata{i},',
+                  f'        input       csr_write{i},',
+                  f'        input       [7:0] csr_wdata{i},']
+    ports += [''] + [f'        output      irq{i},' for i in r]
+    ports += ['',
+              '        output      bus_a,      // bus level, high when released',
+              '        input       ext_tx,     // external node driven by the testbench',
+              '        input       ext_tx_en,',
+              '',
+              '        input       dbg0,',
+              '        input       dbg1']
+
+    levels = [f'(tx_en{i} ? tx{i} : 1\'b1)' for i in r] + ['(ext_en ? ext_tx : 1\'b1)']
+    bus = '\n               & '.join(' & '.join(levels[k:k + 3]) for k in range(0, len(levels), 3))
+
+    lines = [HEADER, f'module {name(n)}(', *ports, '    );', '']
+    lines += [f'tri1 tx{i}; // released output is seen as recessive' if i == 0 else f'tri1 tx{i};' for i in r]
+    lines += [f'tri0 tx_en{i};' for i in r]
+    lines += ['tri0 ext_en = ext_tx_en;', '',
+              '// 2-state open-drain bus: every enabled driver pulls the bus towards its level,',
+              '// a released bus stays high, and 0 is dominant when drivers disagree.',
+              f'assign bus_a = {bus};', '']
+    lines += [f'wire rx{i} = tx_en{i} ? tx{i} : bus_a;' for i in r] + ['']
+    lines += [INSTANCE.format(i=i) for i in r]
+    lines += ['`ifdef CD_DUMP', 'cd_dump cd_dump_m(.clk(clk0));', '`endif', '', 'endmodule', '']
+    return '\n'.join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='generate the N-node test wrapper')
+    parser.add_argument('nodes', type=int)
+    parser.add_argument('-o', '--output', help='default: stdout')
+    args = parser.parse_args()
+    text = generate(args.nodes)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text)
+    else:
+        sys.stdout.write(text)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,411 @@
+#!/usr/bin/env python3
+#
+# This Source Code Form is subject to the terms of the Mozilla
+# Public License, v. 2.0. If a copy of the MPL was not distributed
+# with this file, You can obtain one at https://mozilla.org/MPL/2.0/.
+# Notice: The scope granted to MPL excludes the ASIC industry.
+#
+# Copyright (c) 2017 DUKELEC, All rights reserved.
+#
+# Author: Duke Fong <d@d-l.io>
+#
+
+"""Parallel regression runner for the cocotb tests.
+
+Each test gets its own output folder (sim_out/<test_case>/) holding the
+log, the waveform and the .exit_ok sentinel, so any number of tests can run
+at the same time.
+
+Simulator images are compiled once into sim_out/cache/<wrapper>-<sim>-<hash>/
+and shared by all tests targeting the same wrapper. The hash covers the
+content of every HDL source, the defines and the build arguments, so an
+image is rebuilt only when a .v file actually changes.
+
+Waveforms are off by default (dumping a long test costs more than running it).
+--wave vcd|fst dumps the whole run, --wave-scope limits it to some instances.
+With --wave-trigger the test runs without dumping first, then, if the
+trigger happened, it runs again and only dumps the window from --wave-pre us
+before to --wave-post us after the failure or the first rising edge of the
+trigger signal (the result of the first run counts). See tests/cd_dump.v.
+
+The N-node wrappers cdbus_wrapper_n<N> are generated by gen_wrapper.py, a
+test named test_xxx_n<N>.py runs on one, --wrapper selects one for any test.
+
+--coverage loads pycdbus/sim/coverage.py with each test, the coverage.json
+of the tests are merged into sim_out/coverage.json and the unhit bins are
+listed (see coverage_report.py).
+
+Usage:
+  ./run_tests.py --suite tests [-j N] [test_xxx.py ...]
+  ./run_tests.py --suite example --sim verilator [--threads N]
+  ./run_tests.py --wave fst --wave-scope cdbus_m1 --wave-trigger fail
+  ./run_tests.py --wave vcd --wave-trigger cdbus_m0.tx_err --wave-pre 50 test_tx_collision.py
+  ./run_tests.py --sim verilator --wrapper cdbus_wrapper_n32 bench_scaling.py
+  ./run_tests.py --sim verilator --coverage
+"""
+
+import os, re, sys, json, time, shutil, hashlib, argparse
+import xml.etree.ElementTree as ET
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import gen_wrapper, coverage_report
+
+ROOT = Path(__file__).resolve().parent.parent
+CDBUS_HDL = ROOT / 'hdl'
+CDCTL_HDL = ROOT / 'example'
+
+CDBUS_SOURCES = [
+    CDBUS_HDL / 'cdbus.v',
+    CDBUS_HDL / 'cd_csr.v',
+    CDBUS_HDL / 'cd_baud_rate.v',
+    CDBUS_HDL / 'cd_tx_ram.v',
+    CDBUS_HDL / 'cd_rx_ram.v',
+    CDBUS_HDL / 'lib/cd_spram.v',
+    CDBUS_HDL / 'lib/cd_sdpram.v',
+    CDBUS_HDL / 'cd_rx_bytes.v',
+    CDBUS_HDL / 'cd_rx_des.v',
+    CDBUS_HDL / 'cd_crc.v',
+    CDBUS_HDL / 'cd_tx_bytes.v',
+    CDBUS_HDL / 'cd_tx_ser.v'
+]
+
+CDCTL_SOURCES = [
+    CDCTL_HDL / 'top_spi/cdctl_spi.v',
+    CDCTL_HDL / 'common/spi_slave.v',
+    CDCTL_HDL / 'top_qspi/cdctl_qspi.v',
+    CDCTL_HDL / 'common/qspi_slave.v',
+    CDCTL_HDL / 'top_i2c/cdctl_i2c.v',
+    CDCTL_HDL / 'common/i2c_slave.v',
+    CDCTL_HDL / 'tests/cdctl_pll_sim.v'
+]
+
+DUMP_SOURCE = ROOT / 'tests' / 'cd_dump.v'
+
+GEN_WRAPPER = re.compile(r'cdbus_wrapper_n(\d+)$')
+
+
+def tests_wrapper(test_case):
+    if test_case.startswith('test_crc'):
+        return 'cd_crc_wrapper'
+    if 'full_duplex' in test_case:
+        return 'cdbus_wrapper_fduplex'
+    m = re.search(r'_n(\d+)$', test_case) # e.g. test_arbitration_n16
+    if m:
+        return gen_wrapper.name(int(m.group(1)))
+    return 'cdbus_wrapper_dft'
+
+def example_wrapper(test_case):
+    if 'qspi' in test_case:
+        return 'cdctl_qspi_wrapper'
+    if 'i2c' in test_case:
+        return 'cdctl_i2c_wrapper'
+    return 'cdctl_spi_wrapper'
+
+# same wrapper selection as the test_all.sh scripts used to do
+SUITES = {
+    'tests': {
+        'dir': ROOT / 'tests',
+        'sources': CDBUS_SOURCES,
+        'defines': {},
+        'wrapper': tests_wrapper,
+        'wave': 'cdbus'
+    },
+    'example': {
+        'dir': ROOT / 'example' / 'tests',
+        'sources': CDCTL_SOURCES + CDBUS_SOURCES,
+        'defines': {},
+        'wrapper': example_wrapper,
+        'wave': 'cdctl'
+    }
+}
+
+
+WAVE_OFF = {'format': 'off', 'scope': [], 'trigger': None, 'pre': 0, 'post': 0}
+
+
+def wave_file(suite, wave):
+    return f"{suite['wave']}.{wave['format']}"
+
+def wrapper_file(suite, wrapper):
+    """The generated wrappers (cdbus_wrapper_n<N>) are written to sim_out/gen/ of the suite."""
+    m = GEN_WRAPPER.match(wrapper)
+    if not m:
+        return suite['dir'] / f'{wrapper}.v'
+    path = suite['dir'] / 'sim_out' / 'gen' / f'{wrapper}.v'
+    text = gen_wrapper.generate(int(m.group(1)))
+    if not path.is_file() or path.read_text() != text:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(f'.{os.getpid()}')
+        tmp.write_text(text)
+        tmp.replace(path)
+    return path
+
+def wrapper_sources(suite, wrapper, wave=WAVE_OFF):
+    dump = [DUMP_SOURCE] if wave['format'] != 'off' else []
+    return [wrapper_file(suite, wrapper)] + suite['sources'] + dump
+
+def wrapper_defines(suite, wrapper, wave=WAVE_OFF):
+    defines = dict(suite['defines'])
+    if wave['format'] != 'off':
+        defines['CD_DUMP'] = 1
+        defines['CD_DUMP_FILE'] = f'"{wave_file(suite, wave)}"'
+        if wave['scope']:
+            defines['CD_DUMP_SCOPE'] = ','.join(f'{wrapper}.{s}' for s in wave['scope'])
+        if wave['trigger'] and wave['trigger'] != 'fail':
+            defines['CD_DUMP_TRIGGER'] = f"{wrapper}.{wave['trigger']}"
+    return defines
+
+def verilator_scope(wrapper, wave):
+    """Verilator ignores the scope arguments of $dumpvars, use tracing_on/off instead."""
+    lines = ['`verilator_config', 'tracing_off -scope "*"']
+    for s in wave['scope']:
+        lines += [f'tracing_on -scope "{wrapper}.{s}"', f'tracing_on -scope "{wrapper}.{s}.*"']
+    return '\n'.join(lines) + '\n'
+
+
+def sim_build_args(sim, threads=1, wave=WAVE_OFF):
+    if sim == 'verilator':
+        # the wrappers and cores are 2-state clean, lint warnings are not fatal
+        args = ['-Wno-fatal']
+        if threads > 1:
+            args += ['--threads', str(threads)]
+        if wave['format'] == 'fst':
+            args += ['--trace-fst']
+        return args
+    return []
+
+
+def build_key(suite, wrapper, sim, threads=1, wave=WAVE_OFF):
+    from importlib.metadata import version
+    h = hashlib.sha256()
+    h.update(f"{sim} {version('cocotb')} {wrapper}\n".encode())
+    h.update(f"{sorted(wrapper_defines(suite, wrapper, wave).items())} {sim_build_args(sim, threads, wave)}\n".encode())
+    for src in wrapper_sources(suite, wrapper, wave):
+        h.update(f'{src.relative_to(ROOT)}\n'.encode())
+        h.update(src.read_bytes())
+    return h.hexdigest()[:16]
+
+
+def build_one(suite_name, wrapper, sim, cache_root, threads=1, rebuild=False, wave=WAVE_OFF):
+    from cocotb_tools.runner import get_runner
+
+    suite = SUITES[suite_name]
+    key = build_key(suite, wrapper, sim, threads, wave)
+    tag = sim if wave['format'] == 'off' else f"{sim}-{wave['format']}" # keep the images without dumping
+    build_dir = cache_root / f'{wrapper}-{tag}-{key}'
+    stamp = build_dir / '.build_ok'
+    if stamp.is_file() and not rebuild:
+        return {'wrapper': wrapper, 'dir': build_dir, 'cached': True, 'wall': 0.0, 'err': None}
+
+    # drop stale images of the same wrapper, their sources have changed
+    for old in cache_root.glob(f'{wrapper}-{tag}-' + '?' * len(key)):
+        shutil.rmtree(old, ignore_errors=True)
+    build_dir.mkdir(parents=True)
+
+    build_args = sim_build_args(sim, threads, wave)
+    dump = wave['format'] != 'off'
+    if dump and sim == 'verilator' and wave['scope']:
+        vlt = build_dir / 'cd_dump.vlt'
+        vlt.write_text(verilator_scope(wrapper, wave))
+        build_args.append(str(vlt))
+    t_start = time.monotonic()
+    err = None
+    try:
+        runner = get_runner(sim)
+        # waves=True only enables the tracing of verilator, icarus would dump everything by itself
+        runner.build(sources=wrapper_sources(suite, wrapper, wave), hdl_toplevel=wrapper,
+                     defines=wrapper_defines(suite, wrapper, wave), build_args=build_args,
+                     waves=dump and sim == 'verilator',
+                     build_dir=build_dir, timescale=('1ns', '1ps'), always=True,
+                     log_file=build_dir / 'build.log')
+        stamp.write_text(key)
+    except BaseException as e: # simulator errors end up as SystemExit
+        err = f'{type(e).__name__}: {e}'
+    wall = time.monotonic() - t_start
+    return {'wrapper': wrapper, 'dir': build_dir, 'cached': False, 'wall': wall, 'err': err}
+
+
+def sim_test(sim, test_case, wrapper, build_dir, work, wave, plusargs=(), probe=False, coverage=False):
+    from cocotb_tools.runner import get_runner
+
+    extra_env = {}
+    if wave['format'] == 'fst' and sim == 'icarus':
+        extra_env['IVERILOG_DUMPER'] = 'fst'
+    try:
+        runner = get_runner(sim)
+        modules = ['pycdbus.sim.bench_probe'] if probe else []
+        modules += ['pycdbus.sim.coverage'] if coverage else []
+        runner.test(test_module=modules + [test_case], hdl_toplevel=wrapper, hdl_toplevel_lang='verilog',
+                    build_dir=build_dir, test_dir=work, waves=False, plusargs=list(plusargs), extra_env=extra_env,
+                    results_xml=str(work / 'results.xml'), log_file=work / 'sim.log')
+    except BaseException as e:
+        return f'{type(e).__name__}: {e}'
+    return None
+
+
+def sim_time_ns(results_xml):
+    """End of the simulation in ns from the cocotb results, None if not found."""
+    scale = {'ps': 1e-3, 'ns': 1, 'us': 1e3, 'ms': 1e6, 's': 1e9}
+    try:
+        stop = None
+        for case in ET.parse(results_xml).iter('testcase'):
+            props = {p.get('name'): p.get('value') for p in case.iter('property')}
+            if 'sim_time_stop' in props:
+                t = float(props['sim_time_stop']) * scale[props.get('sim_time_unit', 'ns')]
+                stop = t if stop is None else max(stop, t)
+        return stop
+    except (OSError, ET.ParseError, ValueError, KeyError):
+        return None
+
+def trigger_time(work, wave, ok):
+    """Time of the trigger in ns, from the log or results of the first run."""
+    if wave['trigger'] == 'fail':
+        return None if ok else sim_time_ns(work / 'results.xml')
+    m = re.search(r'cd_dump: trigger at (\d+) ns', (work / 'sim.log').read_text(errors='replace'))
+    return int(m.group(1)) if m else None
+
+
+def run_one(suite_name, test_case, sim, out_root, build_dir, wave=WAVE_OFF, probe=False, wrapper=None,
+            coverage=False):
+    suite = SUITES[suite_name]
+    wrapper = wrapper or suite['wrapper'](test_case)
+    work = out_root / test_case
+    shutil.rmtree(work, ignore_errors=True)
+    work.mkdir(parents=True)
+    for path in (ROOT, suite['dir']): # for "from common import *" and pycdbus, own suite first
+        if str(path) in sys.path:
+            sys.path.remove(str(path))
+        sys.path.insert(0, str(path))
+
+    t_start = time.monotonic()
+    err = sim_test(sim, test_case, wrapper, build_dir, work, wave, ['+dump_off'] if wave['trigger'] else [], probe,
+                   coverage)
+    wall = time.monotonic() - t_start
+    ok = (work / '.exit_ok').is_file()
+
+    wave_path = None
+    if wave['format'] != 'off':
+        name = wave_file(suite, wave)
+        if wave['trigger']:
+            t = trigger_time(work, wave, ok)
+            if t is not None:
+                # same test again, it is deterministic, dump the window only
+                rerun = work / 'wave'
+                rerun.mkdir()
+                plusargs = [f"+dump_from={max(0, int(t - wave['pre'] * 1000))}",
+                            f"+dump_to={int(t + wave['post'] * 1000)}"]
+                sim_test(sim, test_case, wrapper, build_dir, rerun, wave, plusargs)
+                if (rerun / name).is_file():
+                    shutil.move(rerun / name, work / name)
+        if (work / name).is_file():
+            wave_path = str(work / name)
+
+    return {'test': test_case, 'wrapper': wrapper, 'ok': ok, 'wall': wall, 'err': err, 'work': str(work),
+            'wave': wave_path}
+
+
+def load_durations(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def save_durations(path, durations):
+    with open(path, 'w') as f:
+        json.dump(durations, f, indent=2, sort_keys=True)
+
+
+def collect_tests(suite, names):
+    if not names:
+        return sorted(p.stem for p in suite['dir'].glob('test_*.py'))
+    return [Path(n).stem for n in names]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='run cocotb tests in parallel')
+    parser.add_argument('tests', nargs='*', help='test files, default: all test_*.py')
+    parser.add_argument('--suite', choices=SUITES.keys(), default='tests')
+    parser.add_argument('--sim', choices=['icarus', 'verilator'], default=os.environ.get('SIM', 'icarus'))
+    parser.add_argument('--threads', type=int, default=1, help='verilator model threads per test')
+    parser.add_argument('-j', '--jobs', type=int, help='default: cpu count / threads')
+    parser.add_argument('--out', help='output folder, default: <suite>/sim_out')
+    parser.add_argument('--rebuild', action='store_true', help='ignore the build cache')
+    parser.add_argument('--wave', choices=['off', 'vcd', 'fst'], default='off', help='waveform format, default: off')
+    parser.add_argument('--wave-scope', help='only dump these instances of the wrapper, e.g. cdbus_m1,cdbus_m2.cd_rx_ram_m')
+    parser.add_argument('--wave-trigger', help='"fail" or a signal of the wrapper, e.g. irq1, cdbus_m0.tx_err')
+    parser.add_argument('--wave-pre', type=float, default=100, help='us dumped before the trigger, default: 100')
+    parser.add_argument('--wave-post', type=float, default=10, help='us dumped after the trigger, default: 10')
+    parser.add_argument('--wrapper', help='run all tests on this wrapper, e.g. cdbus_wrapper_n32 (see gen_wrapper.py)')
+    parser.add_argument('--coverage', action='store_true', help='collect the functional coverage, see coverage_report.py')
+    args = parser.parse_args()
+    if args.wave == 'off' and (args.wave_scope or args.wave_trigger):
+        parser.error('--wave-scope and --wave-trigger need --wave vcd or fst')
+    wave = {'format': args.wave, 'scope': args.wave_scope.split(',') if args.wave_scope else [],
+            'trigger': args.wave_trigger, 'pre': args.wave_pre, 'post': args.wave_post}
+
+    suite = SUITES[args.suite]
+    if not args.jobs:
+        args.jobs = max(1, os.cpu_count() // args.threads)
+    out_root = Path(args.out).resolve() if args.out else suite['dir'] / 'sim_out'
+    out_root.mkdir(parents=True, exist_ok=True)
+    tests = collect_tests(suite, args.tests)
+    wrapper_of = (lambda t: args.wrapper) if args.wrapper else suite['wrapper']
+
+    # longest first, so the slowest test is not the last one to start
+    durations = load_durations(out_root / 'durations.json')
+    tests.sort(key=lambda t: durations.get(t, float('inf')), reverse=True)
+
+    print(f'Run {len(tests)} tests with {args.sim}, {args.jobs} jobs, output: {out_root}\n')
+    t_start = time.monotonic()
+    results = []
+    with ProcessPoolExecutor(max_workers=args.jobs) as pool:
+        wrappers = sorted(set(wrapper_of(t) for t in tests))
+        builds = {}
+        futures = [pool.submit(build_one, args.suite, w, args.sim, out_root / 'cache',
+                               args.threads, args.rebuild, wave) for w in wrappers]
+        for future in as_completed(futures):
+            ret = future.result()
+            builds[ret['wrapper']] = ret
+            state = 'cached' if ret['cached'] else f"{ret['wall']:.2f} s"
+            print(f"{'build' if not ret['err'] else 'FAIL '} {ret['wrapper']:<57} {state:>10}")
+            if ret['err']:
+                print(f"Error: build {ret['wrapper']}, see {ret['dir'] / 'build.log'}, {ret['err']}")
+        print()
+
+        futures = [pool.submit(run_one, args.suite, t, args.sim, out_root, builds[wrapper_of(t)]['dir'], wave,
+                               wrapper=wrapper_of(t), coverage=args.coverage)
+                   for t in tests if not builds[wrapper_of(t)]['err']]
+        for future in as_completed(futures):
+            ret = future.result()
+            results.append(ret)
+            print(f"{'pass' if ret['ok'] else 'FAIL'}  {ret['test']:<32} {ret['wrapper']:<24} {ret['wall']:8.2f} s")
+            if ret['wave']:
+                print(f"      wave: {ret['wave']}")
+            if ret['ok']:
+                durations[ret['test']] = round(ret['wall'], 3)
+    wall = time.monotonic() - t_start
+    save_durations(out_root / 'durations.json', durations)
+
+    if args.coverage:
+        paths = [Path(r['work']) / 'coverage.json' for r in results]
+        cov = coverage_report.load([p for p in paths if p.is_file()])
+        with open(out_root / 'coverage.json', 'w') as f:
+            json.dump(cov, f, indent=1)
+        print('\nCoverage: ' + str(out_root / 'coverage.json'))
+        print('\n'.join(coverage_report.report(cov)))
+
+    failed = [r for r in results if not r['ok']]
+    serial = sum(r['wall'] for r in results)
+    print(f'\nWall time: {wall:.2f} s (serial sum: {serial:.2f} s)')
+    if failed or len(results) != len(tests):
+        for r in failed:
+            print(f"Error: {r['test']}, see {r['work']}" + (f", {r['err']}" if r['err'] else ''))
+        return 1
+    print('Pass all.')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+#
+# This Source Code Form is subject to the terms of the Mozilla
+# Public License, v. 2.0. If a copy of the MPL was not distributed
+# with this file, You can obtain one at https://mozilla.org/MPL/2.0/.
+# Notice: The scope granted to MPL excludes the ASIC industry.
+#
+# Copyright (c) 2017 DUKELEC, All rights reserved.
+#
+# Author: Duke Fong <d@d-l.io>
+#
+
+"""RX buffer capacity planner.
+
+Run the cd_rx_ram allocator model (pycdbus.rx_ram) with random traffic for
+some I_WIDTH / B_WIDTH candidates and print the RX lost probability and the
+fragmentation of each.
+
+Sizes are user data lengths (0 ~ 253): a list "8,32,253", a range "0-253",
+or both "8,100-120". Repeat a size to give it more weight.
+
+Usage:
+  ./rx_ram_plan.py --sizes 0-253 --rate 2000 --drain 500e-6
+  ./rx_ram_plan.py --sizes 8,8,8,253 --rate 5000 --drain 200e-6 --widths 6:11,7:12 --bit-rate 1e6
+"""
+
+import sys, argparse
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from pycdbus.rx_ram import plan
+
+DFT_WIDTHS = '5:10,6:10,5:11,6:11,7:11,6:12,7:12,8:12'
+
+
+def parse_sizes(s):
+    sizes = []
+    for item in s.split(','):
+        if '-' in item:
+            lo, hi = item.split('-')
+            sizes += range(int(lo), int(hi) + 1)
+        else:
+            sizes.append(int(item))
+    for size in sizes:
+        if not 0 <= size <= 253:
+            raise argparse.ArgumentTypeError(f'size out of range: {size}')
+    return sizes
+
+def parse_widths(s):
+    widths = []
+    for item in s.split(','):
+        i_width, b_width = map(int, item.split(':'))
+        if not 0 < b_width - i_width <= 8 or b_width < 8:
+            raise argparse.ArgumentTypeError(f'bad I_WIDTH:B_WIDTH: {item}')
+        widths.append((i_width, b_width))
+    return widths
+
+
+def main():
+    parser = argparse.ArgumentParser(description='rx buffer capacity planner')
+    parser.add_argument('--sizes', type=parse_sizes, default='0-253', help='user data lengths, default: 0-253')
+    parser.add_argument('--rate', type=float, required=True, help='average frames per second')
+    parser.add_argument('--drain', type=float, required=True, help='host time to read one frame, in seconds')
+    parser.add_argument('--bit-rate', type=float, help='bus bit rate, frames do not overlap if set')
+    parser.add_argument('--widths', type=parse_widths, default=DFT_WIDTHS, help=f'I_WIDTH:B_WIDTH list, default: {DFT_WIDTHS}')
+    parser.add_argument('--frames', type=int, default=100000)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    print(f'{len(args.sizes)} sizes, rate {args.rate:g}/s, drain {args.drain * 1e6:g} us, {args.frames} frames\n')
+    print('I_WIDTH B_WIDTH  bytes  frag     lost  int-frag  occ(mean)  occ(peak)')
+    for i_width, b_width in args.widths:
+        r = plan(i_width, b_width, args.sizes, args.rate, args.drain, args.frames, args.bit_rate, args.seed)
+        print(f"{i_width:7} {b_width:7} {1 << b_width:6} {1 << (b_width - i_width):5} "
+              f"{r['p_lost']:8.2%} {r['internal_frag']:9.1%} "
+              f"{r['mean_occupancy']:10.1%} {r['peak_occupancy']:10.1%}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,493 @@
+#!/usr/bin/env python3
+#
+# This Source Code Form is subject to the terms of the Mozilla
+# Public License, v. 2.0. If a copy of the MPL was not distributed
+# with this file, You can obtain one at https://mozilla.org/MPL/2.0/.
+# Notice: The scope granted to MPL excludes the ASIC industry.
+#
+# Copyright (c) 2017 DUKELEC, All rights reserved.
+#
+# Author: Duke Fong <d@d-l.io>
+#
+
+"""CDBUS protocol analyzer of a waveform dump (run_tests.py --wave vcd|fst).
+
+The frames of the bus line (bus_a, or --line) are decoded as cd_rx_des does
+(pycdbus/decode.py) and listed with their time, duration, gap to the previous
+frame, kind (ok, crc, short, error, break), header, the node sending it and
+the nodes losing the arbitration to it, then the timing statistics.
+
+The nodes are the outermost scopes with rx, tx and tx_en (cdbus_m0 ...).
+The bit times follow div_ls / div_hs / idle_wait_len of the first node (or
+--ref) as they change in the dump, its clock period comes from its clk,
+--div and --sys-clk override them. tx_en of the nodes tells who sent a frame
+and who lost the arbitration: a node driving the line during the first byte
+but not after it. --rx also decodes the rx line of each node with its own
+timing and counts what each received.
+
+A VCD file is mapped and scanned by one regex matching only the value
+changes of the signals used, the rest of the dump is skipped at memory
+speed, the memory used does not depend on the dump size. A FST file (or
+- for stdin) is converted by fst2vcd of GTKWave through a pipe, in chunks.
+
+Usage:
+  ./wave_analyzer.py ../tests/sim_out/test_xxx/cdbus.vcd
+  ./wave_analyzer.py cdbus.vcd --kind crc,error,short --rx
+  ./wave_analyzer.py cdbus.fst --line cdbus_wrapper_dft.tx0 --div 39:2 --sys-clk 40e6
+"""
+
+import re, sys, json, mmap, time, shutil, signal, argparse, subprocess
+from collections import deque, Counter
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from pycdbus.decode import LineDecoder, KINDS
+
+try:
+    import numpy as np
+    _SCALAR = np.zeros(256, dtype=bool)
+    _SCALAR[list(b'01xzXZ')] = True
+except ImportError: # the regex scan only
+    np = None
+
+TIME_UNITS = {'s': 10**12, 'ms': 10**9, 'us': 10**6, 'ns': 10**3, 'ps': 1, 'fs': 10**-3}
+CHUNK = 1 << 24
+WINDOW = 1 << 19 # bytes of the numpy scan, its temporaries stay in the cache
+DFT_DIV = 346
+DFT_SYS_CLK = 40e6
+
+
+def parse_header(text):
+    """Timescale in ps and {path: id} of a VCD header."""
+    scale = 1
+    path = []
+    ids = {}
+    tok = iter(text.split())
+    for t in tok:
+        if t == '$timescale':
+            s = ''
+            for t in tok:
+                if t == '$end':
+                    break
+                s += t
+            m = re.fullmatch(r'(\d+)([a-z]+)', s)
+            scale = int(m[1]) * TIME_UNITS[m[2]]
+        elif t == '$scope':
+            next(tok)
+            path.append(next(tok))
+        elif t == '$upscope':
+            path.pop()
+        elif t == '$var':
+            next(tok), next(tok)
+            id_, name = next(tok), next(tok)
+            ids['.'.join(path + [name])] = id_
+    return scale, ids
+
+
+def find_var(ids, scope, name):
+    """The path of name in scope or below, the least deep one."""
+    paths = [p for p in ids if p.startswith(scope + '.') and p.rpartition('.')[2] == name]
+    return min(paths, key=lambda p: (p.count('.'), p), default=None)
+
+
+def find_nodes(ids):
+    scopes = sorted({p.rpartition('.')[0] for p in ids if p.endswith('.tx_en')},
+                    key=lambda s: [int(x) if x.isdigit() else x for x in re.split(r'(\d+)', s)])
+    nodes = [s for s in scopes if f'{s}.rx' in ids and f'{s}.tx' in ids]
+    return [s for s in nodes if not any(s.startswith(o + '.') for o in nodes)]
+
+
+def vec_value(bits):
+    try:
+        return int(bits, 2)
+    except ValueError: # x / z
+        return None
+
+
+def _pack(a, base, n):
+    """The n bytes of a at each of base as little endian uint64."""
+    if n == 1:
+        return a[base]
+    key = np.zeros(len(base), dtype=np.uint64)
+    for i in range(n):
+        key |= a[base + i].astype(np.uint64) << np.uint64(8 * i)
+    return key
+
+
+class Node:
+    """The timing of a node and its tx_en intervals."""
+
+    def __init__(self, name, args):
+        self.name = name
+        self.clk_period = 1e12 / (args.sys_clk or DFT_SYS_CLK)
+        self.div_ls, self.div_hs = args.div or (DFT_DIV, DFT_DIV)
+        self.idle_wait = args.idle_wait
+        self.decoders = []
+        self.rise = None # tx_en high since
+        self.tx_en = deque(maxlen=256) # (rise, fall)
+        self.stat = {'tx': 0, 'lost': 0, 'rx': Counter()}
+
+    def rates(self):
+        return (self.div_ls + 1) * self.clk_period, (self.div_hs + 1) * self.clk_period, self.idle_wait
+
+    def update(self):
+        for dec in self.decoders:
+            dec.set_rate(*self.rates())
+
+    def set(self, key, value):
+        if value is not None and value != getattr(self, key):
+            setattr(self, key, value)
+            self.update()
+
+    def on_tx_en(self, t, level):
+        if level:
+            if self.rise is None:
+                self.rise = t
+        elif self.rise is not None:
+            self.tx_en.append((self.rise, t))
+            self.rise = None
+
+    def active(self, a, b):
+        """tx_en high at some time in [a, b)."""
+        if self.rise is not None and self.rise < b:
+            return True
+        return any(r < b and f > a for r, f in self.tx_en)
+
+    def prune(self, t):
+        while self.tx_en and self.tx_en[0][1] < t:
+            self.tx_en.popleft()
+
+
+class Analyzer:
+    def __init__(self, ids, scale, args, out=sys.stdout):
+        self.scale = scale
+        self.args = args
+        self.out = out
+        self.handlers = {}
+        self.t = 0
+        self.nodes = []
+        for path in find_nodes(ids):
+            node = Node(path.rpartition('.')[2], args)
+            self.nodes.append(node)
+            self.sub(ids[f'{path}.tx_en'], node.on_tx_en)
+            for key in ('div_ls', 'div_hs', 'idle_wait_len'):
+                p = find_var(ids, path, key)
+                if p and not (args.div and key != 'idle_wait_len'):
+                    attr = 'idle_wait' if key == 'idle_wait_len' else key
+                    self.sub(ids[p], lambda t, v, node=node, attr=attr: node.set(attr, v), vec=True)
+            clk = find_var(ids, path, 'clk')
+            if clk and not args.sys_clk:
+                self._clock(ids[clk], node)
+            if args.rx:
+                dec = LineDecoder(*node.rates(), on_frame=lambda f, node=node: node.stat['rx'].update([f.kind]))
+                node.decoders.append(dec)
+                self.sub(ids[f'{path}.rx'], dec.edge)
+        if len({n.name for n in self.nodes}) < len(self.nodes):
+            for node, path in zip(self.nodes, find_nodes(ids)):
+                node.name = path
+
+        if args.line:
+            line = args.line if args.line in ids else None
+        else:
+            line = min((p for p in ids if p.rpartition('.')[2] == 'bus_a'),
+                       key=lambda p: (p.count('.'), p), default=None)
+        if not line:
+            sys.exit(f'Error: line {args.line or "bus_a"} not found in the dump')
+        self.line = line
+        ref = next((n for n in self.nodes if n.name == args.ref), None) if args.ref else \
+              (self.nodes[0] if self.nodes else None)
+        if args.ref and not ref:
+            sys.exit(f'Error: node {args.ref} not found, nodes: {", ".join(n.name for n in self.nodes)}')
+        if not ref:
+            ref = Node('-', args)
+        self.ref = ref
+        self.bus = LineDecoder(*ref.rates(), on_frame=self.on_frame)
+        ref.decoders.append(self.bus)
+        self.sub(ids[line], self.bus.edge)
+
+        self.kinds = set(args.kind.split(',')) if args.kind else None
+        self.count = Counter()
+        self.collisions = 0
+        self.first = self.last = None
+        self.busy = 0
+        self.gap = [None, 0, 0, 0] # min, max, sum, n
+        self.dur = [None, 0, 0, 0]
+        if not args.quiet:
+            print(f"{'time_us':>12} {'dur_us':>9} {'gap_us':>9}  {'kind':<5} {'len':>3} {'src':>4} {'dst':>4}"
+                  f"  {'tx':<10} {'lost':<10} data", file=out)
+
+    def sub(self, id_, handler, vec=False):
+        id_ = id_.encode()
+        self.handlers[id_] = self.handlers.get(id_, ()) + ((handler, vec),)
+        self.changed = True
+
+    def unsub(self, id_, handler):
+        id_ = id_.encode()
+        hs = tuple(h for h in self.handlers[id_] if h[0] != handler)
+        if hs:
+            self.handlers[id_] = hs
+        else:
+            del self.handlers[id_]
+        self.changed = True
+
+    def _clock(self, id_, node):
+        rises = []
+        def on_clk(t, level):
+            if level:
+                rises.append(t)
+            if len(rises) == 2:
+                node.set('clk_period', rises[1] - rises[0])
+                self.unsub(id_, on_clk)
+        self.sub(id_, on_clk)
+
+    def pattern(self):
+        ids = sorted(self.handlers, key=len, reverse=True)
+        return re.compile(rb'\n(?:b([01xzXZ]+) |([01xzXZ]))(' + b'|'.join(map(re.escape, ids)) + rb')(?=\s)')
+
+    def _time(self, buf, start, end):
+        i = buf.rfind(b'\n#', start, end)
+        if i >= 0:
+            self.t = int(buf[i + 2:buf.find(b'\n', i + 2)]) * self.scale
+
+    def _change(self, vec, bit, id_):
+        for handler, is_vec in self.handlers.get(id_, ()):
+            if is_vec:
+                handler(self.t, vec_value(vec) if vec else vec_value(bit))
+            else:
+                handler(self.t, bit != b'0' if bit else vec_value(vec) != 0)
+
+    def scan(self, buf, pos, end):
+        """The value changes in buf[pos:end], from a \\n to the end of a line."""
+        if np is not None and max(map(len, self.handlers)) <= 8:
+            return self._scan_np(buf, pos, end)
+        while True:
+            self.changed = False
+            last = pos
+            for m in self.pattern().finditer(buf, pos, end):
+                p = m.start()
+                self._time(buf, last, p)
+                last = p
+                self._change(*m.groups())
+                if self.changed:
+                    pos = m.end()
+                    break
+            else:
+                self._time(buf, last, end)
+                return
+
+    def _keys(self):
+        """The last bytes of the ids and {id length: the ids packed into uint64}."""
+        keys = {}
+        for id_ in self.handlers:
+            keys.setdefault(len(id_), []).append(int.from_bytes(id_, 'little'))
+        return sorted({id_[-1] for id_ in self.handlers}), \
+               {n: np.array(k, dtype=np.uint64) for n, k in keys.items()}
+
+    def _scan_np(self, buf, pos, end):
+        """As scan(), numpy finds the lines of the ids a window at a time: the
+        bytes before a \\n equal to the last byte of an id, then the ids ending
+        there, after a value (scalar) or a space (vector)."""
+        keys = None
+        last = pos
+        while pos < end - 1:
+            nl_end = buf.rfind(b'\n', pos + 1, min(pos + WINDOW, end))
+            if nl_end < 0:
+                nl_end = end - 1
+            if keys is None or self.changed:
+                (lasts, keys), self.changed = self._keys(), False
+            a = np.frombuffer(buf, np.uint8, nl_end + 1 - pos, pos)
+            body = a[:-1]
+            hit = body == lasts[0]
+            for c in lasts[1:]:
+                hit |= body == c
+            hit &= a[1:] == 10
+            cand = np.flatnonzero(hit)
+            found = []
+            for n, k in keys.items():
+                c = cand[cand > n]
+                c = c[np.isin(_pack(a, c - n + 1, n), k)]
+                sep = a[c - n]
+                found.append(c[(_SCALAR[sep] & (a[c - n - 1] == 10)) | (sep == 32)])
+            for p in np.sort(np.concatenate(found)).tolist() if found else ():
+                p += pos + 1 # end of the line
+                i = buf.rfind(b'\n', pos, p)
+                self._time(buf, last, i + 1)
+                last = i
+                if buf[i + 1] == 98: # b
+                    vec, id_ = buf[i + 2:p].split(b' ', 1)
+                    self._change(vec, None, id_)
+                elif buf[i + 1] in b'01xzXZ':
+                    self._change(None, buf[i + 1:i + 2], buf[i + 2:p])
+            pos = nl_end
+        self._time(buf, last, end)
+
+    def on_frame(self, f):
+        nodes = self.nodes
+        bit = self.bus.bit_ls
+        fb_end = f.start + 10 * bit # end of the arbitration byte
+        if f.kind == 'break' or f.end <= fb_end:
+            tx, lost = [n for n in nodes if n.active(f.start, f.end)], []
+        else:
+            tx = [n for n in nodes if n.active(fb_end, f.end)]
+            lost = [n for n in nodes if n not in tx and n.active(f.start - bit / 2, fb_end)]
+        for n in nodes:
+            n.prune(f.start - bit)
+        for n in tx:
+            n.stat['tx'] += 1
+        for n in lost:
+            n.stat['lost'] += 1
+        self.collisions += len(tx) > 1 and f.kind != 'break' # a break may be sent by many at once
+
+        self.count[f.kind] += 1
+        if self.first is None:
+            self.first = f.start
+        self.last = f.end
+        self.busy += f.end - f.start
+        for acc, v in ((self.gap, f.gap), (self.dur, f.end - f.start)):
+            if v is not None:
+                acc[0] = v if acc[0] is None else min(acc[0], v)
+                acc[1] = max(acc[1], v)
+                acc[2] += v
+                acc[3] += 1
+
+        if self.args.quiet or (self.kinds and f.kind not in self.kinds):
+            return
+        data = f.data
+        hdr = (f'{data[2]:>3} {data[0]:>4x} {data[1]:>4x}' if len(data) >= 3 else f"{'-':>3} {'-':>4} {'-':>4}")
+        shown = data if self.args.data or len(data) <= 16 else data[:16]
+        gap = '' if f.gap is None else f'{f.gap / 1e6:9.3f}'
+        print(f'{f.start / 1e6:12.3f} {(f.end - f.start) / 1e6:9.3f} {gap:>9}  {f.kind:<5} {hdr}'
+              f"  {','.join(n.name for n in tx) or '-':<10} {','.join(n.name for n in lost) or '-':<10} "
+              f"{shown.hex()}{'..' if len(shown) < len(data) else ''}", file=self.out)
+
+    def finish(self):
+        for dec in [self.bus] + [d for n in self.nodes for d in n.decoders if d is not self.bus]:
+            dec.finish(self.t)
+
+    def stats(self):
+        def us(acc):
+            if not acc[3]:
+                return None
+            return {'min': acc[0] / 1e6, 'avg': acc[2] / acc[3] / 1e6, 'max': acc[1] / 1e6}
+        span = (self.last - self.first) if self.first is not None else 0
+        bit_ls, bit_hs, idle_wait = self.ref.rates()
+        return {
+            'line': self.line,
+            'end_us': self.t / 1e6,
+            'bit_ls_ns': bit_ls / 1e3, 'bit_hs_ns': bit_hs / 1e3, 'idle_wait': idle_wait,
+            'frames': {k: self.count[k] for k in KINDS},
+            'collisions': self.collisions,
+            'arbitration_lost': sum(n.stat['lost'] for n in self.nodes),
+            'gap_us': us(self.gap),
+            'duration_us': us(self.dur),
+            'span_us': span / 1e6,
+            'utilization': self.busy / span if span else 0,
+            'frames_per_s': self.count['ok'] * 1e12 / span if span else 0,
+            'nodes': {n.name: {'tx': n.stat['tx'], 'lost': n.stat['lost'],
+                               **({'rx': {k: n.stat['rx'][k] for k in KINDS}} if self.args.rx else {})}
+                      for n in self.nodes}
+        }
+
+
+def print_stats(s, out=sys.stdout):
+    print(f"\nline {s['line']}, bit_ls {s['bit_ls_ns']:.1f} ns, bit_hs {s['bit_hs_ns']:.1f} ns, "
+          f"idle wait {s['idle_wait']} bits, dump end {s['end_us']:.3f} us", file=out)
+    print('frames: ' + ', '.join(f'{k} {n}' for k, n in s['frames'].items()) +
+          f", collisions {s['collisions']}, arbitration lost {s['arbitration_lost']}", file=out)
+    for key in ('gap_us', 'duration_us'):
+        v = s[key]
+        if v:
+            print(f"{key[:-3] + ':':<10} min {v['min']:.3f} us, avg {v['avg']:.3f} us, max {v['max']:.3f} us", file=out)
+    print(f"bus busy {s['utilization']:.1%} of {s['span_us']:.3f} us, {s['frames_per_s']:.0f} ok frames/s", file=out)
+    for name, n in s['nodes'].items():
+        rx = ', rx: ' + (', '.join(f'{k} {c}' for k, c in n['rx'].items() if c) or '-') if 'rx' in n else ''
+        print(f"  {name:<12} tx {n['tx']}, lost {n['lost']}{rx}", file=out)
+
+
+def read_header(read):
+    """(header text, rest of the data) of a stream."""
+    buf = b''
+    while True:
+        i = buf.find(b'$enddefinitions')
+        j = buf.find(b'$end', i + 15) if i >= 0 else -1
+        if j >= 0:
+            return buf[:i].decode(errors='replace'), buf[j + 4:]
+        data = read(CHUNK)
+        if not data:
+            sys.exit('Error: no $enddefinitions in the dump')
+        buf += data
+
+
+def analyze_stream(f, args):
+    header, buf = read_header(f.read)
+    ana = Analyzer(*reversed(parse_header(header)), args)
+    size = len(header) + len(buf)
+    buf = b'\n' + buf
+    while True:
+        data = f.read(CHUNK)
+        buf += data
+        size += len(data)
+        end = buf.rfind(b'\n') + 1 if data else len(buf)
+        ana.scan(buf, 0, end)
+        if not data:
+            break
+        buf = buf[end - 1:]
+    return ana, size
+
+
+def analyze_file(path, args):
+    with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+        if hasattr(buf, 'madvise'):
+            buf.madvise(mmap.MADV_SEQUENTIAL)
+        i = buf.find(b'$enddefinitions')
+        j = buf.find(b'$end', i + 15) if i >= 0 else -1
+        if j < 0:
+            sys.exit('Error: no $enddefinitions in the dump')
+        ana = Analyzer(*reversed(parse_header(buf[:i].decode(errors='replace'))), args)
+        ana.scan(buf, j + 4, len(buf)) # from the \n before the first line
+        return ana, len(buf)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='decode the CDBUS frames of a VCD / FST dump')
+    parser.add_argument('dump', help='.vcd, .fst or - (VCD on stdin)')
+    parser.add_argument('--line', help='the line to decode, default: the least deep bus_a')
+    parser.add_argument('--ref', help='the node giving the bit times of the line, default: the first')
+    parser.add_argument('--div', type=lambda s: tuple(map(int, s.split(':'))), help='DIV_LS:DIV_HS, default: from the dump')
+    parser.add_argument('--sys-clk', type=float, help='Hz, default: from the clk of the nodes')
+    parser.add_argument('--idle-wait', type=int, default=10, help='bits, default: 10 or from the dump')
+    parser.add_argument('--rx', action='store_true', help='also decode the rx line of each node')
+    parser.add_argument('--kind', help='only list these kinds, e.g. crc,error,short')
+    parser.add_argument('--data', action='store_true', help='list all bytes of the frames')
+    parser.add_argument('-q', '--quiet', action='store_true', help='statistics only')
+    parser.add_argument('--json', help='also write the statistics to this file')
+    args = parser.parse_args()
+    if hasattr(signal, 'SIGPIPE'):
+        signal.signal(signal.SIGPIPE, signal.SIG_DFL) # e.g. | head
+
+    t0 = time.time()
+    if args.dump == '-':
+        ana, size = analyze_stream(sys.stdin.buffer, args)
+    elif args.dump.endswith('.fst'):
+        if not shutil.which('fst2vcd'):
+            sys.exit('Error: fst2vcd (GTKWave) not found, needed for .fst')
+        with subprocess.Popen(['fst2vcd', args.dump], stdout=subprocess.PIPE) as p:
+            ana, size = analyze_stream(p.stdout, args)
+    else:
+        ana, size = analyze_file(args.dump, args)
+    ana.finish()
+    wall = time.time() - t0
+
+    s = ana.stats()
+    print_stats(s)
+    if not any(s['frames'].values()) and len(ana.nodes) > 1:
+        print(f'no frame on {ana.line}, the nodes may be full duplex: --line <the tx of a node>')
+    print(f'scanned {size / 1e6:.1f} MB in {wall:.2f} s ({size / 1e6 / max(wall, 1e-6):.0f} MB/s)', file=sys.stderr)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(s, f, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())